@@ -13,7 +13,7 @@ import os
 
 from agentpress.thread_manager import ThreadManager
 from services.supabase import DBConnection
-from services import redis
+from services import account_runs, active_runs, redis
 from utils.auth_utils import get_current_user_id_from_jwt, get_optional_user_id_from_jwt, get_user_id_from_stream_auth, verify_thread_access, verify_admin_api_key
 from utils.logger import logger, structlog
 from services.billing import check_billing_status, can_use_model
@@ -208,17 +208,11 @@ async def cleanup():
     # Use the instance_id to find and clean up this instance's keys
     try:
         if instance_id: # Ensure instance_id is set
-            running_keys = await redis.keys(f"active_run:{instance_id}:*")
-            logger.info(f"Found {len(running_keys)} running agent runs for instance {instance_id} to clean up")
-
-            for key in running_keys:
-                # Key format: active_run:{instance_id}:{agent_run_id}
-                parts = key.split(":")
-                if len(parts) == 3:
-                    agent_run_id = parts[2]
-                    await stop_agent_run(agent_run_id, error_message=f"Instance {instance_id} shutting down")
-                else:
-                    logger.warning(f"Unexpected key format found: {key}")
+            running_run_ids = await active_runs.runs_for_instance(instance_id)
+            logger.info(f"Found {len(running_run_ids)} running agent runs for instance {instance_id} to clean up")
+
+            for agent_run_id in running_run_ids:
+                await stop_agent_run(agent_run_id, error_message=f"Instance {instance_id} shutting down")
         else:
             logger.warning("Instance ID not set, cannot clean up instance-specific agent runs.")
 
@@ -229,6 +223,13 @@ async def cleanup():
     await redis.close()
     logger.info("Completed cleanup of agent API resources")
 
+async def _release_run_slot(agent_run_id: str):
+    """Give back the parallel run slot reserved for a run that is not started after all."""
+    try:
+        await account_runs.release(agent_run_id)
+    except Exception as e:
+        logger.warning(f"Failed to release run slot for {agent_run_id}: {str(e)}")
+
 async def stop_agent_run(agent_run_id: str, error_message: Optional[str] = None):
     """Update database and publish stop signal to Redis."""
     logger.info(f"Stopping agent run: {agent_run_id}")
@@ -265,22 +266,16 @@ async def stop_agent_run(agent_run_id: str, error_message: Optional[str] = None)
 
     # Find all instances handling this agent run and send STOP to instance-specific channels
     try:
-        instance_keys = await redis.keys(f"active_run:*:{agent_run_id}")
-        logger.debug(f"Found {len(instance_keys)} active instance keys for agent run {agent_run_id}")
-
-        for key in instance_keys:
-            # Key format: active_run:{instance_id}:{agent_run_id}
-            parts = key.split(":")
-            if len(parts) == 3:
-                instance_id_from_key = parts[1]
-                instance_control_channel = f"agent_run:{agent_run_id}:control:{instance_id_from_key}"
-                try:
-                    await redis.publish(instance_control_channel, "STOP")
-                    logger.debug(f"Published STOP signal to instance channel {instance_control_channel}")
-                except Exception as e:
-                    logger.warning(f"Failed to publish STOP signal to instance channel {instance_control_channel}: {str(e)}")
-            else:
-                 logger.warning(f"Unexpected key format found: {key}")
+        instance_ids = await active_runs.instances_for_run(agent_run_id)
+        logger.debug(f"Found {len(instance_ids)} active instances for agent run {agent_run_id}")
+
+        for instance_id_from_key in instance_ids:
+            instance_control_channel = f"agent_run:{agent_run_id}:control:{instance_id_from_key}"
+            try:
+                await redis.publish(instance_control_channel, "STOP")
+                logger.debug(f"Published STOP signal to instance channel {instance_control_channel}")
+            except Exception as e:
+                logger.warning(f"Failed to publish STOP signal to instance channel {instance_control_channel}: {str(e)}")
 
         # Clean up the response list immediately on stop/fail
         await _cleanup_redis_response_list(agent_run_id)
@@ -467,21 +462,30 @@ async def start_agent(
         logger.info(f"[AGENT LOAD] Agent config keys: {list(agent_config.keys())}")
         logger.info(f"Using agent {agent_config['agent_id']} for this agent run (thread remains agent-agnostic)")
 
-    # Run all checks concurrently
+    # Run all checks concurrently; the limit check reserves a slot for the new run
+    agent_run_id = str(uuid.uuid4())
     model_check_task = asyncio.create_task(can_use_model(client, account_id, model_name))
     billing_check_task = asyncio.create_task(check_billing_status(client, account_id))
-    limit_check_task = asyncio.create_task(check_agent_run_limit(client, account_id))
+    limit_check_task = asyncio.create_task(check_agent_run_limit(client, account_id, agent_run_id))
 
     # Wait for all checks to complete
-    (can_use, model_message, allowed_models), (can_run, message, subscription), limit_check = await asyncio.gather(
-        model_check_task, billing_check_task, limit_check_task
-    )
+    try:
+        (can_use, model_message, allowed_models), (can_run, message, subscription), limit_check = await asyncio.gather(
+            model_check_task, billing_check_task, limit_check_task
+        )
+    except BaseException:
+        # Another check failed; let the limit task finish so a slot it reserves is released
+        await asyncio.gather(limit_check_task, return_exceptions=True)
+        await _release_run_slot(agent_run_id)
+        raise
 
     # Check results and raise appropriate errors
     if not can_use:
+        await _release_run_slot(agent_run_id)
         raise HTTPException(status_code=403, detail={"message": model_message, "allowed_models": allowed_models})
 
     if not can_run:
+        await _release_run_slot(agent_run_id)
         raise HTTPException(status_code=402, detail={"message": message, "subscription": subscription})
 
     if not limit_check['can_start']:
@@ -503,32 +507,36 @@ async def start_agent(
     else:
         logger.info(f"Using default model: {effective_model}")
     
-    agent_run = await client.table('agent_runs').insert({
-        "thread_id": thread_id,
-        "status": "running",
-        "started_at": datetime.now(timezone.utc).isoformat(),
-        "agent_id": agent_config.get('agent_id') if agent_config else None,
-        "agent_version_id": agent_config.get('current_version_id') if agent_config else None,
-        "metadata": {
-            "model_name": effective_model,
-            "requested_model": model_name,
-            "enable_thinking": body.enable_thinking,
-            "reasoning_effort": body.reasoning_effort,
-            "enable_context_manager": body.enable_context_manager
-        }
-    }).execute()
+    try:
+        await client.table('agent_runs').insert({
+            "id": agent_run_id,
+            "thread_id": thread_id,
+            "status": "running",
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "agent_id": agent_config.get('agent_id') if agent_config else None,
+            "agent_version_id": agent_config.get('current_version_id') if agent_config else None,
+            "metadata": {
+                "model_name": effective_model,
+                "requested_model": model_name,
+                "enable_thinking": body.enable_thinking,
+                "reasoning_effort": body.reasoning_effort,
+                "enable_context_manager": body.enable_context_manager
+            }
+        }).execute()
+    except Exception:
+        await _release_run_slot(agent_run_id)
+        raise
 
-    agent_run_id = agent_run.data[0]['id']
     structlog.contextvars.bind_contextvars(
         agent_run_id=agent_run_id,
     )
     logger.info(f"Created new agent run: {agent_run_id}")
 
-    instance_key = f"active_run:{instance_id}:{agent_run_id}"
     try:
-        await redis.set(instance_key, "running", ex=redis.REDIS_KEY_TTL)
+        await active_runs.register(instance_id, agent_run_id)
+        await account_runs.register(account_id, agent_run_id, thread_id)
     except Exception as e:
-        logger.warning(f"Failed to register agent run in Redis ({instance_key}): {str(e)}")
+        logger.warning(f"Failed to register agent run {agent_run_id} in Redis: {str(e)}")
 
     request_id = structlog.contextvars.get_contextvars().get('request_id')
 
@@ -1132,26 +1140,33 @@ async def initiate_agent_with_files(
     if agent_config:
         logger.info(f"[AGENT INITIATE] Agent config keys: {list(agent_config.keys())}")
 
-    # Run all checks concurrently
+    # Run all checks concurrently; the limit check reserves a slot for the new run
+    agent_run_id = str(uuid.uuid4())
     model_check_task = asyncio.create_task(can_use_model(client, account_id, model_name))
     billing_check_task = asyncio.create_task(check_billing_status(client, account_id))
-    limit_check_task = asyncio.create_task(check_agent_run_limit(client, account_id))
+    limit_check_task = asyncio.create_task(check_agent_run_limit(client, account_id, agent_run_id))
 
     # Wait for all checks to complete
-    (can_use, model_message, allowed_models), (can_run, message, subscription), limit_check = await asyncio.gather(
-        model_check_task, billing_check_task, limit_check_task
-    )
+    try:
+        (can_use, model_message, allowed_models), (can_run, message, subscription), limit_check = await asyncio.gather(
+            model_check_task, billing_check_task, limit_check_task
+        )
+    except BaseException:
+        # Another check failed; let the limit task finish so a slot it reserves is released
+        await asyncio.gather(limit_check_task, return_exceptions=True)
+        await _release_run_slot(agent_run_id)
+        raise
 
     # Check results and raise appropriate errors
     if not can_use:
+        await _release_run_slot(agent_run_id)
         raise HTTPException(status_code=403, detail={"message": model_message, "allowed_models": allowed_models})
 
-    can_run, message, subscription = await check_billing_status(client, account_id)
     if not can_run:
+        await _release_run_slot(agent_run_id)
         raise HTTPException(status_code=402, detail={"message": message, "subscription": subscription})
 
-    # Check agent run limit (maximum parallel runs in past 24 hours)
-    limit_check = await check_agent_run_limit(client, account_id)
+    # Agent run limit (maximum parallel runs in past 24 hours)
     if not limit_check['can_start']:
         error_detail = {
             "message": f"Maximum of {config.MAX_PARALLEL_AGENT_RUNS} parallel agent runs allowed within 24 hours. You currently have {limit_check['running_count']} running.",
@@ -1336,8 +1351,8 @@ async def initiate_agent_with_files(
         else:
             logger.info(f"Using default model: {effective_model}")
 
-        agent_run = await client.table('agent_runs').insert({
-            "thread_id": thread_id, "status": "running",
+        await client.table('agent_runs').insert({
+            "id": agent_run_id, "thread_id": thread_id, "status": "running",
             "started_at": datetime.now(timezone.utc).isoformat(),
             "agent_id": agent_config.get('agent_id') if agent_config else None,
             "agent_version_id": agent_config.get('current_version_id') if agent_config else None,
@@ -1349,18 +1364,17 @@ async def initiate_agent_with_files(
                 "enable_context_manager": enable_context_manager
             }
         }).execute()
-        agent_run_id = agent_run.data[0]['id']
         logger.info(f"Created new agent run: {agent_run_id}")
         structlog.contextvars.bind_contextvars(
             agent_run_id=agent_run_id,
         )
 
         # Register run in Redis
-        instance_key = f"active_run:{instance_id}:{agent_run_id}"
         try:
-            await redis.set(instance_key, "running", ex=redis.REDIS_KEY_TTL)
+            await active_runs.register(instance_id, agent_run_id)
+            await account_runs.register(account_id, agent_run_id, thread_id)
         except Exception as e:
-            logger.warning(f"Failed to register agent run in Redis ({instance_key}): {str(e)}")
+            logger.warning(f"Failed to register agent run {agent_run_id} in Redis: {str(e)}")
 
         request_id = structlog.contextvars.get_contextvars().get('request_id')
 
@@ -1381,6 +1395,7 @@ async def initiate_agent_with_files(
 
     except Exception as e:
         logger.error(f"Error in agent initiation: {str(e)}\n{traceback.format_exc()}")
+        await _release_run_slot(agent_run_id)
         # TODO: Clean up created project/thread if initiation fails mid-way
         raise HTTPException(status_code=500, detail=f"Failed to initiate agent session: {str(e)}")
 
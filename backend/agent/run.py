@@ -1,7 +1,10 @@
 import os
 import json
+import time
 import asyncio
 import datetime
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from typing import Optional, Dict, List, Any, AsyncGenerator
 from dataclasses import dataclass
 
@@ -33,6 +36,8 @@ from agent.tools.mcp_tool_wrapper import MCPToolWrapper
 from agent.tools.task_list_tool import TaskListTool
 from agentpress.tool import SchemaType
 from agent.tools.sb_sheets_tool import SandboxSheetsTool
+from sandbox.sandbox import get_or_start_sandbox
+from sandbox.tool_base import SandboxToolsBase
 
 load_dotenv()
 
@@ -140,6 +145,27 @@ class MCPManager:
     def __init__(self, thread_manager: ThreadManager, account_id: str):
         self.thread_manager = thread_manager
         self.account_id = account_id
+        # Decrypted credential profile configs for this run, keyed by profile_id
+        self._profile_configs: Dict[str, Dict[str, Any]] = {}
+    
+    async def _resolve_profiles(self, custom_mcps: List[Dict[str, Any]]) -> None:
+        profile_ids = []
+        for custom_mcp in custom_mcps:
+            custom_type = custom_mcp.get('customType', custom_mcp.get('type', 'sse'))
+            mcp_config = custom_mcp.get('config') or {}
+            profile_id = mcp_config.get('profile_id')
+            if custom_type == 'pipedream' and profile_id and not mcp_config.get('external_user_id') and profile_id not in self._profile_configs:
+                profile_ids.append(profile_id)
+        
+        if not profile_ids:
+            return
+        
+        try:
+            from pipedream import profile_service
+            
+            self._profile_configs.update(await profile_service.get_runtime_configs(self.account_id, profile_ids))
+        except Exception as e:
+            logger.error(f"Error retrieving credential profiles {profile_ids}: {e}")
     
     async def register_mcp_tools(self, agent_config: dict) -> Optional[MCPToolWrapper]:
         all_mcps = []
@@ -148,6 +174,8 @@ class MCPManager:
             all_mcps.extend(agent_config['configured_mcps'])
         
         if agent_config.get('custom_mcps'):
+            await self._resolve_profiles(agent_config['custom_mcps'])
+            
             for custom_mcp in agent_config['custom_mcps']:
                 custom_type = custom_mcp.get('customType', custom_mcp.get('type', 'sse'))
                 
@@ -157,16 +185,9 @@ class MCPManager:
                     
                     if not custom_mcp['config'].get('external_user_id'):
                         profile_id = custom_mcp['config'].get('profile_id')
-                        if profile_id:
-                            try:
-                                from pipedream import profile_service
-                                from uuid import UUID
-                                
-                                profile = await profile_service.get_profile(UUID(self.account_id), UUID(profile_id))
-                                if profile:
-                                    custom_mcp['config']['external_user_id'] = profile.external_user_id
-                            except Exception as e:
-                                logger.error(f"Error retrieving external_user_id from profile {profile_id}: {e}")
+                        profile_config = self._profile_configs.get(profile_id) if profile_id else None
+                        if profile_config and profile_config.get('external_user_id'):
+                            custom_mcp['config']['external_user_id'] = profile_config['external_user_id']
                     
                     if 'headers' in custom_mcp['config'] and 'x-pd-app-slug' in custom_mcp['config']['headers']:
                         custom_mcp['config']['app_slug'] = custom_mcp['config']['headers']['x-pd-app-slug']
@@ -221,21 +242,31 @@ class MCPManager:
             return None
 
 
+@lru_cache(maxsize=1)
+def load_sample_response() -> str:
+    sample_response_path = os.path.join(os.path.dirname(__file__), 'sample_responses/1.txt')
+    with open(sample_response_path, 'r') as file:
+        return file.read()
+
+
 class PromptManager:
     @staticmethod
     async def build_system_prompt(model_name: str, agent_config: Optional[dict], 
                                   is_agent_builder: bool, thread_id: str, 
                                   mcp_wrapper_instance: Optional[MCPToolWrapper]) -> dict:
-        
+        base_content = PromptManager.build_base_prompt(model_name, agent_config, is_agent_builder)
+        return PromptManager.finalize_system_prompt(base_content, agent_config, mcp_wrapper_instance)
+    
+    @staticmethod
+    def build_base_prompt(model_name: str, agent_config: Optional[dict], is_agent_builder: bool) -> str:
+        """The part of the system prompt that does not depend on MCP initialization."""
         if "gemini-2.5-flash" in model_name.lower() and "gemini-2.5-pro" not in model_name.lower():
             default_system_content = get_gemini_system_prompt()
         else:
             default_system_content = get_system_prompt()
         
         if "anthropic" not in model_name.lower():
-            sample_response_path = os.path.join(os.path.dirname(__file__), 'sample_responses/1.txt')
-            with open(sample_response_path, 'r') as file:
-                sample_response = file.read()
+            sample_response = load_sample_response()
             default_system_content = default_system_content + "\n\n <sample_assistant_response>" + sample_response + "</sample_assistant_response>"
         
         if is_agent_builder:
@@ -245,6 +276,11 @@ class PromptManager:
         else:
             system_content = default_system_content
         
+        return system_content
+    
+    @staticmethod
+    def finalize_system_prompt(system_content: str, agent_config: Optional[dict],
+                               mcp_wrapper_instance: Optional[MCPToolWrapper]) -> dict:
         if agent_config and (agent_config.get('configured_mcps') or agent_config.get('custom_mcps')) and mcp_wrapper_instance and mcp_wrapper_instance._initialized:
             mcp_info = "\n\n--- MCP Tools Available ---\n"
             mcp_info += "You have access to external MCP (Model Context Protocol) server tools.\n"
@@ -305,19 +341,38 @@ class PromptManager:
 
 
 class MessageManager:
-    def __init__(self, client, thread_id: str, model_name: str, trace: Optional[StatefulTraceClient]):
+    def __init__(self, client, thread_id: str, model_name: str, trace: Optional[StatefulTraceClient],
+                 thread_manager: Optional[ThreadManager] = None):
         self.client = client
         self.thread_id = thread_id
         self.model_name = model_name
         self.trace = trace
+        self.thread_manager = thread_manager
+        self._context_rows: Optional[Dict[str, Dict[str, Any]]] = None
+        self._context_version: Optional[int] = None
+        self._seen_image_contexts: set = set()
+        self._pending_image_context_deletes: List[str] = []
+    
+    async def _load_context_rows(self) -> Dict[str, Dict[str, Any]]:
+        """Latest browser_state and image_context rows, cached until a tool writes new ones."""
+        version = self.thread_manager.get_temporary_context_version(self.thread_id) if self.thread_manager else None
+        if self._context_rows is not None and version is not None and version == self._context_version:
+            return self._context_rows
+        
+        result = await self.client.rpc('get_temporary_message_context', {'p_thread_id': self.thread_id}).execute()
+        self._context_rows = {row['type']: row for row in result.data or []}
+        self._context_version = version
+        return self._context_rows
     
     async def build_temporary_message(self) -> Optional[dict]:
         temp_message_content_list = []
 
-        latest_browser_state_msg = await self.client.table('messages').select('*').eq('thread_id', self.thread_id).eq('type', 'browser_state').order('created_at', desc=True).limit(1).execute()
-        if latest_browser_state_msg.data and len(latest_browser_state_msg.data) > 0:
+        context_rows = await self._load_context_rows()
+
+        browser_state_row = context_rows.get('browser_state')
+        if browser_state_row:
             try:
-                browser_content = latest_browser_state_msg.data[0]["content"]
+                browser_content = browser_state_row["content"]
                 if isinstance(browser_content, str):
                     browser_content = json.loads(browser_content)
                 screenshot_base64 = browser_content.get("screenshot_base64")
@@ -353,10 +408,14 @@ class MessageManager:
             except Exception as e:
                 logger.error(f"Error parsing browser state: {e}")
 
-        latest_image_context_msg = await self.client.table('messages').select('*').eq('thread_id', self.thread_id).eq('type', 'image_context').order('created_at', desc=True).limit(1).execute()
-        if latest_image_context_msg.data and len(latest_image_context_msg.data) > 0:
+        image_context_row = context_rows.get('image_context')
+        if image_context_row and image_context_row['message_id'] not in self._seen_image_contexts:
+            # Each image context is shown once: the row is deleted right away, so the
+            # next lookup returns the next unconsumed one
+            self._seen_image_contexts.add(image_context_row['message_id'])
+            self._pending_image_context_deletes.append(image_context_row['message_id'])
             try:
-                image_context_content = latest_image_context_msg.data[0]["content"] if isinstance(latest_image_context_msg.data[0]["content"], dict) else json.loads(latest_image_context_msg.data[0]["content"])
+                image_context_content = image_context_row["content"] if isinstance(image_context_row["content"], dict) else json.loads(image_context_row["content"])
                 base64_image = image_context_content.get("base64")
                 mime_type = image_context_content.get("mime_type")
                 file_path = image_context_content.get("file_path", "unknown file")
@@ -372,21 +431,96 @@ class MessageManager:
                             "url": f"data:{mime_type};base64,{base64_image}",
                         }
                     })
-
-                await self.client.table('messages').delete().eq('message_id', latest_image_context_msg.data[0]["message_id"]).execute()
             except Exception as e:
                 logger.error(f"Error parsing image context: {e}")
 
+            self._context_rows = None
+            await self.cleanup()
+
         if temp_message_content_list:
             return {"role": "user", "content": temp_message_content_list}
         return None
+    
+    async def cleanup(self):
+        """Delete consumed image_context rows; failed deletes are retried on the next call."""
+        if not self._pending_image_context_deletes:
+            return
+        message_ids = self._pending_image_context_deletes
+        self._pending_image_context_deletes = []
+        try:
+            await self.client.table('messages').delete().in_('message_id', message_ids).execute()
+        except Exception as e:
+            logger.error(f"Error deleting consumed image context messages {message_ids}: {e}")
+            self._pending_image_context_deletes.extend(message_ids)
+
+
+class SetupGraph:
+    """Runs named async setup phases concurrently.
+
+    Each phase starts as soon as the phases it depends on have finished.
+    Dependencies must be added before the phases that use them, which keeps
+    the graph acyclic. If any phase fails, the rest are cancelled and the
+    error propagates.
+    """
+    
+    def __init__(self, phase_timer):
+        self._phase_timer = phase_timer
+        self._phases: Dict[str, tuple] = {}
+    
+    def add(self, name: str, fn, depends_on: tuple = ()):
+        unknown = [dep for dep in depends_on if dep not in self._phases]
+        if unknown:
+            raise ValueError(f"Setup phase '{name}' depends on unknown phases: {unknown}")
+        self._phases[name] = (fn, tuple(depends_on))
+    
+    async def run(self) -> Dict[str, Any]:
+        tasks: Dict[str, asyncio.Task] = {}
+        
+        async def run_phase(name, fn, depends_on):
+            await asyncio.gather(*(tasks[dep] for dep in depends_on))
+            async with self._phase_timer(name):
+                return await fn()
+        
+        for name, (fn, depends_on) in self._phases.items():
+            tasks[name] = asyncio.create_task(run_phase(name, fn, depends_on))
+        
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        
+        return {name: task.result() for name, task in tasks.items()}
 
 
 class AgentRunner:
+    # Longest the first LLM call waits on a sandbox that is still starting;
+    # the start itself carries on in the background
+    SANDBOX_WARMUP_WAIT_SECONDS = 3.0
+    
     def __init__(self, config: AgentConfig):
         self.config = config
+        self.project_data: Dict[str, Any] = {}
+        self._latest_message: Optional[Dict[str, Any]] = None
+        self._billing_status: Optional[tuple] = None
+        self._sandbox_warm_up: Optional[asyncio.Task] = None
+        self.setup_timings: Dict[str, float] = {}
     
-    async def setup(self):
+    @asynccontextmanager
+    async def _phase(self, name: str):
+        """Time a setup phase as a Langfuse span and in setup_timings (ms)."""
+        span = self.config.trace.span(name=f"setup.{name}") if self.config.trace else None
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.setup_timings[name] = round((time.monotonic() - start) * 1000, 1)
+            if span:
+                span.end(metadata={"duration_ms": self.setup_timings[name]})
+    
+    def init_context(self):
         if not self.config.trace:
             self.config.trace = langfuse.trace(name="run_agent", session_id=self.config.thread_id, metadata={"project_id": self.config.project_id})
         
@@ -396,18 +530,20 @@ class AgentRunner:
             target_agent_id=self.config.target_agent_id, 
             agent_config=self.config.agent_config
         )
-        
-        self.client = await self.thread_manager.db.client
+    
+    async def load_account(self):
         self.account_id = await get_account_id_from_thread(self.client, self.config.thread_id)
         if not self.account_id:
             raise ValueError("Could not determine account ID for thread")
-
+    
+    async def load_project(self):
         project = await self.client.table('projects').select('*').eq('project_id', self.config.project_id).execute()
         if not project.data or len(project.data) == 0:
             raise ValueError(f"Project {self.config.project_id} not found")
 
         project_data = project.data[0]
-        sandbox_info = project_data.get('sandbox', {})
+        self.project_data = project_data
+        sandbox_info = project_data.get('sandbox') or {}
         if not sandbox_info.get('id'):
             # Sandbox is created lazily by tools when required. Do not fail setup
             # if no sandbox is present — tools will call `_ensure_sandbox()`
@@ -450,6 +586,38 @@ class AgentRunner:
         mcp_manager = MCPManager(self.thread_manager, self.account_id)
         return await mcp_manager.register_mcp_tools(self.config.agent_config)
     
+    async def warm_up_sandbox(self) -> None:
+        """Start the project's sandbox early and hand it to the registered sandbox tools."""
+        sandbox_info = self.project_data.get('sandbox') or {}
+        if not sandbox_info.get('id'):
+            return
+        
+        try:
+            sandbox = await get_or_start_sandbox(sandbox_info['id'])
+        except Exception as e:
+            logger.warning(f"Sandbox warm-up failed for project {self.config.project_id}: {e}")
+            return
+        
+        instances = {id(info['instance']): info['instance'] for info in self.thread_manager.tool_registry.tools.values()}
+        for tool in instances.values():
+            if isinstance(tool, SandboxToolsBase) and tool._sandbox is None:
+                tool._sandbox_id = sandbox_info['id']
+                tool._sandbox_pass = sandbox_info.get('pass')
+                tool._sandbox = sandbox
+    
+    async def _wait_for_sandbox_warm_up(self) -> None:
+        # Kept on the runner so the task isn't garbage-collected and setup can cancel it
+        self._sandbox_warm_up = asyncio.create_task(self.warm_up_sandbox())
+        self._sandbox_warm_up.add_done_callback(self._log_sandbox_warm_up_error)
+        try:
+            await asyncio.wait_for(asyncio.shield(self._sandbox_warm_up), timeout=self.SANDBOX_WARMUP_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.debug(f"Sandbox for project {self.config.project_id} still starting; continuing without waiting")
+    
+    def _log_sandbox_warm_up_error(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Sandbox warm-up for project {self.config.project_id} failed: {task.exception()}")
+    
     def get_max_tokens(self) -> Optional[int]:
         if "sonnet" in self.config.model_name.lower():
             return 8192
@@ -461,34 +629,79 @@ class AgentRunner:
             return 8192
         return None
     
-    async def run(self) -> AsyncGenerator[Dict[str, Any], None]:
-        await self.setup()
-        await self.setup_tools()
-        mcp_wrapper_instance = await self.setup_mcp_tools()
-        
-        system_message = await PromptManager.build_system_prompt(
-            self.config.model_name, self.config.agent_config, 
-            self.config.is_agent_builder, self.config.thread_id, 
-            mcp_wrapper_instance
-        )
-
+    async def fetch_latest_message(self) -> Optional[Dict[str, Any]]:
+        """Latest assistant/tool/user message; serves both the trace input and the first iteration's stop check."""
+        result = await self.client.table('messages').select('type, content').eq('thread_id', self.config.thread_id).in_('type', ['assistant', 'tool', 'user']).order('created_at', desc=True).limit(1).execute()
+        self._latest_message = result.data[0] if result.data else None
+        return self._latest_message
+    
+    async def set_trace_input(self, latest_message: Optional[Dict[str, Any]]):
+        if not self.config.trace:
+            return
+        if latest_message and latest_message.get('type') == 'user':
+            user_message = latest_message
+        else:
+            result = await self.client.table('messages').select('content').eq('thread_id', self.config.thread_id).eq('type', 'user').order('created_at', desc=True).limit(1).execute()
+            user_message = result.data[0] if result.data else None
+        if user_message:
+            try:
+                data = user_message['content']
+                if isinstance(data, str):
+                    data = json.loads(data)
+                self.config.trace.update(input=data['content'])
+            except Exception as e:
+                logger.warning(f"Could not set trace input for thread {self.config.thread_id}: {e}")
+    
+    async def run_setup(self, message_manager: "MessageManager") -> Dict[str, Any]:
+        """Run all pre-LLM setup as a dependency graph.
+
+        Returns the phase results, including the first iteration's billing check,
+        latest message and temporary message so the loop does not query them again.
+        """
+        graph = SetupGraph(self._phase)
+        graph.add("account", self.load_account)
+        graph.add("project", self.load_project)
+        graph.add("tools", self.setup_tools)
+        graph.add("latest_message", self.fetch_latest_message)
+        graph.add("base_prompt", lambda: asyncio.to_thread(
+            PromptManager.build_base_prompt,
+            self.config.model_name, self.config.agent_config, self.config.is_agent_builder
+        ))
+        graph.add("mcp_tools", self.setup_mcp_tools, depends_on=("account", "tools"))
+        graph.add("sandbox_warm_up", self._wait_for_sandbox_warm_up, depends_on=("project", "tools"))
+        graph.add("billing", self.check_billing, depends_on=("account",))
+        graph.add("trace_input", lambda: self.set_trace_input(self._latest_message), depends_on=("latest_message",))
+        # build_temporary_message consumes image context, so only build it once the run is known to proceed
+        graph.add("temporary_message", lambda: self._build_first_temporary_message(message_manager), depends_on=("latest_message", "billing"))
+        try:
+            return await graph.run()
+        except BaseException:
+            if self._sandbox_warm_up is not None and not self._sandbox_warm_up.done():
+                self._sandbox_warm_up.cancel()
+            raise
+    
+    async def check_billing(self):
+        self._billing_status = await check_billing_status(self.client, self.account_id)
+        return self._billing_status
+    
+    async def _build_first_temporary_message(self, message_manager: "MessageManager") -> Optional[dict]:
+        can_run = self._billing_status[0] if self._billing_status else False
+        if not can_run or (self._latest_message and self._latest_message.get('type') == 'assistant'):
+            return None
+        return await message_manager.build_temporary_message()
+    
+    async def _run_iterations(self, system_message: dict, setup_results: Dict[str, Any],
+                              message_manager: MessageManager) -> AsyncGenerator[Dict[str, Any], None]:
         iteration_count = 0
         continue_execution = True
 
-        latest_user_message = await self.client.table('messages').select('*').eq('thread_id', self.config.thread_id).eq('type', 'user').order('created_at', desc=True).limit(1).execute()
-        if latest_user_message.data and len(latest_user_message.data) > 0:
-            data = latest_user_message.data[0]['content']
-            if isinstance(data, str):
-                data = json.loads(data)
-            if self.config.trace:
-                self.config.trace.update(input=data['content'])
-
-        message_manager = MessageManager(self.client, self.config.thread_id, self.config.model_name, self.config.trace)
-
         while continue_execution and iteration_count < self.config.max_iterations:
             iteration_count += 1
 
-            can_run, message, subscription = await check_billing_status(self.client, self.account_id)
+            if iteration_count == 1:
+                can_run, message, subscription = setup_results["billing"]
+            else:
+                can_run, message, subscription = await check_billing_status(self.client, self.account_id)
             if not can_run:
                 error_msg = f"Billing limit reached: {message}"
                 yield {
@@ -498,14 +711,18 @@ class AgentRunner:
                 }
                 break
 
-            latest_message = await self.client.table('messages').select('*').eq('thread_id', self.config.thread_id).in_('type', ['assistant', 'tool', 'user']).order('created_at', desc=True).limit(1).execute()
-            if latest_message.data and len(latest_message.data) > 0:
-                message_type = latest_message.data[0].get('type')
-                if message_type == 'assistant':
-                    continue_execution = False
-                    break
+            if iteration_count == 1:
+                latest_message = setup_results["latest_message"]
+            else:
+                latest_message = await self.fetch_latest_message()
+            if latest_message and latest_message.get('type') == 'assistant':
+                continue_execution = False
+                break
 
-            temporary_message = await message_manager.build_temporary_message()
+            if iteration_count == 1:
+                temporary_message = setup_results["temporary_message"]
+            else:
+                temporary_message = await message_manager.build_temporary_message()
             max_tokens = self.get_max_tokens()
             
             generation = self.config.trace.generation(name="thread_manager.run_thread") if self.config.trace else None
@@ -637,6 +854,28 @@ class AgentRunner:
             if generation:
                 generation.end(output=full_response)
 
+    async def run(self) -> AsyncGenerator[Dict[str, Any], None]:
+        async with self._phase("init_context"):
+            self.init_context()
+            self.client = await self.thread_manager.db.client
+        
+        message_manager = MessageManager(self.client, self.config.thread_id, self.config.model_name, self.config.trace, self.thread_manager)
+        setup_start = time.monotonic()
+        setup_results = await self.run_setup(message_manager)
+        self.setup_timings["total"] = round((time.monotonic() - setup_start) * 1000, 1)
+        
+        system_message = PromptManager.finalize_system_prompt(setup_results["base_prompt"], self.config.agent_config, setup_results["mcp_tools"])
+        
+        logger.info(f"Agent setup timings (ms) for thread {self.config.thread_id}: {self.setup_timings}")
+        if self.config.trace:
+            self.config.trace.event(name="agent_setup_timings", level="DEFAULT", metadata=dict(self.setup_timings))
+
+        try:
+            async for chunk in self._run_iterations(system_message, setup_results, message_manager):
+                yield chunk
+        finally:
+            await message_manager.cleanup()
+
         asyncio.create_task(asyncio.to_thread(lambda: langfuse.flush()))
 
 
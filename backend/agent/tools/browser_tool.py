@@ -8,7 +8,6 @@ import json
 import base64
 import io
 import traceback
-from PIL import Image
 from utils.config import config
 
 class BrowserTool(SandboxToolsBase):
@@ -80,6 +79,8 @@ class BrowserTool(SandboxToolsBase):
             
             # Validate that decoded data is actually a valid image using PIL
             try:
+                from PIL import Image
+
                 image_stream = io.BytesIO(image_data)
                 with Image.open(image_stream) as img:
                     # Verify the image by attempting to load it
@@ -1,7 +1,16 @@
+import asyncio
+import hashlib
+import json
 import os
-import requests
+import random
 from typing import Dict, Any, Optional, TypedDict, Literal
 
+import httpx
+
+from services import http_client
+from utils.cache import Cache
+from utils.logger import logger
+
 
 class EndpointSchema(TypedDict):
     route: str
@@ -11,27 +20,91 @@ class EndpointSchema(TypedDict):
     payload: Dict[str, Any]
 
 
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Per-provider concurrency limiters, keyed by base_url and bound to the running loop
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_semaphore(base_url: str, max_concurrency: int) -> asyncio.Semaphore:
+    global _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore_loop is not loop:
+        _semaphores.clear()
+        _semaphore_loop = loop
+    semaphore = _semaphores.get(base_url)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max_concurrency)
+        _semaphores[base_url] = semaphore
+    return semaphore
+
+
 class RapidDataProviderBase:
+    # Concurrent in-flight requests allowed per provider within a process
+    max_concurrency: int = 8
+    max_attempts: int = 3
+    backoff_base_seconds: float = 0.5
+    # Successful responses are cached by (endpoint, payload); 0 disables caching
+    cache_ttl_seconds: int = 15 * 60
+
     def __init__(self, base_url: str, endpoints: Dict[str, EndpointSchema]):
         self.base_url = base_url
         self.endpoints = endpoints
-    
+
     def get_endpoints(self):
         return self.endpoints
-    
-    def call_endpoint(
+
+    def _cache_key(self, method: str, url: str, payload: Optional[Dict[str, Any]]) -> str:
+        body = json.dumps(payload or {}, sort_keys=True, default=str)
+        digest = hashlib.sha256(f"{method} {url} {body}".encode("utf-8")).hexdigest()
+        return f"data_provider:{digest}"
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(float(retry_after), 30.0)
+                except ValueError:
+                    pass
+        # Exponential backoff with full jitter
+        return random.uniform(0, self.backoff_base_seconds * (2 ** (attempt - 1)))
+
+    async def _send(self, method: str, url: str, headers: Dict[str, str], payload: Optional[Dict[str, Any]]) -> httpx.Response:
+        client = http_client.get_client("rapidapi")
+        semaphore = _get_semaphore(self.base_url, self.max_concurrency)
+        response: Optional[httpx.Response] = None
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                async with semaphore:
+                    if method == 'GET':
+                        response = await client.get(url, params=payload, headers=headers)
+                    else:
+                        response = await client.post(url, json=payload, headers=headers)
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt == self.max_attempts:
+                    return response
+                logger.warning(f"Data provider {url} returned {response.status_code} (attempt {attempt}/{self.max_attempts})")
+            except httpx.TransportError as e:
+                if attempt == self.max_attempts:
+                    raise
+                response = None
+                logger.warning(f"Data provider {url} request failed (attempt {attempt}/{self.max_attempts}): {e}")
+            await asyncio.sleep(self._retry_delay(attempt, response))
+        return response
+
+    async def call_endpoint(
             self,
             route: str,
             payload: Optional[Dict[str, Any]] = None
     ):
         """
         Call an API endpoint with the given parameters and data.
-        
+
         Args:
-            endpoint (EndpointSchema): The endpoint configuration dictionary
-            params (dict, optional): Query parameters for GET requests
-            payload (dict, optional): JSON payload for POST requests
-            
+            route (str): The key of the endpoint to call
+            payload (dict, optional): Query parameters for GET requests or JSON payload for POST requests
+
         Returns:
             dict: The JSON response from the API
         """
@@ -41,9 +114,9 @@ class RapidDataProviderBase:
         endpoint = self.endpoints.get(route)
         if not endpoint:
             raise ValueError(f"Endpoint {route} not found")
-        
+
         url = f"{self.base_url}{endpoint['route']}"
-        
+
         headers = {
             "x-rapidapi-key": os.getenv("RAPID_API_KEY"),
             "x-rapidapi-host": url.split("//")[1].split("/")[0],
@@ -51,11 +124,24 @@ class RapidDataProviderBase:
         }
 
         method = endpoint.get('method', 'GET').upper()
-        
-        if method == 'GET':
-            response = requests.get(url, params=payload, headers=headers)
-        elif method == 'POST':
-            response = requests.post(url, json=payload, headers=headers)
-        else:
+        if method not in ('GET', 'POST'):
             raise ValueError(f"Unsupported HTTP method: {method}")
-        return response.json()
+
+        cache_key = self._cache_key(method, url, payload) if self.cache_ttl_seconds else None
+        if cache_key:
+            try:
+                cached = await Cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            except Exception as e:
+                logger.warning(f"Data provider cache read failed: {e}")
+
+        response = await self._send(method, url, headers, payload)
+        result = response.json()
+
+        if cache_key and response.is_success:
+            try:
+                await Cache.set(cache_key, result, ttl=self.cache_ttl_seconds)
+            except Exception as e:
+                logger.warning(f"Data provider cache write failed: {e}")
+        return result
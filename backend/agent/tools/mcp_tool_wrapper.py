@@ -14,10 +14,16 @@ from agent.tools.utils.mcp_tool_executor import MCPToolExecutor
 from services import redis as redis_service
 
 
+# Bump when the shape of cached entries changes so stale formats are never read back
+MCP_SCHEMA_CACHE_VERSION = 2
+
+
 class MCPSchemaRedisCache:
-    def __init__(self, ttl_seconds: int = 3600, key_prefix: str = "mcp_schema:"):
+    def __init__(self, ttl_seconds: int = 3600, key_prefix: str = f"mcp_schema:v{MCP_SCHEMA_CACHE_VERSION}:", refresh_ahead_ratio: float = 0.75):
         self._ttl = ttl_seconds
         self._key_prefix = key_prefix
+        # Entries older than this are still served but refreshed in the background
+        self._refresh_after = ttl_seconds * refresh_ahead_ratio
         self._redis_client = None
     
     async def _ensure_redis(self):
@@ -29,10 +35,50 @@ class MCPSchemaRedisCache:
                 return False
         return True
     
+    @staticmethod
+    def config_hash(config: Dict[str, Any]) -> str:
+        config_str = json.dumps(config, sort_keys=True, default=str)
+        return hashlib.sha256(config_str.encode()).hexdigest()
+    
     def _get_cache_key(self, config: Dict[str, Any]) -> str:
-        config_str = json.dumps(config, sort_keys=True)
-        config_hash = hashlib.md5(config_str.encode()).hexdigest()
-        return f"{self._key_prefix}{config_hash}"
+        return f"{self._key_prefix}{self.config_hash(config)}"
+    
+    def needs_refresh(self, data: Dict[str, Any]) -> bool:
+        return time.time() - data.get('timestamp', 0) > self._refresh_after
+    
+    async def get_many(self, configs: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """Look up several configs in a single MGET round trip."""
+        if not configs or not await self._ensure_redis():
+            return [None] * len(configs)
+        
+        try:
+            values = await self._redis_client.mget([self._get_cache_key(config) for config in configs])
+        except Exception as e:
+            logger.warning(f"Error reading from Redis cache: {e}")
+            return [None] * len(configs)
+        
+        results = []
+        for config, value in zip(configs, values):
+            data = None
+            if value:
+                try:
+                    data = json.loads(value)
+                except (TypeError, ValueError):
+                    data = None
+            if data and data.get('config_hash') != self.config_hash(config):
+                data = None
+            results.append(data)
+        return results
+    
+    async def acquire_refresh_lock(self, config: Dict[str, Any], ttl_seconds: int = 60) -> bool:
+        """Ensure only one worker refreshes a given entry at a time."""
+        if not await self._ensure_redis():
+            return False
+        try:
+            return bool(await self._redis_client.set(f"{self._get_cache_key(config)}:refreshing", "1", nx=True, ex=ttl_seconds))
+        except Exception as e:
+            logger.warning(f"Error acquiring MCP cache refresh lock: {e}")
+            return False
     
     async def get(self, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         if not await self._ensure_redis():
@@ -59,7 +105,7 @@ class MCPSchemaRedisCache:
             
         try:
             key = self._get_cache_key(config)
-            serialized_data = json.dumps(data)
+            serialized_data = json.dumps({**data, 'config_hash': self.config_hash(config)})
             
             await self._redis_client.setex(key, self._ttl, serialized_data)
             logger.debug(f"✅ Cached MCP schema in Redis for {config.get('name', config.get('qualifiedName', 'Unknown'))} (TTL: {self._ttl}s)")
@@ -107,8 +153,13 @@ class MCPSchemaRedisCache:
 
 
 _redis_cache = MCPSchemaRedisCache(ttl_seconds=3600)
+# Strong references to in-flight refresh-ahead tasks so they are not garbage collected
+_refresh_tasks: set = set()
 
 class MCPToolWrapper(Tool):
+    # Schemas come from the configured MCP servers, so they differ per instance
+    cache_schemas = False
+
     def __init__(self, mcp_configs: Optional[List[Dict[str, Any]]] = None, use_cache: bool = True):
         self.mcp_manager = mcp_service
         self.mcp_configs = mcp_configs or []
@@ -136,49 +187,34 @@ class MCPToolWrapper(Tool):
         
         standard_configs = [cfg for cfg in self.mcp_configs if not cfg.get('isCustom', False)]
         custom_configs = [cfg for cfg in self.mcp_configs if cfg.get('isCustom', False)]
+        all_configs = standard_configs + custom_configs
         
-        cached_configs = []
-        cached_tools_data = []
+        cached_entries = await _redis_cache.get_many(all_configs) if self.use_cache else [None] * len(all_configs)
         
+        cached_configs = []
         initialization_tasks = []
         
-        if standard_configs:
-            for config in standard_configs:
-                if self.use_cache:
-                    cached_data = await _redis_cache.get(config)
-                    if cached_data:
-                        cached_configs.append(config.get('qualifiedName', 'Unknown'))
-                        cached_tools_data.append(cached_data)
-                        continue
-                
-                task = self._initialize_single_standard_server(config)
-                initialization_tasks.append(('standard', config, task))
-        
-        if custom_configs:
-            for config in custom_configs:
-                if self.use_cache:
-                    cached_data = await _redis_cache.get(config)
-                    if cached_data:
-                        cached_configs.append(config.get('name', 'Unknown'))
-                        cached_tools_data.append(cached_data)
-                        continue
-                
-                task = self._initialize_single_custom_mcp(config)
-                initialization_tasks.append(('custom', config, task))
-        
-        if cached_tools_data:
-            logger.info(f"⚡ Loaded {len(cached_configs)} MCP schemas from Redis cache: {', '.join(cached_configs)}")
-            for cached_data in cached_tools_data:
+        for config, cached_data in zip(all_configs, cached_entries):
+            is_custom = config.get('isCustom', False)
+            config_name = config.get('name', 'Unknown') if is_custom else config.get('qualifiedName', 'Unknown')
+            
+            if cached_data:
                 try:
-                    if cached_data.get('type') == 'standard':
-                        logger.debug("Standard MCP tools found in cache but require connection to restore")
-                    elif cached_data.get('type') == 'custom':
-                        custom_tools = cached_data.get('tools', {})
-                        if custom_tools:
-                            self.custom_handler.custom_tools.update(custom_tools)
-                            logger.debug(f"Restored {len(custom_tools)} custom tools from cache")
+                    self._restore_cached_schema(config, cached_data)
+                    cached_configs.append(config_name)
+                    if _redis_cache.needs_refresh(cached_data):
+                        self._schedule_refresh(config)
+                    continue
                 except Exception as e:
-                    logger.warning(f"Failed to restore cached tools: {e}")
+                    logger.warning(f"Failed to restore cached tools for {config_name}: {e}")
+            
+            if is_custom:
+                initialization_tasks.append(('custom', config, self._initialize_single_custom_mcp(config)))
+            else:
+                initialization_tasks.append(('standard', config, self._initialize_single_standard_server(config)))
+        
+        if cached_configs:
+            logger.info(f"⚡ Loaded {len(cached_configs)} MCP schemas from Redis cache: {', '.join(cached_configs)}")
         
         if initialization_tasks:
             logger.info(f"🚀 Initializing {len(initialization_tasks)} MCP servers in parallel (cache enabled: {self.use_cache})...")
@@ -209,25 +245,68 @@ class MCPToolWrapper(Tool):
             else:
                 logger.info("No MCP servers to initialize")
     
+    def _restore_cached_schema(self, config: Dict[str, Any], cached_data: Dict[str, Any]):
+        if cached_data.get('type') == 'standard':
+            # Tools are registered from the cached definitions; the server is only
+            # contacted when one of them is actually called
+            self.mcp_manager.restore_connection(config, cached_data.get('tools', []))
+        elif cached_data.get('type') == 'custom':
+            custom_tools = cached_data.get('tools', {})
+            self.custom_handler.custom_tools.update(custom_tools)
+            logger.debug(f"Restored {len(custom_tools)} custom tools from cache")
+        else:
+            raise ValueError(f"Unknown cached MCP schema type: {cached_data.get('type')}")
+    
+    def _schedule_refresh(self, config: Dict[str, Any]):
+        task = asyncio.create_task(self._refresh_cached_schema(config))
+        _refresh_tasks.add(task)
+        task.add_done_callback(_refresh_tasks.discard)
+    
+    async def _refresh_cached_schema(self, config: Dict[str, Any]):
+        if not await _redis_cache.acquire_refresh_lock(config):
+            return
+        config_name = config.get('name', config.get('qualifiedName', 'Unknown'))
+        try:
+            if config.get('isCustom', False):
+                custom_tools = await self._discover_custom_tools(config)
+                data = {'tools': custom_tools, 'type': 'custom', 'timestamp': time.time()}
+            else:
+                tools = await self.mcp_manager.list_server_tools(config)
+                data = {'tools': self.mcp_manager.serialize_tools(tools), 'type': 'standard', 'timestamp': time.time()}
+            if not data['tools']:
+                # Keep serving the existing entry rather than caching a failed discovery
+                logger.warning(f"Background refresh of MCP schema for {config_name} returned no tools")
+                return
+            await _redis_cache.set(config, data)
+            logger.debug(f"Refreshed cached MCP schema for {config_name}")
+        except Exception as e:
+            logger.warning(f"Background refresh of MCP schema for {config_name} failed: {e}")
+    
     async def _initialize_single_standard_server(self, config: Dict[str, Any]):
         try:
             logger.debug(f"Connecting to standard MCP server: {config['qualifiedName']}")
-            await self.mcp_manager.connect_server(config)
+            connection = await self.mcp_manager.connect_server(config)
             logger.debug(f"✓ Connected to MCP server: {config['qualifiedName']}")
             
-            tools_info = self.mcp_manager.get_all_tools_openapi()
+            tools_info = self.mcp_manager.serialize_tools(connection.tools)
             return {'tools': tools_info, 'type': 'standard', 'timestamp': time.time()}
         except Exception as e:
             logger.error(f"✗ Failed to connect to MCP server {config['qualifiedName']}: {e}")
             raise e
     
+    async def _discover_custom_tools(self, config: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        # A dedicated handler keeps each cache entry limited to this server's tools
+        handler = CustomMCPHandler(self.connection_manager)
+        await handler._initialize_single_custom_mcp(config)
+        return handler.get_custom_tools()
+    
     async def _initialize_single_custom_mcp(self, config: Dict[str, Any]):
         try:
             logger.debug(f"Initializing custom MCP: {config.get('name', 'Unknown')}")
-            await self.custom_handler._initialize_single_custom_mcp(config)
+            custom_tools = await self._discover_custom_tools(config)
+            self.custom_handler.custom_tools.update(custom_tools)
             logger.debug(f"✓ Initialized custom MCP: {config.get('name', 'Unknown')}")
             
-            custom_tools = self.custom_handler.get_custom_tools()
             return {'tools': custom_tools, 'type': 'custom', 'timestamp': time.time()}
         except Exception as e:
             logger.error(f"✗ Failed to initialize custom MCP {config.get('name', 'Unknown')}: {e}")
@@ -1,26 +1,39 @@
 from __future__ import annotations
 
+import base64
 import csv
 import io
 import json
+import os
 from dataclasses import dataclass
+from functools import lru_cache
 from io import BytesIO
-from statistics import mean
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import chardet
 from agentpress.tool import ToolResult, openapi_schema, usage_example
+from agent.tools.utils.sheet_aggregation import (
+    SUPPORTED_AGGREGATIONS,
+    aggregate_column,
+    aggregate_grouped,
+    validate_aggregations,
+)
 from sandbox.tool_base import SandboxToolsBase
 from utils.logger import logger
 
-try:
-    import openpyxl
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment
-    from openpyxl.chart import BarChart, LineChart, PieChart, Reference, Series, ScatterChart
-    from openpyxl.formatting.rule import ColorScaleRule
-except Exception:
-    openpyxl = None
+
+@lru_cache(maxsize=1)
+def _load_openpyxl():
+    """Import openpyxl on first .xlsx use instead of at worker start; None if unavailable."""
+    try:
+        import openpyxl
+        import openpyxl.chart
+        import openpyxl.formatting.rule
+        import openpyxl.styles
+        import openpyxl.utils
+        return openpyxl
+    except Exception:
+        return None
 
 
 @dataclass
@@ -29,9 +42,30 @@ class SheetData:
     rows: List[List[Any]]
 
 
+# Standalone pandas runner uploaded into the sandbox for large-file analytics
+SHEET_ANALYTICS_SCRIPT = os.path.join(os.path.dirname(__file__), "utils", "sheet_analytics.py")
+SANDBOX_SCRIPT_DIR = "/tmp/.suna"
+SANDBOX_SCRIPT_PATH = f"{SANDBOX_SCRIPT_DIR}/sheet_analytics.py"
+# Files at or above this size are analyzed inside the sandbox in "auto" mode
+SANDBOX_EXECUTION_THRESHOLD_BYTES = 2 * 1024 * 1024
+SANDBOX_EXECUTION_TIMEOUT = 600
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+_script_bytes: Optional[bytes] = None
+
+
+def _get_script_bytes() -> bytes:
+    global _script_bytes
+    if _script_bytes is None:
+        with open(SHEET_ANALYTICS_SCRIPT, "rb") as f:
+            _script_bytes = f.read()
+    return _script_bytes
+
+
 class SandboxSheetsTool(SandboxToolsBase):
     def __init__(self, project_id: str, thread_manager):
         super().__init__(project_id, thread_manager)
+        self._script_installed = False
 
     async def _file_exists(self, full_path: str) -> bool:
         try:
@@ -49,16 +83,14 @@ class SandboxSheetsTool(SandboxToolsBase):
 
     def _detect_encoding(self, data: bytes) -> str:
         try:
-            result = chardet.detect(data)
+            # A prefix is enough to detect the encoding; scanning 100 MB is not
+            result = chardet.detect(data[:ENCODING_SAMPLE_BYTES])
             return result.get("encoding") or "utf-8"
         except Exception:
             return "utf-8"
 
     def _read_csv_bytes(self, data: bytes) -> SheetData:
-        encoding = self._detect_encoding(data)
-        text = data.decode(encoding, errors="replace")
-        reader = csv.reader(io.StringIO(text))
-        rows = [list(r) for r in reader]
+        rows = [list(r) for r in self._iter_csv_rows(data)]
         if not rows:
             return SheetData(headers=[], rows=[])
         headers = [str(h) for h in rows[0]]
@@ -74,29 +106,92 @@ class SandboxSheetsTool(SandboxToolsBase):
             writer.writerow(["" if v is None else v for v in r])
         return buf.getvalue().encode("utf-8")
 
-    def _read_xlsx_bytes(self, data: bytes, sheet_name: Optional[str]) -> SheetData:
+    def _iter_csv_rows(self, data: bytes) -> Iterator[List[str]]:
+        encoding = self._detect_encoding(data)
+        text = data.decode(encoding, errors="replace")
+        return csv.reader(io.StringIO(text))
+
+    def _open_xlsx_read_only(self, data: bytes, sheet_name: Optional[str]):
+        """Open a workbook in streaming (read-only) mode; caller must close it."""
+        openpyxl = _load_openpyxl()
         if not openpyxl:
             raise RuntimeError("openpyxl not available; cannot read XLSX")
-        wb = openpyxl.load_workbook(BytesIO(data), data_only=False)
+        wb = openpyxl.load_workbook(BytesIO(data), read_only=True, data_only=False)
         ws = wb[sheet_name] if sheet_name else wb.active
-        rows = [list(row) for row in ws.iter_rows(values_only=True)]
-        if not rows:
-            return SheetData(headers=[], rows=[])
-        headers = ["" if h is None else str(h) for h in rows[0]]
-        data_rows = [[c for c in r] for r in rows[1:]] if len(rows) > 1 else []
-        return SheetData(headers=headers, rows=data_rows)
+        return wb, ws
+
+    def _read_xlsx_bytes(self, data: bytes, sheet_name: Optional[str]) -> SheetData:
+        wb, ws = self._open_xlsx_read_only(data, sheet_name)
+        try:
+            rows = ws.iter_rows(values_only=True)
+            first = next(rows, None)
+            if first is None:
+                return SheetData(headers=[], rows=[])
+            headers = ["" if h is None else str(h) for h in first]
+            return SheetData(headers=headers, rows=[list(r) for r in rows])
+        finally:
+            wb.close()
+
+    def _preview_sheet_bytes(self, file_path: str, data: bytes, sheet_name: Optional[str], max_rows: int) -> Tuple[SheetData, int]:
+        """Read headers plus the first ``max_rows`` rows without materializing the sheet.
+
+        Returns the preview and the total data row count. For XLSX the count comes
+        from the sheet's declared dimensions when they are consistent with what was
+        read, so iteration stops as soon as the preview is filled.
+        """
+        max_rows = max(0, max_rows)
+        wb = None
+        declared_rows: Optional[int] = None
+        if file_path.lower().endswith(".csv"):
+            rows: Iterator[Any] = self._iter_csv_rows(data)
+        elif file_path.lower().endswith(".xlsx"):
+            wb, ws = self._open_xlsx_read_only(data, sheet_name)
+            rows = ws.iter_rows(values_only=True)
+            declared_rows = ws.max_row
+        else:
+            raise ValueError("Unsupported file extension. Use .csv or .xlsx")
+        try:
+            first = next(rows, None)
+            if first is None:
+                return SheetData(headers=[], rows=[]), 0
+            headers = ["" if h is None else str(h) for h in first]
+            sample: List[List[Any]] = []
+            total = 0
+            for r in rows:
+                total += 1
+                if total <= max_rows:
+                    sample.append(list(r))
+                elif declared_rows is not None and declared_rows - 1 >= total:
+                    total = declared_rows - 1
+                    break
+            return SheetData(headers=headers, rows=sample), total
+        finally:
+            if wb is not None:
+                wb.close()
+
+    def _xlsx_to_csv_bytes(self, data: bytes, sheet_name: Optional[str]) -> bytes:
+        """Stream an XLSX sheet straight into CSV without building row lists."""
+        wb, ws = self._open_xlsx_read_only(data, sheet_name)
+        try:
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            for r in ws.iter_rows(values_only=True):
+                writer.writerow(["" if v is None else v for v in r])
+            return buf.getvalue().encode("utf-8")
+        finally:
+            wb.close()
 
     def _write_xlsx_bytes(self, sheet: SheetData, sheet_name: Optional[str]) -> bytes:
+        openpyxl = _load_openpyxl()
         if not openpyxl:
             raise RuntimeError("openpyxl not available; cannot write XLSX")
-        wb = Workbook()
-        ws = wb.active
-        if sheet_name:
-            ws.title = sheet_name
+        # write_only streams rows to the zip instead of keeping a cell DOM
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(title=sheet_name or "Sheet")
         if sheet.headers:
             ws.append(sheet.headers)
         for r in sheet.rows:
-            ws.append([v for v in r])
+            ws.append(r)
         out = BytesIO()
         wb.save(out)
         return out.getvalue()
@@ -127,6 +222,49 @@ class SandboxSheetsTool(SandboxToolsBase):
             raise ValueError("Unsupported file extension. Use .csv or .xlsx")
         return full_path
 
+    async def _file_size(self, full_path: str) -> Optional[int]:
+        try:
+            info = await self.sandbox.fs.get_file_info(full_path)
+            return getattr(info, "size", None)
+        except Exception:
+            return None
+
+    async def _should_run_in_sandbox(self, full_path: str, execution_mode: str) -> bool:
+        if execution_mode == "local":
+            return False
+        if execution_mode == "sandbox":
+            return True
+        size = await self._file_size(full_path)
+        return size is not None and size >= SANDBOX_EXECUTION_THRESHOLD_BYTES
+
+    async def _ensure_analytics_script(self) -> None:
+        if self._script_installed:
+            return
+        try:
+            await self.sandbox.fs.create_folder(SANDBOX_SCRIPT_DIR, "755")
+        except Exception:
+            pass
+        await self._upload_bytes(SANDBOX_SCRIPT_PATH, _get_script_bytes(), "755")
+        self._script_installed = True
+
+    async def _run_in_sandbox(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        """Run an analytics operation next to the data and return its JSON summary."""
+        await self._ensure_analytics_script()
+        encoded = base64.b64encode(json.dumps(spec).encode("utf-8")).decode("ascii")
+        response = await self.sandbox.process.exec(
+            f"python3 {SANDBOX_SCRIPT_PATH} {encoded}",
+            timeout=SANDBOX_EXECUTION_TIMEOUT,
+        )
+        output = (response.result or "").strip().splitlines()
+        try:
+            payload = json.loads(output[-1]) if output else {}
+        except json.JSONDecodeError:
+            payload = {}
+        if not payload.get("success"):
+            error = payload.get("error") or (response.result or "").strip() or f"exit code {response.exit_code}"
+            raise RuntimeError(f"In-sandbox {spec.get('operation')} failed: {error}")
+        return payload["result"]
+
     def _infer_column_types(self, rows: List[List[Any]], headers: List[str]) -> Dict[str, str]:
         types: Dict[str, str] = {}
         if not headers:
@@ -214,6 +352,7 @@ class SandboxSheetsTool(SandboxToolsBase):
             full_path = f"{self.workspace_path}/{rel}"
 
             if rel.lower().endswith(".xlsx"):
+                openpyxl = _load_openpyxl()
                 if not openpyxl:
                     return self.fail_response("openpyxl not available to update .xlsx")
 
@@ -460,21 +599,27 @@ class SandboxSheetsTool(SandboxToolsBase):
     async def view_sheet(self, file_path: str, sheet_name: Optional[str] = None, max_rows: int = 100, export_csv_path: Optional[str] = None) -> ToolResult:
         try:
             await self._ensure_sandbox()
-            full_path, sheet = await self._load_sheet(file_path, sheet_name)
+            rel_source = self.clean_path(file_path)
+            full_path = f"{self.workspace_path}/{rel_source}"
+            data = await self._download_bytes(full_path)
+            preview, row_count = self._preview_sheet_bytes(rel_source, data, sheet_name, max_rows)
             exported_to = None
             if export_csv_path:
                 rel = self.clean_path(export_csv_path)
                 if not rel.lower().endswith(".csv"):
                     rel += ".csv"
                 export_full = f"{self.workspace_path}/{rel}"
-                await self._upload_bytes(export_full, self._write_csv_bytes(sheet))
+                if rel_source.lower().endswith(".xlsx"):
+                    csv_bytes = self._xlsx_to_csv_bytes(data, sheet_name)
+                else:
+                    csv_bytes = self._write_csv_bytes(self._read_csv_bytes(data))
+                await self._upload_bytes(export_full, csv_bytes)
                 exported_to = export_full
-            sample_rows = sheet.rows[: max(0, max_rows)]
             return self.success_response({
                 "file_path": full_path,
-                "headers": sheet.headers,
-                "row_count": len(sheet.rows),
-                "sample_rows": sample_rows,
+                "headers": preview.headers,
+                "row_count": row_count,
+                "sample_rows": preview.rows,
                 "exported_csv": exported_to
             })
         except Exception as e:
@@ -520,6 +665,7 @@ class SandboxSheetsTool(SandboxToolsBase):
             if rel.lower().endswith(".csv"):
                 await self._upload_bytes(full, self._write_csv_bytes(SheetData(headers or [], rows or [])))
             elif rel.lower().endswith(".xlsx"):
+                openpyxl = _load_openpyxl()
                 if not openpyxl:
                     return self.fail_response("openpyxl not available to create .xlsx")
                 sheet = SheetData(headers or [], rows or [])
@@ -540,7 +686,7 @@ class SandboxSheetsTool(SandboxToolsBase):
         "type": "function",
         "function": {
             "name": "analyze_sheet",
-            "description": "Simple statistics and optional group_by; can export CSV.",
+            "description": "Statistics (count, sum, avg, min, max, median, std, distinct_count, percentiles) with optional group_by; can export CSV.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -548,8 +694,9 @@ class SandboxSheetsTool(SandboxToolsBase):
                     "sheet_name": {"type": "string", "nullable": True},
                     "target_columns": {"type": "array", "items": {"type": "string"}},
                     "group_by": {"type": "string"},
-                    "aggregations": {"type": "array", "items": {"type": "string", "enum": ["count", "sum", "avg", "min", "max"]}},
-                    "export_csv_path": {"type": "string"}
+                    "aggregations": {"type": "array", "items": {"type": "string", "enum": SUPPORTED_AGGREGATIONS}},
+                    "export_csv_path": {"type": "string"},
+                    "execution_mode": {"type": "string", "enum": ["auto", "sandbox", "local"], "default": "auto", "description": "Where to compute: 'sandbox' runs next to the file, 'local' in the backend, 'auto' picks sandbox for large files"}
                 },
                 "required": ["file_path"]
             }
@@ -565,95 +712,60 @@ class SandboxSheetsTool(SandboxToolsBase):
         </invoke>
         </function_calls>
     ''')
-    async def analyze_sheet(self, file_path: str, sheet_name: Optional[str] = None, target_columns: Optional[List[str]] = None, group_by: Optional[str] = None, aggregations: Optional[List[str]] = None, export_csv_path: Optional[str] = None) -> ToolResult:
+    async def analyze_sheet(self, file_path: str, sheet_name: Optional[str] = None, target_columns: Optional[List[str]] = None, group_by: Optional[str] = None, aggregations: Optional[List[str]] = None, export_csv_path: Optional[str] = None, execution_mode: str = "auto") -> ToolResult:
         try:
             await self._ensure_sandbox()
+            aggs = validate_aggregations(aggregations)
+            rel = self.clean_path(file_path)
+            source_full = f"{self.workspace_path}/{rel}"
+            if await self._should_run_in_sandbox(source_full, execution_mode):
+                export_full = None
+                if export_csv_path:
+                    export_rel = self.clean_path(export_csv_path)
+                    if not export_rel.lower().endswith(".csv"):
+                        export_rel += ".csv"
+                    export_full = f"{self.workspace_path}/{export_rel}"
+                try:
+                    summary = await self._run_in_sandbox({
+                        "operation": "analyze",
+                        "path": source_full,
+                        "sheet_name": sheet_name,
+                        "target_columns": target_columns,
+                        "group_by": group_by,
+                        "aggregations": aggs,
+                        "export_csv_path": export_full,
+                    })
+                    return self.success_response({
+                        "analyzed_from": source_full,
+                        "result_preview": {"headers": summary["headers"], "rows": summary["rows"]},
+                        "exported_csv": summary.get("exported_csv"),
+                        "execution": "sandbox"
+                    })
+                except Exception as e:
+                    if execution_mode == "sandbox":
+                        raise
+                    logger.warning(f"In-sandbox analysis failed for {source_full}, falling back to local: {e}")
+
             full_path, sheet = await self._load_sheet(file_path, sheet_name)
             headers = sheet.headers
             idx_map = self._to_index_map(headers)
 
-            def to_float(v: Any) -> Optional[float]:
-                if v is None:
-                    return None
-                if isinstance(v, (int, float)):
-                    return float(v)
-                try:
-                    return float(str(v).strip())
-                except Exception:
-                    return None
-
             numeric_cols = [c for c in (target_columns or headers) if c in idx_map]
             if group_by and group_by in idx_map:
-                g_idx = idx_map[group_by]
-                groups: Dict[Any, List[List[Any]]] = {}
-                for row in sheet.rows:
-                    key = row[g_idx] if len(row) > g_idx else None
-                    groups.setdefault(key, []).append(row)
-                out_headers = [group_by]
-                aggs = aggregations or ["count", "sum", "avg", "min", "max"]
-                for col in numeric_cols:
-                    for agg in aggs:
-                        out_headers.append(f"{col}_{agg}")
+                grouped = aggregate_grouped(sheet.rows, idx_map[group_by], {col: idx_map[col] for col in numeric_cols}, aggs)
+                out_headers = [group_by] + [f"{col}_{agg}" for col in numeric_cols for agg in aggs]
                 summary_rows: List[List[Any]] = []
-                for key, rows in groups.items():
+                for g, key in enumerate(grouped.keys):
                     row_out = [key]
                     for col in numeric_cols:
-                        c_idx = idx_map[col]
-                        vals = [to_float(r[c_idx]) for r in rows if len(r) > c_idx]
-                        vals = [v for v in vals if v is not None]
-                        count_v = len(vals)
-                        sum_v = sum(vals) if vals else None
-                        avg_v = mean(vals) if vals else None
-                        min_v = min(vals) if vals else None
-                        max_v = max(vals) if vals else None
-                        for agg in aggs:
-                            row_out.append({
-                                "count": count_v,
-                                "sum": sum_v,
-                                "avg": avg_v,
-                                "min": min_v,
-                                "max": max_v
-                            }[agg])
+                        stats = grouped.columns[col][g]
+                        row_out.extend(stats[agg] for agg in aggs)
                     summary_rows.append(row_out)
                 result_sheet = SheetData(headers=out_headers, rows=summary_rows)
             else:
                 out_headers = ["metric"] + numeric_cols
-                rows_out: List[List[Any]] = []
-                counts = []
-                for col in numeric_cols:
-                    c_idx = idx_map[col]
-                    vals = [to_float(r[c_idx]) for r in sheet.rows if len(r) > c_idx]
-                    vals = [v for v in vals if v is not None]
-                    counts.append(len(vals))
-                rows_out.append(["count", *counts])
-                sums = []
-                for col in numeric_cols:
-                    c_idx = idx_map[col]
-                    vals = [to_float(r[c_idx]) for r in sheet.rows if len(r) > c_idx]
-                    vals = [v for v in vals if v is not None]
-                    sums.append(sum(vals) if vals else None)
-                rows_out.append(["sum", *sums])
-                avgs = []
-                for col in numeric_cols:
-                    c_idx = idx_map[col]
-                    vals = [to_float(r[c_idx]) for r in sheet.rows if len(r) > c_idx]
-                    vals = [v for v in vals if v is not None]
-                    avgs.append(mean(vals) if vals else None)
-                rows_out.append(["avg", *avgs])
-                mins = []
-                for col in numeric_cols:
-                    c_idx = idx_map[col]
-                    vals = [to_float(r[c_idx]) for r in sheet.rows if len(r) > c_idx]
-                    vals = [v for v in vals if v is not None]
-                    mins.append(min(vals) if vals else None)
-                rows_out.append(["min", *mins])
-                maxs = []
-                for col in numeric_cols:
-                    c_idx = idx_map[col]
-                    vals = [to_float(r[c_idx]) for r in sheet.rows if len(r) > c_idx]
-                    vals = [v for v in vals if v is not None]
-                    maxs.append(max(vals) if vals else None)
-                rows_out.append(["max", *maxs])
+                per_column = [aggregate_column(sheet.rows, idx_map[col], aggs) for col in numeric_cols]
+                rows_out = [[agg, *(stats[agg] for stats in per_column)] for agg in aggs]
                 result_sheet = SheetData(headers=out_headers, rows=rows_out)
 
             exported = None
@@ -668,7 +780,8 @@ class SandboxSheetsTool(SandboxToolsBase):
             return self.success_response({
                 "analyzed_from": full_path,
                 "result_preview": {"headers": result_sheet.headers, "rows": result_sheet.rows[:50]},
-                "exported_csv": exported
+                "exported_csv": exported,
+                "execution": "local"
             })
         except Exception as e:
             logger.exception("analyze_sheet failed")
@@ -688,7 +801,8 @@ class SandboxSheetsTool(SandboxToolsBase):
                     "x_column": {"type": "string"},
                     "y_columns": {"type": "array", "items": {"type": "string"}},
                     "save_as": {"type": "string"},
-                    "export_csv_path": {"type": "string", "description": "Optional CSV path for the chart dataset (x + y columns)"}
+                    "export_csv_path": {"type": "string", "description": "Optional CSV path for the chart dataset (x + y columns)"},
+                    "execution_mode": {"type": "string", "enum": ["auto", "sandbox", "local"], "default": "auto", "description": "Where to build the chart: 'sandbox' runs next to the file, 'local' in the backend, 'auto' picks sandbox for large files"}
                 },
                 "required": ["file_path", "x_column", "y_columns"]
             }
@@ -706,11 +820,49 @@ class SandboxSheetsTool(SandboxToolsBase):
         </invoke>
         </function_calls>
     ''')
-    async def visualize_sheet(self, file_path: str, x_column: str, y_columns: List[str], chart_type: str = "bar", sheet_name: Optional[str] = None, save_as: Optional[str] = None, export_csv_path: Optional[str] = None) -> ToolResult:
+    async def visualize_sheet(self, file_path: str, x_column: str, y_columns: List[str], chart_type: str = "bar", sheet_name: Optional[str] = None, save_as: Optional[str] = None, export_csv_path: Optional[str] = None, execution_mode: str = "auto") -> ToolResult:
         try:
             await self._ensure_sandbox()
             rel = self.clean_path(file_path)
             full = f"{self.workspace_path}/{rel}"
+
+            target = save_as or (rel.rsplit(".", 1)[0] + "_chart.xlsx")
+            if not target.lower().endswith(".xlsx"):
+                target += ".xlsx"
+            target_full = f"{self.workspace_path}/{self.clean_path(target)}"
+            if export_csv_path:
+                csv_rel = self.clean_path(export_csv_path)
+                if not csv_rel.lower().endswith(".csv"):
+                    csv_rel += ".csv"
+            else:
+                base = self.clean_path(target).rsplit(".", 1)[0]
+                csv_rel = f"{base}_data.csv"
+            csv_full = f"{self.workspace_path}/{csv_rel}"
+
+            if await self._should_run_in_sandbox(full, execution_mode):
+                try:
+                    await self._run_in_sandbox({
+                        "operation": "visualize",
+                        "path": full,
+                        "sheet_name": sheet_name,
+                        "chart_type": chart_type,
+                        "x_column": x_column,
+                        "y_columns": y_columns,
+                        "target_path": target_full,
+                        "csv_path": csv_full,
+                    })
+                    return self.success_response({
+                        "source": full,
+                        "chart_saved": target_full,
+                        "chart_type": chart_type,
+                        "chart_data_csv": csv_full,
+                        "execution": "sandbox"
+                    })
+                except Exception as e:
+                    if execution_mode == "sandbox":
+                        raise
+                    logger.warning(f"In-sandbox chart generation failed for {full}, falling back to local: {e}")
+
             _, sheet = await self._load_sheet(file_path, sheet_name)
             headers = sheet.headers
             idx_map = self._to_index_map(headers)
@@ -720,46 +872,42 @@ class SandboxSheetsTool(SandboxToolsBase):
                 if yc not in idx_map:
                     return self.fail_response(f"y_column '{yc}' not found")
 
-            target = save_as or (rel.rsplit(".", 1)[0] + "_chart.xlsx")
-            if not target.lower().endswith(".xlsx"):
-                target += ".xlsx"
-            target_full = f"{self.workspace_path}/{self.clean_path(target)}"
+            openpyxl = _load_openpyxl()
             if not openpyxl:
                 return self.fail_response("openpyxl not available to build charts")
 
-            wb = Workbook()
-            ws = wb.active
-            ws.title = sheet_name or "Data"
+            wb = openpyxl.Workbook(write_only=True)
+            ws = wb.create_sheet(title=sheet_name or "Data")
             if headers:
                 ws.append(headers)
             for r in sheet.rows:
                 ws.append(r)
 
             if chart_type == "bar":
-                chart = BarChart()
+                chart = openpyxl.chart.BarChart()
             elif chart_type == "line":
-                chart = LineChart()
+                chart = openpyxl.chart.LineChart()
             elif chart_type == "pie":
-                chart = PieChart()
+                chart = openpyxl.chart.PieChart()
             else:
-                chart = ScatterChart()
+                chart = openpyxl.chart.ScatterChart()
 
             x_col_idx = idx_map[x_column] + 1
             y_col_indices = [idx_map[c] + 1 for c in y_columns]
             min_row = 2
             max_row = len(sheet.rows) + 1
-            x_ref = Reference(ws, min_col=x_col_idx, min_row=min_row, max_row=max_row)
+            x_ref = openpyxl.chart.Reference(ws, min_col=x_col_idx, min_row=min_row, max_row=max_row)
 
             if chart_type == "pie" and len(y_col_indices) == 1:
-                data_ref = Reference(ws, min_col=y_col_indices[0], min_row=1, max_row=max_row)
+                data_ref = openpyxl.chart.Reference(ws, min_col=y_col_indices[0], min_row=1, max_row=max_row)
                 chart.add_data(data_ref, titles_from_data=True)
                 chart.set_categories(x_ref)
             else:
                 for yci in y_col_indices:
-                    data_ref = Reference(ws, min_col=yci, min_row=min_row - 1, max_row=max_row)
-                    series = Series(data_ref, title_from_data=True)
+                    data_ref = openpyxl.chart.Reference(ws, min_col=yci, min_row=min_row - 1, max_row=max_row)
+                    series = openpyxl.chart.Series(data_ref, title_from_data=True)
                     series.category = x_ref
-                    if isinstance(chart, ScatterChart):
+                    if isinstance(chart, openpyxl.chart.ScatterChart):
                         series.xvalues = x_ref
                     chart.series.append(series)
 
@@ -786,22 +934,14 @@ class SandboxSheetsTool(SandboxToolsBase):
                 if ok:
                     dataset_rows.append(vals)
 
-            csv_rel = None
-            if export_csv_path:
-                csv_rel = self.clean_path(export_csv_path)
-                if not csv_rel.lower().endswith(".csv"):
-                    csv_rel += ".csv"
-            else:
-                base = self.clean_path(target).rsplit(".", 1)[0]
-                csv_rel = f"{base}_data.csv"
-            csv_full = f"{self.workspace_path}/{csv_rel}"
             await self._upload_bytes(csv_full, self._write_csv_bytes(SheetData(headers=dataset_headers, rows=dataset_rows)))
 
             return self.success_response({
                 "source": full,
                 "chart_saved": target_full,
                 "chart_type": chart_type,
-                "chart_data_csv": csv_full
+                "chart_data_csv": csv_full,
+                "execution": "local"
             })
         except Exception as e:
             logger.exception("visualize_sheet failed")
@@ -849,6 +989,7 @@ class SandboxSheetsTool(SandboxToolsBase):
             if not rel.lower().endswith(".xlsx"):
                 return self.fail_response("format_sheet only supports .xlsx")
             data = await self._download_bytes(full)
+            openpyxl = _load_openpyxl()
             if not openpyxl:
                 return self.fail_response("openpyxl not available")
             wb = openpyxl.load_workbook(BytesIO(data))
@@ -860,14 +1001,14 @@ class SandboxSheetsTool(SandboxToolsBase):
             if bold_headers and max_row >= 1:
                 for c in range(1, max_col + 1):
                     cell = ws.cell(row=1, column=c)
-                    cell.font = Font(bold=True)
-                    cell.alignment = Alignment(vertical="center")
+                    cell.font = openpyxl.styles.Font(bold=True)
+                    cell.alignment = openpyxl.styles.Alignment(vertical="center")
 
             if apply_banding and max_row > 2:
                 for r in range(2, max_row + 1):
                     if r % 2 == 0:
                         for c in range(1, max_col + 1):
-                            ws.cell(row=r, column=c).fill = PatternFill(start_color="FFF9F9", end_color="FFF9F9", fill_type="solid")
+                            ws.cell(row=r, column=c).fill = openpyxl.styles.PatternFill(start_color="FFF9F9", end_color="FFF9F9", fill_type="solid")
 
             if auto_width:
                 for c in range(1, max_col + 1):
@@ -886,7 +1027,7 @@ class SandboxSheetsTool(SandboxToolsBase):
                         rng = f"{openpyxl.utils.get_column_letter(c_idx)}2:{openpyxl.utils.get_column_letter(c_idx)}{max_row}"
                         ws.conditional_formatting.add(
                             rng,
-                            ColorScaleRule(start_type='min', start_color=conditional_format.get("min_color", "FFEFEB"),
+                            openpyxl.formatting.rule.ColorScaleRule(start_type='min', start_color=conditional_format.get("min_color", "FFEFEB"),
                                            mid_type='percentile', mid_value=50, mid_color=conditional_format.get("mid_color", "FFD7D2"),
                                            end_type='max', end_color=conditional_format.get("max_color", "FFA39E"))
                         )
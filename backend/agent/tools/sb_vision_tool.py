@@ -3,7 +3,6 @@ import base64
 import mimetypes
 from typing import Optional, Tuple
 from io import BytesIO
-from PIL import Image
 from urllib.parse import urlparse
 from agentpress.tool import ToolResult, openapi_schema, usage_example
 from sandbox.tool_base import SandboxToolsBase
@@ -49,6 +48,8 @@ class SandboxVisionTool(SandboxToolsBase):
             Tuple of (compressed_bytes, new_mime_type)
         """
         try:
+            from PIL import Image
+
             # Open image from bytes
             img = Image.open(BytesIO(image_bytes))
             
@@ -1,12 +1,9 @@
 import json
 import asyncio
 from typing import Dict, Any, List
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.sse import sse_client
-from mcp.client.stdio import stdio_client
-from mcp.client.streamable_http import streamablehttp_client
 from utils.logger import logger
 from .mcp_connection_manager import MCPConnectionManager
+from .mcp_session_pool import mcp_session_pool
 
 
 class CustomMCPHandler:
@@ -76,14 +73,10 @@ class CustomMCPHandler:
             
             logger.info(f"Resolved Composio profile {profile_id} to MCP URL")
 
-            async with streamablehttp_client(mcp_url) as (read_stream, write_stream, _):
-                async with ClientSession(read_stream, write_stream) as session:
-                    await session.initialize()
-                    tools_result = await session.list_tools()
-                    tools = tools_result.tools if hasattr(tools_result, 'tools') else tools_result
-                    
-                    self._register_custom_tools(tools, server_name, enabled_tools, 'composio', server_config)
-                    logger.info(f"Registered {len(tools)} tools from Composio MCP {server_name}")
+            tools = await mcp_session_pool.list_tools("http", {"url": mcp_url, "headers": {}})
+            
+            self._register_custom_tools(tools, server_name, enabled_tools, 'composio', server_config)
+            logger.info(f"Registered {len(tools)} tools from Composio MCP {server_name}")
             
         except Exception as e:
             logger.error(f"Failed to initialize Composio MCP {server_name}: {str(e)}")
@@ -107,8 +100,6 @@ class CustomMCPHandler:
         try:
             import os
             from pipedream import connection_service
-            from mcp import ClientSession
-            from mcp.client.streamable_http import streamablehttp_client
             
             access_token = await connection_service._ensure_access_token()
             
@@ -131,13 +122,9 @@ class CustomMCPHandler:
 
             url = "https://remote.mcp.pipedream.net"
             
-            async with streamablehttp_client(url, headers=headers) as (read_stream, write_stream, _):
-                async with ClientSession(read_stream, write_stream) as session:
-                    await session.initialize()
-                    tools_result = await session.list_tools()
-                    tools = tools_result.tools if hasattr(tools_result, 'tools') else tools_result
-                    
-                    self._register_custom_tools(tools, server_name, enabled_tools, 'pipedream', server_config)
+            tools = await mcp_session_pool.list_tools("http", {"url": url, "headers": headers})
+            
+            self._register_custom_tools(tools, server_name, enabled_tools, 'pipedream', server_config)
                     
         except Exception as e:
             logger.error(f"Pipedream MCP {server_name}: Connection failed - {str(e)}")
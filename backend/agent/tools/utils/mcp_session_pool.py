@@ -0,0 +1,296 @@
+import asyncio
+import hashlib
+import json
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+from utils.logger import logger
+
+
+@dataclass(frozen=True)
+class MCPServerKey:
+    """Identity of a pooled session: transport, server URL/command and a hash of its credentials."""
+    transport: str
+    target: str
+    credential_hash: str
+
+
+def _hash_credentials(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value or {}, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def server_key(transport: str, server_config: Dict[str, Any]) -> MCPServerKey:
+    if transport == "stdio":
+        target = " ".join([server_config["command"], *server_config.get("args", [])])
+        return MCPServerKey(transport, target, _hash_credentials(server_config.get("env")))
+    return MCPServerKey(transport, server_config["url"], _hash_credentials(server_config.get("headers")))
+
+
+def _open_transport(transport: str, server_config: Dict[str, Any]):
+    if transport == "http":
+        return streamablehttp_client(server_config["url"], headers=server_config.get("headers") or None)
+    if transport == "sse":
+        headers = server_config.get("headers") or {}
+        try:
+            return sse_client(server_config["url"], headers=headers)
+        except TypeError as e:
+            if "unexpected keyword argument" in str(e):
+                return sse_client(server_config["url"])
+            raise
+    if transport == "stdio":
+        return stdio_client(StdioServerParameters(
+            command=server_config["command"],
+            args=server_config.get("args", []),
+            env=server_config.get("env", {})
+        ))
+    raise ValueError(f"Unsupported MCP transport: {transport}")
+
+
+class PooledMCPSession:
+    """A live ClientSession owned by a background task.
+
+    The MCP transports are anyio context managers that must be entered and exited
+    from the same task, so each session runs inside its own owner task and other
+    tasks only send requests over it.
+    """
+
+    def __init__(self, key: MCPServerKey, transport: str, server_config: Dict[str, Any]):
+        self.key = key
+        self._transport = transport
+        self._server_config = server_config
+        self.session: Optional[ClientSession] = None
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+        self.in_flight = 0
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._error: Optional[BaseException] = None
+
+    @property
+    def alive(self) -> bool:
+        return self._task is not None and not self._task.done() and self.session is not None
+
+    async def start(self, timeout: float) -> None:
+        self._task = asyncio.create_task(self._run(), name=f"mcp-session:{self.key.target}")
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise TimeoutError(f"Timed out connecting to MCP server {self.key.target} after {timeout}s")
+        if self.session is None:
+            raise ConnectionError(f"Failed to connect to MCP server {self.key.target}: {self._error}")
+
+    async def _run(self) -> None:
+        try:
+            async with _open_transport(self._transport, self._server_config) as streams:
+                read, write = streams[0], streams[1]
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._stop.wait()
+        except BaseException as e:
+            self._error = e
+            if not isinstance(e, asyncio.CancelledError):
+                logger.warning(f"MCP session to {self.key.target} ended: {e}")
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def ping(self, timeout: float) -> bool:
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout=timeout)
+            self.last_checked = time.monotonic()
+            return True
+        except Exception as e:
+            logger.debug(f"MCP health check failed for {self.key.target}: {e}")
+            return False
+
+    async def close(self) -> None:
+        self._stop.set()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=5)
+        except (asyncio.TimeoutError, Exception):
+            self._task.cancel()
+
+
+# Errors that mean the session's transport is gone rather than the tool failing
+_CONNECTION_ERRORS: Tuple[type, ...] = (ConnectionError, EOFError, BrokenPipeError)
+try:
+    import anyio
+    _CONNECTION_ERRORS += (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream)
+except ImportError:
+    pass
+try:
+    import httpx
+    _CONNECTION_ERRORS += (httpx.TransportError,)
+except ImportError:
+    pass
+
+
+class MCPSessionPool:
+    """Per-worker pool of long-lived MCP client sessions.
+
+    Sessions are keyed by (transport, server URL/command, credential hash) and
+    shared by tool discovery and tool execution, so an agent calling an MCP tool
+    many times per run pays for the handshake (or stdio process spawn) once.
+    """
+
+    def __init__(
+        self,
+        max_sessions_per_server: int = 8,
+        idle_timeout: float = 300.0,
+        health_check_interval: float = 60.0,
+        connect_timeout: float = 15.0,
+    ):
+        self.max_sessions_per_server = max_sessions_per_server
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.connect_timeout = connect_timeout
+        self._sessions: Dict[MCPServerKey, PooledMCPSession] = {}
+        self._locks: Dict[MCPServerKey, asyncio.Lock] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats = {"created": 0, "reused": 0, "reconnected": 0, "evicted": 0, "unpooled": 0}
+
+    def _bind_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Sessions from a previous loop cannot be used or closed from this one
+            self._sessions.clear()
+            self._locks.clear()
+            self._reaper = None
+            self._loop = loop
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_idle(), name="mcp-session-reaper")
+
+    async def _reap_idle(self) -> None:
+        while True:
+            await asyncio.sleep(min(self.idle_timeout, 60.0))
+            now = time.monotonic()
+            for key, pooled in list(self._sessions.items()):
+                if pooled.in_flight == 0 and (not pooled.alive or now - pooled.last_used > self.idle_timeout):
+                    self._sessions.pop(key, None)
+                    self.stats["evicted"] += 1
+                    logger.debug(f"Evicting idle MCP session {key.target}")
+                    await pooled.close()
+            if not self._sessions:
+                self._reaper = None
+                return
+
+    def _sessions_for_target(self, key: MCPServerKey) -> List[PooledMCPSession]:
+        return [s for k, s in self._sessions.items() if k.transport == key.transport and k.target == key.target]
+
+    async def _make_room(self, key: MCPServerKey) -> bool:
+        """Evict the least recently used idle session for this server if it is at capacity."""
+        siblings = self._sessions_for_target(key)
+        if len(siblings) < self.max_sessions_per_server:
+            return True
+        idle = [s for s in siblings if s.in_flight == 0]
+        if not idle:
+            return False
+        victim = min(idle, key=lambda s: s.last_used)
+        self._sessions.pop(victim.key, None)
+        self.stats["evicted"] += 1
+        await victim.close()
+        return True
+
+    async def _get_session(self, transport: str, server_config: Dict[str, Any]) -> Optional[PooledMCPSession]:
+        self._bind_loop()
+        key = server_key(transport, server_config)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            pooled = self._sessions.get(key)
+            if pooled is not None:
+                stale = time.monotonic() - pooled.last_checked > self.health_check_interval
+                if pooled.alive and (not stale or await pooled.ping(timeout=5)):
+                    self.stats["reused"] += 1
+                    return pooled
+                self._sessions.pop(key, None)
+                self.stats["reconnected"] += 1
+                await pooled.close()
+
+            if not await self._make_room(key):
+                return None
+
+            pooled = PooledMCPSession(key, transport, server_config)
+            await pooled.start(self.connect_timeout)
+            self._sessions[key] = pooled
+            self.stats["created"] += 1
+            logger.debug(f"Opened pooled MCP session to {key.target} via {transport}")
+            return pooled
+
+    async def _discard(self, pooled: PooledMCPSession) -> None:
+        if self._sessions.get(pooled.key) is pooled:
+            self._sessions.pop(pooled.key, None)
+        await pooled.close()
+
+    @asynccontextmanager
+    async def session(self, transport: str, server_config: Dict[str, Any]) -> AsyncIterator[ClientSession]:
+        """Borrow a live session; falls back to a one-off session when the server is at capacity."""
+        pooled = await self._get_session(transport, server_config)
+        if pooled is None:
+            self.stats["unpooled"] += 1
+            async with _open_transport(transport, server_config) as streams:
+                async with ClientSession(streams[0], streams[1]) as session:
+                    await session.initialize()
+                    yield session
+            return
+
+        pooled.in_flight += 1
+        try:
+            yield pooled.session
+        except _CONNECTION_ERRORS:
+            await self._discard(pooled)
+            raise
+        finally:
+            pooled.in_flight -= 1
+            pooled.last_used = time.monotonic()
+
+    async def _run_with_reconnect(self, transport: str, server_config: Dict[str, Any], fn: Callable[[ClientSession], Any], timeout: float):
+        async with asyncio.timeout(timeout):
+            try:
+                async with self.session(transport, server_config) as session:
+                    return await fn(session)
+            except _CONNECTION_ERRORS as e:
+                logger.warning(f"MCP session to {server_key(transport, server_config).target} dropped ({e}); reconnecting")
+                self.stats["reconnected"] += 1
+                async with self.session(transport, server_config) as session:
+                    return await fn(session)
+
+    async def list_tools(self, transport: str, server_config: Dict[str, Any], timeout: float = 15) -> List[Any]:
+        async def _list(session: ClientSession):
+            result = await session.list_tools()
+            return result.tools if hasattr(result, 'tools') else result
+        return await self._run_with_reconnect(transport, server_config, _list, timeout)
+
+    async def call_tool(self, transport: str, server_config: Dict[str, Any], tool_name: str, arguments: Dict[str, Any], timeout: float = 30):
+        async def _call(session: ClientSession):
+            return await session.call_tool(tool_name, arguments)
+        return await self._run_with_reconnect(transport, server_config, _call, timeout)
+
+    async def close_all(self) -> None:
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        self._locks.clear()
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        await asyncio.gather(*(s.close() for s in sessions), return_exceptions=True)
+        if sessions:
+            logger.info(f"Closed {len(sessions)} pooled MCP sessions")
+
+
+mcp_session_pool = MCPSessionPool()
@@ -0,0 +1,154 @@
+"""
+Columnar aggregation engine for SandboxSheetsTool.
+
+Each target column is converted to a typed ``array('d')`` in exactly one pass
+over the rows; every requested aggregation is then computed from that array
+with C-level builtins (``len``/``math.fsum``/``min``/``max``/``sorted``/``set``).
+Order statistics share a single sort per column.
+
+Group-by is hash-based: rows are mapped to dense group ids in one pass, and
+each column's conversion pass scatters values straight into per-group typed
+arrays, so rows are never copied into per-group lists.
+"""
+
+from __future__ import annotations
+
+import math
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_AGGREGATIONS = ["count", "sum", "avg", "min", "max"]
+PERCENTILE_AGGREGATIONS = ["p25", "p50", "p75", "p90", "p95", "p99"]
+SUPPORTED_AGGREGATIONS = DEFAULT_AGGREGATIONS + ["median", "std", "distinct_count"] + PERCENTILE_AGGREGATIONS
+
+_ORDER_AGGREGATIONS = {"median", *PERCENTILE_AGGREGATIONS}
+
+
+def validate_aggregations(aggregations: Optional[Sequence[str]]) -> List[str]:
+    aggs = list(aggregations or DEFAULT_AGGREGATIONS)
+    unknown = [a for a in aggs if a not in SUPPORTED_AGGREGATIONS]
+    if unknown:
+        raise ValueError(f"Unsupported aggregations: {', '.join(unknown)}")
+    return aggs
+
+
+def _percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Linear-interpolated percentile of a non-empty sorted sequence (q in [0, 1])."""
+    pos = (len(sorted_values) - 1) * q
+    lo = math.floor(pos)
+    hi = math.ceil(pos)
+    if lo == hi:
+        return sorted_values[lo]
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def to_column_array(rows: Sequence[Sequence[Any]], c_idx: int) -> array:
+    """Convert one column to a typed float array, skipping non-numeric cells.
+
+    NaN and infinite values ("nan"/"inf" strings included) are skipped too, as
+    the sandbox runner (sheet_analytics.py) does; one of them would poison
+    sum/avg and the order statistics.
+    """
+    values = array("d")
+    append = values.append
+    isfinite = math.isfinite
+    for r in rows:
+        if len(r) > c_idx:
+            v = r[c_idx]
+            if v.__class__ is not float:
+                # float() accepts ints, numeric strings and surrounding whitespace
+                try:
+                    v = float(v)
+                except (TypeError, ValueError):
+                    continue
+            if isfinite(v):
+                append(v)
+    return values
+
+
+def summarize(values: array, aggregations: Sequence[str]) -> Dict[str, Any]:
+    """Compute every requested aggregation from an already-typed column."""
+    count = len(values)
+    result: Dict[str, Any] = {}
+    if count == 0:
+        for agg in aggregations:
+            result[agg] = 0 if agg in ("count", "distinct_count") else None
+        return result
+
+    total = math.fsum(values)
+    mean = total / count
+    ordered = sorted(values) if any(a in _ORDER_AGGREGATIONS for a in aggregations) else None
+    for agg in aggregations:
+        if agg == "count":
+            result[agg] = count
+        elif agg == "sum":
+            result[agg] = total
+        elif agg == "avg":
+            result[agg] = mean
+        elif agg == "min":
+            result[agg] = ordered[0] if ordered is not None else min(values)
+        elif agg == "max":
+            result[agg] = ordered[-1] if ordered is not None else max(values)
+        elif agg == "std":
+            result[agg] = math.sqrt(math.fsum([(v - mean) * (v - mean) for v in values]) / count)
+        elif agg == "distinct_count":
+            result[agg] = len(set(values))
+        elif agg == "median":
+            result[agg] = _percentile(ordered, 0.5)
+        else:
+            result[agg] = _percentile(ordered, int(agg[1:]) / 100.0)
+    return result
+
+
+def aggregate_column(rows: Sequence[Sequence[Any]], c_idx: int, aggregations: Sequence[str]) -> Dict[str, Any]:
+    return summarize(to_column_array(rows, c_idx), aggregations)
+
+
+@dataclass
+class GroupedAggregation:
+    keys: List[Any] = field(default_factory=list)
+    # column name -> one result dict per group, aligned with ``keys``
+    columns: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
+
+
+def assign_groups(rows: Sequence[Sequence[Any]], g_idx: int) -> Tuple[List[Any], array]:
+    """Map every row to a dense group id (first-appearance order) without copying rows."""
+    index: Dict[Any, int] = {}
+    keys: List[Any] = []
+    group_ids = array("l")
+    append = group_ids.append
+    for row in rows:
+        key = row[g_idx] if len(row) > g_idx else None
+        gid = index.get(key)
+        if gid is None:
+            gid = len(keys)
+            index[key] = gid
+            keys.append(key)
+        append(gid)
+    return keys, group_ids
+
+
+def aggregate_grouped(
+    rows: Sequence[Sequence[Any]],
+    g_idx: int,
+    columns: Dict[str, int],
+    aggregations: Sequence[str],
+) -> GroupedAggregation:
+    keys, group_ids = assign_groups(rows, g_idx)
+    result = GroupedAggregation(keys=keys)
+    isfinite = math.isfinite
+    for name, c_idx in columns.items():
+        buckets = [array("d") for _ in keys]
+        for gid, r in zip(group_ids, rows):
+            if len(r) > c_idx:
+                v = r[c_idx]
+                if v.__class__ is not float:
+                    try:
+                        v = float(v)
+                    except (TypeError, ValueError):
+                        continue
+                if isfinite(v):
+                    buckets[gid].append(v)
+        result.columns[name] = [summarize(bucket, aggregations) for bucket in buckets]
+    return result
@@ -0,0 +1,209 @@
+"""
+Standalone spreadsheet analytics runner shipped into the sandbox.
+
+SandboxSheetsTool uploads this file into the sandbox and executes it with a
+base64-encoded JSON spec, so large CSV/XLSX files are parsed and aggregated
+next to the data with pandas instead of being downloaded into the API worker.
+Only a compact JSON summary is written to stdout.
+
+This module must not import anything from the backend; it runs with the
+sandbox image's Python (pandas, numpy, openpyxl).
+
+Usage:
+    python3 sheet_analytics.py <base64-json-spec>
+"""
+
+import base64
+import json
+import math
+import sys
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_AGGREGATIONS = ["count", "sum", "avg", "min", "max"]
+PREVIEW_ROWS = 50
+
+
+def _load_frame(path, sheet_name=None):
+    if path.lower().endswith(".csv"):
+        # Keep raw strings (like the local CSV reader) and coerce per column later
+        return pd.read_csv(path, dtype=str, keep_default_na=False, encoding_errors="replace")
+    if path.lower().endswith(".xlsx"):
+        return pd.read_excel(path, sheet_name=sheet_name or 0, engine="openpyxl")
+    raise ValueError("Unsupported file extension. Use .csv or .xlsx")
+
+
+def _clean(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    if hasattr(value, "item"):
+        value = value.item()
+        if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+            return None
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _aggregate(series, agg):
+    if agg == "count":
+        return int(series.count())
+    if agg == "distinct_count":
+        return int(series.nunique())
+    if series.count() == 0:
+        return None
+    if agg == "sum":
+        return series.sum()
+    if agg == "avg":
+        return series.mean()
+    if agg == "min":
+        return series.min()
+    if agg == "max":
+        return series.max()
+    if agg == "median":
+        return series.median()
+    if agg == "std":
+        return series.std(ddof=0)
+    if agg.startswith("p") and agg[1:].isdigit():
+        return series.quantile(int(agg[1:]) / 100.0)
+    raise ValueError(f"Unsupported aggregation: {agg}")
+
+
+def analyze(spec):
+    df = _load_frame(spec["path"], spec.get("sheet_name"))
+    headers = [str(c) for c in df.columns]
+    df.columns = headers
+    target_columns = [c for c in (spec.get("target_columns") or headers) if c in headers]
+    aggregations = spec.get("aggregations") or DEFAULT_AGGREGATIONS
+    group_by = spec.get("group_by")
+
+    # to_numeric keeps +-inf; skip it like NaN, as the local engine does
+    numeric = {
+        col: pd.to_numeric(df[col], errors="coerce").replace([np.inf, -np.inf], np.nan)
+        for col in target_columns
+    }
+
+    if group_by and group_by in headers:
+        out_headers = [group_by] + [f"{col}_{agg}" for col in target_columns for agg in aggregations]
+        keys = df[group_by].where(df[group_by].notna(), None)
+        frame = pd.DataFrame(numeric)
+        frame["__group__"] = keys
+        grouped = frame.groupby("__group__", sort=False, dropna=False)
+        rows = []
+        for key, group in grouped:
+            row = [key]
+            for col in target_columns:
+                for agg in aggregations:
+                    row.append(_aggregate(group[col], agg))
+            rows.append(row)
+    else:
+        out_headers = ["metric"] + target_columns
+        rows = [[agg] + [_aggregate(numeric[col], agg) for col in target_columns] for agg in aggregations]
+
+    rows = [[_clean(v) for v in row] for row in rows]
+
+    exported = None
+    if spec.get("export_csv_path"):
+        pd.DataFrame(rows, columns=out_headers).to_csv(spec["export_csv_path"], index=False)
+        exported = spec["export_csv_path"]
+
+    return {
+        "row_count": int(len(df)),
+        "headers": out_headers,
+        "rows": rows[:PREVIEW_ROWS],
+        "exported_csv": exported,
+    }
+
+
+def visualize(spec):
+    from openpyxl import Workbook
+    from openpyxl.chart import BarChart, LineChart, PieChart, Reference, Series, ScatterChart
+
+    df = _load_frame(spec["path"], spec.get("sheet_name"))
+    df.columns = [str(c) for c in df.columns]
+    headers = list(df.columns)
+    x_column = spec["x_column"]
+    y_columns = spec["y_columns"]
+    chart_type = spec.get("chart_type", "bar")
+
+    if x_column not in headers:
+        raise ValueError(f"x_column '{x_column}' not found")
+    for yc in y_columns:
+        if yc not in headers:
+            raise ValueError(f"y_column '{yc}' not found")
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=spec.get("sheet_name") or "Data")
+    ws.append(headers)
+    for record in df.itertuples(index=False, name=None):
+        ws.append([_clean(v) for v in record])
+
+    if chart_type == "bar":
+        chart = BarChart()
+    elif chart_type == "line":
+        chart = LineChart()
+    elif chart_type == "pie":
+        chart = PieChart()
+    else:
+        chart = ScatterChart()
+
+    x_col_idx = headers.index(x_column) + 1
+    y_col_indices = [headers.index(c) + 1 for c in y_columns]
+    min_row = 2
+    max_row = len(df) + 1
+    x_ref = Reference(ws, min_col=x_col_idx, min_row=min_row, max_row=max_row)
+
+    if chart_type == "pie" and len(y_col_indices) == 1:
+        data_ref = Reference(ws, min_col=y_col_indices[0], min_row=1, max_row=max_row)
+        chart.add_data(data_ref, titles_from_data=True)
+        chart.set_categories(x_ref)
+    else:
+        for yci in y_col_indices:
+            data_ref = Reference(ws, min_col=yci, min_row=min_row - 1, max_row=max_row)
+            series = Series(data_ref, title_from_data=True)
+            series.category = x_ref
+            if isinstance(chart, ScatterChart):
+                series.xvalues = x_ref
+            chart.series.append(series)
+
+    chart_ws = wb.create_sheet(title=f"Chart_{chart_type}")
+    chart_ws.add_chart(chart, "A1")
+    wb.save(spec["target_path"])
+
+    df[[x_column] + y_columns].to_csv(spec["csv_path"], index=False)
+
+    return {
+        "row_count": int(len(df)),
+        "chart_saved": spec["target_path"],
+        "chart_data_csv": spec["csv_path"],
+    }
+
+
+OPERATIONS = {
+    "analyze": analyze,
+    "visualize": visualize,
+}
+
+
+def main(argv):
+    if len(argv) != 2:
+        print(json.dumps({"success": False, "error": "usage: sheet_analytics.py <base64-json-spec>"}))
+        return 2
+    try:
+        spec = json.loads(base64.b64decode(argv[1]).decode("utf-8"))
+        operation = OPERATIONS.get(spec.get("operation"))
+        if operation is None:
+            raise ValueError(f"Unsupported operation: {spec.get('operation')}")
+        result = operation(spec)
+        print(json.dumps({"success": True, "result": result}, default=str))
+        return 0
+    except Exception as e:
+        print(json.dumps({"success": False, "error": f"{type(e).__name__}: {e}"}))
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,10 +1,14 @@
 from tavily import AsyncTavilyClient
 import httpx
+from daytona_sdk import FileUpload
 from dotenv import load_dotenv
 from agentpress.tool import Tool, ToolResult, openapi_schema, usage_example
 from utils.config import config
+from utils.cache import Cache
 from sandbox.tool_base import SandboxToolsBase
 from agentpress.thread_manager import ThreadManager
+from services import http_client
+import hashlib
 import json
 import os
 import datetime
@@ -13,6 +17,23 @@ import logging
 
 # TODO: add subpages, etc... in filters as sometimes its necessary 
 
+# Max concurrent Firecrawl requests for a single multi-URL scrape
+MAX_CONCURRENT_SCRAPES = 5
+# Recently scraped URLs are served from cache instead of hitting Firecrawl again
+SCRAPE_CACHE_TTL = 10 * 60
+FIRECRAWL_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+_tavily_clients: dict = {}
+
+
+def get_tavily_client(api_key: str) -> AsyncTavilyClient:
+    """Process-wide Tavily client; the SDK manages its own per-request connections."""
+    client = _tavily_clients.get(api_key)
+    if client is None:
+        client = AsyncTavilyClient(api_key=api_key)
+        _tavily_clients[api_key] = client
+    return client
+
 class SandboxWebSearchTool(SandboxToolsBase):
     """Tool for performing web searches using Tavily API and web scraping using Firecrawl."""
 
@@ -30,8 +51,8 @@ class SandboxWebSearchTool(SandboxToolsBase):
         if not self.firecrawl_api_key:
             raise ValueError("FIRECRAWL_API_KEY not found in configuration")
 
-        # Tavily asynchronous search client
-        self.tavily_client = AsyncTavilyClient(api_key=self.tavily_api_key)
+        # Tavily asynchronous search client, shared across tool instances
+        self.tavily_client = get_tavily_client(self.tavily_api_key)
 
     @openapi_schema({
         "type": "function",
@@ -195,28 +216,31 @@ class SandboxWebSearchTool(SandboxToolsBase):
             if len(url_list) == 1:
                 logging.warning("Only a single URL provided - for efficiency you should scrape multiple URLs at once")
             
+            # Drop duplicate URLs while keeping the caller's order
+            url_list = list(dict.fromkeys(url_list))
             logging.info(f"Processing {len(url_list)} URLs: {url_list}")
             
-            # Process each URL concurrently and collect results
-            tasks = [self._scrape_single_url(url) for url in url_list]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+            # Fetch all URLs concurrently over the pooled client, bounded by a semaphore
+            semaphore = asyncio.Semaphore(MAX_CONCURRENT_SCRAPES)
+            tasks = [self._scrape_single_url(url, semaphore) for url in url_list]
+            fetched = await asyncio.gather(*tasks, return_exceptions=True)
 
             # Process results, handling exceptions
-            processed_results = []
-            for i, result in enumerate(results):
+            results = []
+            for i, result in enumerate(fetched):
                 if isinstance(result, Exception):
                     logging.error(f"Error processing URL {url_list[i]}: {str(result)}")
-                    processed_results.append({
+                    results.append({
                         "url": url_list[i],
                         "success": False,
                         "error": str(result)
                     })
                 else:
-                    processed_results.append(result)
-            
-            results = processed_results
+                    results.append(result)
+
+            # Write every scraped page to the sandbox in a single batched upload
+            await self._save_scrape_results(results)
 
-            
             # Summarize results
             successful = sum(1 for r in results if r.get("success", False))
             failed = len(results) - successful
@@ -250,111 +274,56 @@ class SandboxWebSearchTool(SandboxToolsBase):
             logging.error(f"Error in scrape_webpage: {error_message}")
             return self.fail_response(f"Error processing scrape request: {error_message[:200]}")
     
-    async def _scrape_single_url(self, url: str) -> dict:
+    async def _scrape_single_url(self, url: str, semaphore: asyncio.Semaphore) -> dict:
         """
         Helper function to scrape a single URL and return the result information.
+
+        The scraped page is attached under ``content``; files are written later
+        by ``_save_scrape_results`` in one batch.
         """
-        
-        # # Add protocol if missing
-        # if not (url.startswith('http://') or url.startswith('https://')):
-        #     url = 'https://' + url
-        #     logging.info(f"Added https:// protocol to URL: {url}")
-            
         logging.info(f"Scraping single URL: {url}")
         
         try:
-            # ---------- Firecrawl scrape endpoint ----------
-            logging.info(f"Sending request to Firecrawl for URL: {url}")
-            async with httpx.AsyncClient() as client:
-                headers = {
-                    "Authorization": f"Bearer {self.firecrawl_api_key}",
-                    "Content-Type": "application/json",
-                }
-                payload = {
+            cache_key = f"scrape:{hashlib.sha256(url.encode()).hexdigest()}"
+            formatted_result = None
+            try:
+                formatted_result = await Cache.get(cache_key)
+            except Exception as cache_err:
+                logging.warning(f"Scrape cache read failed for {url}: {cache_err}")
+
+            if formatted_result is not None:
+                logging.info(f"Using recently scraped content for {url}")
+            else:
+                async with semaphore:
+                    data = await self._firecrawl_scrape(url)
+
+                # Format the response
+                title = data.get("data", {}).get("metadata", {}).get("title", "")
+                markdown_content = data.get("data", {}).get("markdown", "")
+                logging.info(f"Extracted content from {url}: title='{title}', content length={len(markdown_content)}")
+                
+                formatted_result = {
+                    "title": title,
                     "url": url,
-                    "formats": ["markdown"]
+                    "text": markdown_content
                 }
                 
-                # Use longer timeout and retry logic for more reliability
-                max_retries = 3
-                timeout_seconds = 30
-                retry_count = 0
-                
-                while retry_count < max_retries:
-                    try:
-                        logging.info(f"Sending request to Firecrawl (attempt {retry_count + 1}/{max_retries})")
-                        response = await client.post(
-                            f"{self.firecrawl_url}/v1/scrape",
-                            json=payload,
-                            headers=headers,
-                            timeout=timeout_seconds,
-                        )
-                        response.raise_for_status()
-                        data = response.json()
-                        logging.info(f"Successfully received response from Firecrawl for {url}")
-                        break
-                    except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.ReadError) as timeout_err:
-                        retry_count += 1
-                        logging.warning(f"Request timed out (attempt {retry_count}/{max_retries}): {str(timeout_err)}")
-                        if retry_count >= max_retries:
-                            raise Exception(f"Request timed out after {max_retries} attempts with {timeout_seconds}s timeout")
-                        # Exponential backoff
-                        logging.info(f"Waiting {2 ** retry_count}s before retry")
-                        await asyncio.sleep(2 ** retry_count)
-                    except Exception as e:
-                        # Don't retry on non-timeout errors
-                        logging.error(f"Error during scraping: {str(e)}")
-                        raise e
+                # Add metadata if available
+                if "metadata" in data.get("data", {}):
+                    formatted_result["metadata"] = data["data"]["metadata"]
+                    logging.info(f"Added metadata: {data['data']['metadata'].keys()}")
 
-            # Format the response
-            title = data.get("data", {}).get("metadata", {}).get("title", "")
-            markdown_content = data.get("data", {}).get("markdown", "")
-            logging.info(f"Extracted content from {url}: title='{title}', content length={len(markdown_content)}")
-            
-            formatted_result = {
-                "title": title,
-                "url": url,
-                "text": markdown_content
-            }
-            
-            # Add metadata if available
-            if "metadata" in data.get("data", {}):
-                formatted_result["metadata"] = data["data"]["metadata"]
-                logging.info(f"Added metadata: {data['data']['metadata'].keys()}")
-            
-            # Create a simple filename from the URL domain and date
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # Extract domain from URL for the filename
-            from urllib.parse import urlparse
-            parsed_url = urlparse(url)
-            domain = parsed_url.netloc.replace("www.", "")
-            
-            # Clean up domain for filename
-            domain = "".join([c if c.isalnum() else "_" for c in domain])
-            safe_filename = f"{timestamp}_{domain}.json"
-            
-            logging.info(f"Generated filename: {safe_filename}")
-            
-            # Save results to a file in the /workspace/scrape directory
-            scrape_dir = f"{self.workspace_path}/scrape"
-            await self.sandbox.fs.create_folder(scrape_dir, "755")
-            
-            results_file_path = f"{scrape_dir}/{safe_filename}"
-            json_content = json.dumps(formatted_result, ensure_ascii=False, indent=2)
-            logging.info(f"Saving content to file: {results_file_path}, size: {len(json_content)} bytes")
-            
-            await self.sandbox.fs.upload_file(
-                json_content.encode(),
-                results_file_path,
-            )
+                try:
+                    await Cache.set(cache_key, formatted_result, ttl=SCRAPE_CACHE_TTL)
+                except Exception as cache_err:
+                    logging.warning(f"Scrape cache write failed for {url}: {cache_err}")
             
             return {
                 "url": url,
                 "success": True,
-                "title": title,
-                "file_path": results_file_path,
-                "content_length": len(markdown_content)
+                "title": formatted_result.get("title", ""),
+                "content_length": len(formatted_result.get("text", "")),
+                "content": formatted_result
             }
         
         except Exception as e:
@@ -368,6 +337,101 @@ class SandboxWebSearchTool(SandboxToolsBase):
                 "error": error_message
             }
 
+    async def _firecrawl_scrape(self, url: str) -> dict:
+        """Call the Firecrawl scrape endpoint over the shared keep-alive client."""
+        logging.info(f"Sending request to Firecrawl for URL: {url}")
+        client = http_client.get_client("firecrawl", timeout=FIRECRAWL_TIMEOUT)
+        headers = {
+            "Authorization": f"Bearer {self.firecrawl_api_key}",
+            "Content-Type": "application/json",
+        }
+        payload = {
+            "url": url,
+            "formats": ["markdown"]
+        }
+        
+        # Retry timeouts with exponential backoff
+        max_retries = 3
+        retry_count = 0
+        
+        while True:
+            try:
+                logging.info(f"Sending request to Firecrawl (attempt {retry_count + 1}/{max_retries})")
+                response = await client.post(
+                    f"{self.firecrawl_url}/v1/scrape",
+                    json=payload,
+                    headers=headers,
+                )
+                response.raise_for_status()
+                logging.info(f"Successfully received response from Firecrawl for {url}")
+                return response.json()
+            except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.ReadError) as timeout_err:
+                retry_count += 1
+                logging.warning(f"Request timed out (attempt {retry_count}/{max_retries}): {str(timeout_err)}")
+                if retry_count >= max_retries:
+                    raise Exception(f"Request timed out after {max_retries} attempts")
+                logging.info(f"Waiting {2 ** retry_count}s before retry")
+                await asyncio.sleep(2 ** retry_count)
+            except Exception as e:
+                # Don't retry on non-timeout errors
+                logging.error(f"Error during scraping: {str(e)}")
+                raise e
+
+    async def _save_scrape_results(self, results: list) -> None:
+        """Write all successful scrape results to /workspace/scrape with one upload.
+
+        Pages with identical content (e.g. redirects to the same article) share a file.
+        """
+        from urllib.parse import urlparse
+
+        scrape_dir = f"{self.workspace_path}/scrape"
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        uploads = []
+        paths_by_hash = {}
+        used_names = set()
+
+        for result in results:
+            content = result.pop("content", None)
+            if not result.get("success") or content is None:
+                continue
+
+            json_content = json.dumps(content, ensure_ascii=False, indent=2)
+            content_hash = hashlib.sha256(content.get("text", "").encode()).hexdigest()
+            if content.get("text") and content_hash in paths_by_hash:
+                result["file_path"] = paths_by_hash[content_hash]
+                continue
+
+            # Create a simple filename from the URL domain and date
+            domain = urlparse(result["url"]).netloc.replace("www.", "")
+            domain = "".join([c if c.isalnum() else "_" for c in domain])
+            safe_filename = f"{timestamp}_{domain}.json"
+            suffix = 1
+            while safe_filename in used_names:
+                suffix += 1
+                safe_filename = f"{timestamp}_{domain}_{suffix}.json"
+            used_names.add(safe_filename)
+
+            results_file_path = f"{scrape_dir}/{safe_filename}"
+            logging.info(f"Saving content to file: {results_file_path}, size: {len(json_content)} bytes")
+            uploads.append(FileUpload(source=json_content.encode(), destination=results_file_path))
+            paths_by_hash[content_hash] = results_file_path
+            result["file_path"] = results_file_path
+
+        if not uploads:
+            return
+
+        await self.sandbox.fs.create_folder(scrape_dir, "755")
+        try:
+            await self.sandbox.fs.upload_files(uploads)
+        except Exception as e:
+            error_message = f"Failed to save scraped content: {e}"
+            logging.error(error_message)
+            for result in results:
+                if result.get("file_path"):
+                    result.pop("file_path")
+                    result["success"] = False
+                    result["error"] = error_message
+
 if __name__ == "__main__":
     async def test_web_search():
         """Test function for the web search tool"""
@@ -21,6 +21,7 @@ from agentpress.response_processor import (
     ProcessorConfig
 )
 from services.supabase import DBConnection
+from services import usage_ledger
 from utils.logger import logger
 from langfuse.client import StatefulGenerationClient, StatefulTraceClient
 from services.langfuse import langfuse
@@ -30,6 +31,9 @@ from litellm.utils import token_counter
 # Type alias for tool choice
 ToolChoice = Literal["auto", "required", "none"]
 
+# Message types that feed the per-iteration temporary message (browser state, viewed images)
+TEMPORARY_CONTEXT_TYPES = ("browser_state", "image_context")
+
 class ThreadManager:
     """Manages conversation threads with LLM models and tool execution.
 
@@ -64,6 +68,11 @@ class ThreadManager:
             agent_config=self.agent_config
         )
         self.context_manager = ContextManager()
+        self._temporary_context_versions: Dict[str, int] = {}
+
+    def get_temporary_context_version(self, thread_id: str) -> int:
+        """Counter bumped whenever a tool writes browser state or image context for the thread."""
+        return self._temporary_context_versions.get(thread_id, 0)
 
     def add_tool(self, tool_class: Type[Tool], function_names: Optional[List[str]] = None, **kwargs):
         """Add a tool to the ThreadManager."""
@@ -168,6 +177,16 @@ class ThreadManager:
             result = await client.table('messages').insert(data_to_insert).execute()
             logger.info(f"Successfully added message to thread {thread_id}")
 
+            if type in TEMPORARY_CONTEXT_TYPES:
+                self._temporary_context_versions[thread_id] = self.get_temporary_context_version(thread_id) + 1
+
+            if type == 'assistant_response_end' and isinstance(content, dict):
+                try:
+                    await usage_ledger.record_response_end(client, thread_id, content)
+                except Exception as e:
+                    # Reconciliation picks up the missed increment
+                    logger.warning(f"Failed to record usage for thread {thread_id}: {str(e)}")
+
             if result.data and len(result.data) > 0 and isinstance(result.data[0], dict) and 'message_id' in result.data[0]:
                 return result.data[0]
             else:
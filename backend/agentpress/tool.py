@@ -7,7 +7,7 @@ This module defines the base classes and decorators for creating tools in AgentP
 - Result containers for standardized tool outputs
 """
 
-from typing import Dict, Any, Union, Optional, List
+from typing import Dict, Any, Union, Optional, List, ClassVar
 from dataclasses import dataclass, field
 from abc import ABC
 import json
@@ -53,18 +53,49 @@ class Tool(ABC):
         
     Methods:
         get_schemas: Get all registered tool schemas
+        get_class_schemas: Get the schemas declared on the tool class
         success_response: Create a successful result
         fail_response: Create a failed result
     """
     
+    # Schemas are collected once per class and shared by its instances. Tools
+    # that build schemas per instance (e.g. dynamic MCP tools) set this to False.
+    cache_schemas: ClassVar[bool] = True
+    _class_schemas: ClassVar[Optional[Dict[str, List[ToolSchema]]]] = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Each subclass collects its own schemas instead of inheriting its parent's
+        cls._class_schemas = None
+
     def __init__(self):
         """Initialize tool with empty schema registry."""
         self._schemas: Dict[str, List[ToolSchema]] = {}
         logger.debug(f"Initializing tool class: {self.__class__.__name__}")
         self._register_schemas()
 
+    @classmethod
+    def get_class_schemas(cls) -> Dict[str, List[ToolSchema]]:
+        """Get schemas of all decorated methods of the class, collected once.
+        
+        Returns:
+            Dict mapping method names to their schema definitions
+        """
+        if cls._class_schemas is None:
+            schemas = {}
+            for name, func in inspect.getmembers(cls, predicate=inspect.isfunction):
+                if hasattr(func, 'tool_schemas'):
+                    schemas[name] = func.tool_schemas
+            cls._class_schemas = schemas
+            logger.debug(f"Collected {len(schemas)} method schemas for {cls.__name__}")
+        return cls._class_schemas
+
     def _register_schemas(self):
         """Register schemas from all decorated methods."""
+        if self.cache_schemas:
+            self._schemas.update(self.get_class_schemas())
+            return
+
         for name, method in inspect.getmembers(self, predicate=inspect.ismethod):
             if hasattr(method, 'tool_schemas'):
                 self._schemas[name] = method.tool_schemas
@@ -110,11 +110,16 @@ class ToolRegistry:
             Dict mapping function names to their usage examples
         """
         examples = {}
+        # Several functions usually share one tool instance
+        instance_schemas = {}
         
         # Get all registered tools and their schemas
         for tool_name, tool_info in self.tools.items():
             tool_instance = tool_info['instance']
-            all_schemas = tool_instance.get_schemas()
+            all_schemas = instance_schemas.get(id(tool_instance))
+            if all_schemas is None:
+                all_schemas = tool_instance.get_schemas()
+                instance_schemas[id(tool_instance)] = all_schemas
             
             # Look for usage examples for this function
             if tool_name in all_schemas:
@@ -13,8 +13,10 @@ from datetime import datetime, timezone
 from utils.config import config, EnvMode
 import asyncio
 from utils.logger import logger, structlog
+from utils import request_cache
 import time
-from collections import OrderedDict
+import math
+import re
 import os
 
 from pydantic import BaseModel
@@ -30,6 +32,8 @@ import sys
 from services import email_api
 from triggers import api as triggers_api
 from services import api_keys_api
+from services import rate_limit
+from services.rate_limit import RateLimit
 
 
 if sys.platform == "win32":
@@ -39,9 +43,25 @@ if sys.platform == "win32":
 db = DBConnection()
 instance_id = "single"
 
-# Rate limiter state
-ip_tracker = OrderedDict()
-MAX_CONCURRENT_IPS = 25
+# Token-bucket limits per route, counted per API key, account and client IP.
+# Starting a run through either endpoint draws from the same bucket.
+RATE_LIMITED_ROUTES = [
+    ("POST", re.compile(r"^/api/agent/initiate$"), "agent_start"),
+    ("POST", re.compile(r"^/api/thread/[^/]+/agent/start$"), "agent_start"),
+    ("GET", re.compile(r"^/api/agent-run/[^/]+/stream$"), "agent_stream"),
+]
+RATE_LIMITS = {
+    "agent_start": {
+        "api_key": RateLimit(30, 60, burst=10),
+        "account": RateLimit(60, 60, burst=20),
+        "ip": RateLimit(60, 60, burst=20),
+    },
+    "agent_stream": {
+        "api_key": RateLimit(120, 60, burst=30),
+        "account": RateLimit(240, 60, burst=60),
+        "ip": RateLimit(240, 60, burst=60),
+    },
+}
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -66,6 +86,14 @@ async def lifespan(app: FastAPI):
             logger.error(f"Failed to initialize Redis connection: {e}")
             # Continue without Redis - the application will handle Redis failures gracefully
         
+        # Load feature flags into memory and watch for changes
+        from flags.flags import get_flag_manager
+        await get_flag_manager().start()
+        
+        # Flush buffered API key usage in bulk
+        from services import api_key_usage
+        api_key_usage.start_flush_loop()
+        
         # Start background tasks
         # asyncio.create_task(agent_api.restore_running_agent_runs())
         
@@ -81,6 +109,24 @@ async def lifespan(app: FastAPI):
         logger.info("Cleaning up agent resources")
         await agent_api.cleanup()
         
+        # Close pooled outbound HTTP clients
+        from services import http_client
+        await http_client.close()
+
+        # Close pooled MCP client sessions
+        from agent.tools.utils.mcp_session_pool import mcp_session_pool
+        await mcp_session_pool.close_all()
+
+        # Stop the cache invalidation listener and flag watcher before Redis goes away
+        from utils.cache import Cache
+        logger.info(f"Cache stats: {Cache.stats()}")
+        await Cache.close()
+        logger.info(f"Feature flag evaluations: {get_flag_manager().get_evaluation_counts()}")
+        await get_flag_manager().stop()
+
+        # Write API key usage buffered since the last flush
+        await api_key_usage.stop_flush_loop()
+
         # Clean up Redis connection
         try:
             logger.info("Closing Redis connection")
@@ -121,7 +167,11 @@ async def log_requests_middleware(request: Request, call_next):
     logger.info(f"Request started: {method} {path} from {client_ip} | Query: {query_params}")
     
     try:
-        response = await call_next(request)
+        # Subscription, tier and usage lookups resolve at most once per request
+        with request_cache.request_scope():
+            response = await _check_rate_limit(request, client_ip)
+            if response is None:
+                response = await call_next(request)
         process_time = time.time() - start_time
         logger.debug(f"Request completed: {method} {path} | Status: {response.status_code} | Time: {process_time:.2f}s")
         return response
@@ -130,6 +180,44 @@ async def log_requests_middleware(request: Request, call_next):
         logger.error(f"Request failed: {method} {path} | Error: {str(e)} | Time: {process_time:.2f}s")
         raise
 
+async def _check_rate_limit(request: Request, client_ip: str):
+    """429 response when the request is over its route's limits, else None."""
+    bucket = next(
+        (bucket for method, pattern, bucket in RATE_LIMITED_ROUTES
+         if request.method == method and pattern.match(request.url.path)),
+        None,
+    )
+    if bucket is None:
+        return None
+
+    from utils.auth_utils import get_rate_limit_identity
+    limits = RATE_LIMITS[bucket]
+    identity = await get_rate_limit_identity(request)
+    identity["ip"] = client_ip
+    scopes = [(scope, identity[scope], limit) for scope, limit in limits.items() if identity.get(scope)]
+
+    try:
+        exceeded = await rate_limit.check(bucket, scopes)
+    except Exception as e:
+        # Redis trouble shouldn't take the endpoints down with it
+        logger.warning(f"Rate limit check failed for {request.url.path}: {e}")
+        return None
+    if exceeded is None:
+        return None
+
+    scope, retry_after = exceeded
+    retry_after = max(1, math.ceil(retry_after))
+    if "api_key" in identity:
+        from services import api_key_usage
+        logger.warning(f"Rate limit '{bucket}' exceeded per {scope} (API key {identity['api_key']} at {api_key_usage.request_rate(identity['api_key']):.2f} req/s in this process)")
+    else:
+        logger.warning(f"Rate limit '{bucket}' exceeded per {scope}")
+    return JSONResponse(
+        status_code=429,
+        content={"detail": f"Too many requests, retry in {retry_after} seconds"},
+        headers={"Retry-After": str(retry_after)},
+    )
+
 # Define allowed origins based on environment
 allowed_origins = ["https://www.suna.so", "https://suna.so"]
 allow_origin_regex = None
@@ -161,6 +249,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["Content-Type", "Authorization", "X-Project-Id", "X-MCP-URL", "X-MCP-Type", "X-MCP-Headers", "X-Refresh-Token", "X-API-Key"],
+    expose_headers=["Retry-After"],
 )
 # Create a main API router
 api_router = APIRouter()
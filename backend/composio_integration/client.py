@@ -1,20 +1,25 @@
 import os
-from typing import Optional
-from composio_client import Composio
+from typing import TYPE_CHECKING, Optional
 from utils.logger import logger
 
+if TYPE_CHECKING:
+    from composio_client import Composio
+
 
 class ComposioClient:
-    _instance: Optional[Composio] = None
+    _instance: Optional["Composio"] = None
     
     @classmethod
-    def get_client(cls, api_key: Optional[str] = None) -> Composio:
+    def get_client(cls, api_key: Optional[str] = None) -> "Composio":
         if cls._instance is None:
             if not api_key:
                 api_key = os.getenv("COMPOSIO_API_KEY")
                 if not api_key:
                     raise ValueError("COMPOSIO_API_KEY is required")
             
+            # The SDK is only imported once a Composio route is actually used
+            from composio_client import Composio
+
             logger.info("Initializing Composio client")
             cls._instance = Composio(api_key=api_key)
         
@@ -25,5 +30,5 @@ class ComposioClient:
         cls._instance = None
 
 
-def get_composio_client(api_key: Optional[str] = None) -> Composio:
+def get_composio_client(api_key: Optional[str] = None) -> "Composio":
     return ComposioClient.get_client(api_key) 
\ No newline at end of file
@@ -1,6 +1,5 @@
 import os
 from typing import Optional, List, Dict, Any
-from composio_client import Composio
 from utils.logger import logger
 from pydantic import BaseModel
 from services.supabase import DBConnection
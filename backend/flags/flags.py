@@ -1,6 +1,8 @@
+import asyncio
 import json
 import logging
 import os
+from collections import Counter, defaultdict
 from datetime import datetime
 from typing import Dict, List, Optional
 import sys
@@ -10,11 +12,82 @@ from services import redis
 
 logger = logging.getLogger(__name__)
 
+# Change notifications published by set_flag/delete_flag
+FLAG_CHANNEL = "feature_flags:changed"
+# Safety net for missed notifications
+FLAG_POLL_INTERVAL_SECONDS = 60
+
+
 class FeatureFlagManager:
     def __init__(self):
         """Initialize with existing Redis service"""
         self.flag_prefix = "feature_flag:"
         self.flag_list_key = "feature_flags:list"
+        # In-process copy of every flag; None until first loaded from Redis
+        self._snapshot: Optional[Dict[str, Dict[str, str]]] = None
+        self._evaluations: Dict[str, Counter] = defaultdict(Counter)
+        self._watcher: Optional[asyncio.Task] = None
+        self._initial_load: Optional[asyncio.Future] = None
+    
+    async def start(self) -> None:
+        """Load the snapshot and start watching for changes on the running event loop."""
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.create_task(self._watch(), name="feature-flags")
+            self._initial_load = asyncio.ensure_future(self._load_snapshot())
+        # Concurrent first evaluations wait for the same load
+        await asyncio.shield(self._initial_load)
+    
+    async def _load_snapshot(self) -> None:
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.error(f"Failed to load feature flags: {e}")
+    
+    async def stop(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+    
+    async def refresh(self) -> None:
+        """Reload every flag from Redis into the snapshot."""
+        redis_client = await redis.get_client()
+        keys = sorted(await redis_client.smembers(self.flag_list_key))
+        pipe = redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(f"{self.flag_prefix}{key}")
+        values = await pipe.execute() if keys else []
+        self._snapshot = {key: data for key, data in zip(keys, values) if data}
+    
+    async def _watch(self) -> None:
+        while True:
+            pubsub = None
+            try:
+                pubsub = await redis.create_pubsub()
+                await pubsub.subscribe(FLAG_CHANNEL)
+                # Reload in case a change landed before the subscription
+                await self.refresh()
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=FLAG_POLL_INTERVAL_SECONDS)
+                    if message:
+                        logger.debug(f"Feature flag {message.get('data')} changed, reloading flags")
+                    await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Feature flag watcher failed, retrying: {e}")
+                await asyncio.sleep(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+    
+    async def _notify_change(self, key: str) -> None:
+        try:
+            await redis.publish(FLAG_CHANNEL, key)
+        except Exception as e:
+            logger.warning(f"Failed to publish change of feature flag {key}: {e}")
     
     async def set_flag(self, key: str, enabled: bool, description: str = "") -> bool:
         """Set a feature flag to enabled or disabled"""
@@ -30,6 +103,9 @@ class FeatureFlagManager:
             redis_client = await redis.get_client()
             await redis_client.hset(flag_key, mapping=flag_data)
             await redis_client.sadd(self.flag_list_key, key)
+            if self._snapshot is not None:
+                self._snapshot[key] = flag_data
+            await self._notify_change(key)
             
             logger.info(f"Set feature flag {key} to {enabled}")
             return True
@@ -39,15 +115,16 @@ class FeatureFlagManager:
     
     async def is_enabled(self, key: str) -> bool:
         """Check if a feature flag is enabled"""
-        try:
-            flag_key = f"{self.flag_prefix}{key}"
-            redis_client = await redis.get_client()
-            enabled = await redis_client.hget(flag_key, 'enabled')
-            return enabled == 'true' if enabled else False
-        except Exception as e:
-            logger.error(f"Failed to check feature flag {key}: {e}")
+        if self._snapshot is None:
+            await self.start()
+        if self._snapshot is not None:
+            flag_data = self._snapshot.get(key)
+            enabled = flag_data is not None and flag_data.get('enabled') == 'true'
+        else:
             # Fall back to local flags if Redis is unavailable
-            return self._get_local_flag(key)
+            enabled = self._get_local_flag(key)
+        self._evaluations[key][enabled] += 1
+        return enabled
 
     def _get_local_flag(self, key: str) -> bool:
         """Get local feature flag value when Redis is unavailable"""
@@ -55,8 +132,18 @@ class FeatureFlagManager:
         import flags.flags as local_flags
         return getattr(local_flags, key, False)
 
+    def get_evaluation_counts(self) -> Dict[str, Dict[str, int]]:
+        """How often each flag was evaluated as enabled/disabled in this process"""
+        return {
+            key: {'enabled': counts[True], 'disabled': counts[False]}
+            for key, counts in sorted(self._evaluations.items())
+        }
+
     async def get_flag(self, key: str) -> Optional[Dict[str, str]]:
         """Get feature flag details"""
+        if self._snapshot is not None:
+            flag_data = self._snapshot.get(key)
+            return dict(flag_data) if flag_data else None
         try:
             flag_key = f"{self.flag_prefix}{key}"
             redis_client = await redis.get_client()
@@ -74,6 +161,9 @@ class FeatureFlagManager:
             deleted = await redis_client.delete(flag_key)
             if deleted:
                 await redis_client.srem(self.flag_list_key, key)
+                if self._snapshot is not None:
+                    self._snapshot.pop(key, None)
+                await self._notify_change(key)
                 logger.info(f"Deleted feature flag: {key}")
                 return True
             return False
@@ -84,14 +174,9 @@ class FeatureFlagManager:
     async def list_flags(self) -> Dict[str, bool]:
         """List all feature flags with their status"""
         try:
-            redis_client = await redis.get_client()
-            flag_keys = await redis_client.smembers(self.flag_list_key)
-            flags = {}
-            
-            for key in flag_keys:
-                flags[key] = await self.is_enabled(key)
-            
-            return flags
+            if self._snapshot is None:
+                await self.refresh()
+            return {key: data.get('enabled') == 'true' for key, data in self._snapshot.items()}
         except Exception as e:
             logger.error(f"Failed to list feature flags: {e}")
             return {}
@@ -99,16 +184,9 @@ class FeatureFlagManager:
     async def get_all_flags_details(self) -> Dict[str, Dict[str, str]]:
         """Get all feature flags with detailed information"""
         try:
-            redis_client = await redis.get_client()
-            flag_keys = await redis_client.smembers(self.flag_list_key)
-            flags = {}
-            
-            for key in flag_keys:
-                flag_data = await self.get_flag(key)
-                if flag_data:
-                    flags[key] = flag_data
-            
-            return flags
+            if self._snapshot is None:
+                await self.refresh()
+            return {key: dict(data) for key, data in self._snapshot.items()}
         except Exception as e:
             logger.error(f"Failed to get all flags details: {e}")
             return {}
@@ -154,6 +232,10 @@ async def get_flag_details(key: str) -> Optional[Dict[str, str]]:
     return await get_flag_manager().get_flag(key)
 
 
+def get_evaluation_counts() -> Dict[str, Dict[str, int]]:
+    return get_flag_manager().get_evaluation_counts()
+
+
 # Feature Flags
 
 # Custom agents feature flag
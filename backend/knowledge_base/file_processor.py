@@ -11,9 +11,6 @@ from pathlib import Path
 import mimetypes
 import chardet
 
-import PyPDF2
-import docx
-
 from utils.logger import logger
 from services.supabase import DBConnection
 
@@ -392,6 +389,8 @@ class FileProcessor:
         return self._sanitize_content(raw_text)
     
     def _extract_pdf_content(self, file_content: bytes) -> str:
+        import PyPDF2
+
         pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
         text_content = []
         
@@ -402,6 +401,8 @@ class FileProcessor:
         return self._sanitize_content(raw_text)
     
     def _extract_docx_content(self, file_content: bytes) -> str:
+        import docx
+
         doc = docx.Document(io.BytesIO(file_content))
         text_content = []
         
@@ -11,7 +11,9 @@ from collections import OrderedDict
 from mcp import ClientSession
 from mcp.client.sse import sse_client
 from mcp.client.streamable_http import streamablehttp_client
+from mcp.types import Tool
 
+from agent.tools.utils.mcp_session_pool import mcp_session_pool
 from utils.logger import logger
 from credentials import EncryptionService
 
@@ -99,60 +101,93 @@ class MCPService:
     def __init__(self):
         self._logger = logger
         self._connections: Dict[str, MCPConnection] = {}
+        # Resolved URL and headers per server, filled on connect or on first tool call
+        self._endpoints: Dict[str, Dict[str, Any]] = {}
         self._encryption_service = EncryptionService()
 
     async def connect_server(self, mcp_config: Dict[str, Any], external_user_id: Optional[str] = None) -> MCPConnection:
-        # Determine provider from type field
-        provider = mcp_config.get('type', mcp_config.get('provider', 'custom'))
-        
-        request = MCPConnectionRequest(
+        request = self._build_request(mcp_config, external_user_id)
+        return await self._connect_server_internal(request)
+    
+    def _build_request(self, mcp_config: Dict[str, Any], external_user_id: Optional[str] = None) -> MCPConnectionRequest:
+        return MCPConnectionRequest(
             qualified_name=mcp_config.get('qualifiedName', mcp_config.get('name', '')),
             name=mcp_config.get('name', ''),
             config=mcp_config.get('config', {}),
             enabled_tools=mcp_config.get('enabledTools', mcp_config.get('enabled_tools', [])),
-            provider=provider,  # Use the determined provider
+            provider=mcp_config.get('type', mcp_config.get('provider', 'custom')),
             external_user_id=external_user_id
         )
-        return await self._connect_server_internal(request)
-    
+
+    async def _resolve_endpoint(self, request: MCPConnectionRequest) -> Dict[str, Any]:
+        server_url = await self._get_server_url(request.qualified_name, request.config, request.provider)
+        headers = self._get_headers(request.qualified_name, request.config, request.provider, request.external_user_id)
+        return {"url": server_url, "headers": headers}
+
+    async def list_server_tools(self, mcp_config: Dict[str, Any], external_user_id: Optional[str] = None) -> List[Any]:
+        """List a server's tools over a pooled session without registering a connection."""
+        request = self._build_request(mcp_config, external_user_id)
+        endpoint = await self._resolve_endpoint(request)
+        return await mcp_session_pool.list_tools("http", endpoint, timeout=30)
+
+    def restore_connection(self, mcp_config: Dict[str, Any], tools: List[Dict[str, Any]], external_user_id: Optional[str] = None) -> MCPConnection:
+        """Register a connection from cached tool definitions.
+
+        No session is opened here; the server is contacted through the session
+        pool the first time one of its tools is executed.
+        """
+        request = self._build_request(mcp_config, external_user_id)
+        connection = MCPConnection(
+            qualified_name=request.qualified_name,
+            name=request.name,
+            config=request.config,
+            enabled_tools=request.enabled_tools,
+            provider=request.provider,
+            external_user_id=request.external_user_id,
+            tools=[Tool.model_validate(tool) for tool in tools]
+        )
+        self._connections[request.qualified_name] = connection
+        # The cached endpoint may carry another run's URL and auth headers
+        self._endpoints.pop(request.qualified_name, None)
+        self._logger.info(f"Restored {request.qualified_name} from cache ({len(tools)} tools, connecting on first use)")
+        return connection
+
+    @staticmethod
+    def serialize_tools(tools: Optional[List[Any]]) -> List[Dict[str, Any]]:
+        return [
+            {"name": tool.name, "description": tool.description, "inputSchema": tool.inputSchema}
+            for tool in tools or []
+        ]
+
     async def _connect_server_internal(self, request: MCPConnectionRequest) -> MCPConnection:
         self._logger.info(f"Connecting to MCP server: {request.qualified_name}")
         
         try:
-            server_url = await self._get_server_url(request.qualified_name, request.config, request.provider)
-            headers = self._get_headers(request.qualified_name, request.config, request.provider, request.external_user_id)
+            endpoint = await self._resolve_endpoint(request)
             
             # Add debugging
-            self._logger.info(f"MCP connection details - Provider: {request.provider}, URL: {server_url}, Headers: {headers}")
+            self._logger.info(f"MCP connection details - Provider: {request.provider}, URL: {endpoint['url']}, Headers: {endpoint['headers']}")
             
-            # Add timeout to prevent hanging
-            async with asyncio.timeout(30):
-                async with streamablehttp_client(server_url, headers=headers) as (
-                    read_stream, write_stream, _
-                ):
-                    session = ClientSession(read_stream, write_stream)
-                    await session.initialize()
-                    
-                    tool_result = await session.list_tools()
-                    tools = tool_result.tools if tool_result else []
-                    
-                    connection = MCPConnection(
-                        qualified_name=request.qualified_name,
-                        name=request.name,
-                        config=request.config,
-                        enabled_tools=request.enabled_tools,
-                        provider=request.provider,
-                        external_user_id=request.external_user_id,
-                        session=session,
-                        tools=tools
-                    )
-                    
-                    self._connections[request.qualified_name] = connection
-                    self._logger.info(f"Connected to {request.qualified_name} ({len(tools)} tools available)")
-                    
-                    return connection
+            # The session stays open in the pool and is reused when tools are executed
+            tools = await mcp_session_pool.list_tools("http", endpoint, timeout=30)
+            
+            connection = MCPConnection(
+                qualified_name=request.qualified_name,
+                name=request.name,
+                config=request.config,
+                enabled_tools=request.enabled_tools,
+                provider=request.provider,
+                external_user_id=request.external_user_id,
+                tools=tools
+            )
+            
+            self._connections[request.qualified_name] = connection
+            self._endpoints[request.qualified_name] = endpoint
+            self._logger.info(f"Connected to {request.qualified_name} ({len(tools)} tools available)")
+            
+            return connection
                     
-        except asyncio.TimeoutError:
+        except (asyncio.TimeoutError, TimeoutError):
             error_msg = f"Connection timeout for {request.qualified_name} after 30 seconds"
             self._logger.error(error_msg)
             raise MCPConnectionError(error_msg)
@@ -184,15 +219,10 @@ class MCPService:
                 continue
     
     async def disconnect_server(self, qualified_name: str) -> None:
-        connection = self._connections.get(qualified_name)
-        if connection and connection.session:
-            try:
-                await connection.session.close()
-                self._logger.info(f"Disconnected from {qualified_name}")
-            except Exception as e:
-                self._logger.warning(f"Error disconnecting from {qualified_name}: {str(e)}")
-        
-        self._connections.pop(qualified_name, None)
+        # Pooled sessions are shared across runs and reaped by the pool when idle
+        if self._connections.pop(qualified_name, None):
+            self._logger.info(f"Disconnected from {qualified_name}")
+        self._endpoints.pop(qualified_name, None)
     
     async def disconnect_all(self) -> None:
         for qualified_name in list(self._connections.keys()):
@@ -244,14 +274,23 @@ class MCPService:
         if not connection:
             raise MCPToolNotFoundError(f"Tool not found: {request.tool_name}")
         
-        if not connection.session:
-            raise MCPToolExecutionError(f"No active session for tool: {request.tool_name}")
-        
         if request.tool_name not in connection.enabled_tools:
             raise MCPToolExecutionError(f"Tool not enabled: {request.tool_name}")
         
         try:
-            result = await connection.session.call_tool(request.tool_name, request.arguments)
+            endpoint = self._endpoints.get(connection.qualified_name)
+            if endpoint is None:
+                endpoint = await self._resolve_endpoint(MCPConnectionRequest(
+                    qualified_name=connection.qualified_name,
+                    name=connection.name,
+                    config=connection.config,
+                    enabled_tools=connection.enabled_tools,
+                    provider=connection.provider,
+                    external_user_id=connection.external_user_id
+                ))
+                self._endpoints[connection.qualified_name] = endpoint
+            
+            result = await mcp_session_pool.call_tool("http", endpoint, request.tool_name, request.arguments, timeout=60)
             
             self._logger.info(f"Tool {request.tool_name} executed successfully")
             
@@ -291,6 +291,35 @@ class ProfileService:
             logger.error(f"Error getting profile {profile_id}: {str(e)}")
             raise ProfileServiceError(f"Failed to get profile: {str(e)}")
     
+    async def get_runtime_configs(self, account_id: str, profile_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Decrypted configs for several profiles in one query, keyed by profile_id.
+
+        Intended for agent runs: unlike get_profile it skips the per-profile
+        Pipedream connection status check, and profiles that fail to decrypt
+        are left out rather than failing the whole batch.
+        """
+        profile_ids = list(dict.fromkeys(str(pid) for pid in profile_ids if pid))
+        if not profile_ids:
+            return {}
+        
+        client = await self._get_client()
+        
+        try:
+            result = await client.table('user_mcp_credential_profiles').select(
+                'profile_id, encrypted_config'
+            ).eq('account_id', str(account_id)).in_('profile_id', profile_ids).execute()
+        except Exception as e:
+            logger.error(f"Error getting profiles {profile_ids}: {str(e)}")
+            raise ProfileServiceError(f"Failed to get profiles: {str(e)}")
+        
+        configs = {}
+        for row in result.data or []:
+            try:
+                configs[row['profile_id']] = self._decrypt_config(row['encrypted_config'])
+            except EncryptionError as e:
+                logger.error(f"Error decrypting profile {row['profile_id']}: {str(e)}")
+        return configs
+    
     async def get_profiles(
         self,
         account_id: str,
@@ -4,11 +4,11 @@ dotenv.load_dotenv(".env")
 import sentry
 import asyncio
 import json
+import time
 import traceback
 from datetime import datetime, timezone
 from typing import Optional
-from services import redis
-from agent.run import run_agent
+from services import account_runs, active_runs, redis
 from utils.logger import logger, structlog
 import dramatiq
 import uuid
@@ -18,6 +18,7 @@ from services import redis
 from dramatiq.brokers.redis import RedisBroker
 import os
 from services.langfuse import langfuse
+from services import worker_lifecycle
 from utils.retry import retry
 
 import sentry_sdk
@@ -25,7 +26,8 @@ from typing import Dict, Any
 
 redis_host = os.getenv('REDIS_HOST', 'redis')
 redis_port = int(os.getenv('REDIS_PORT', 6379))
-redis_broker = RedisBroker(host=redis_host, port=redis_port, middleware=[dramatiq.middleware.AsyncIO()])
+# WorkerLifecycle runs the AsyncIO event loop and warms shared resources at worker boot
+redis_broker = RedisBroker(host=redis_host, port=redis_port, middleware=[worker_lifecycle.WorkerLifecycle()])
 
 dramatiq.set_broker(redis_broker)
 
@@ -38,6 +40,9 @@ async def initialize():
     """Initialize the agent API with resources from the main API."""
     global db, instance_id, _initialized
 
+    if _initialized:
+        return
+
     if not instance_id:
         instance_id = str(uuid.uuid4())[:8]
     await retry(lambda: redis.initialize_async())
@@ -69,6 +74,7 @@ async def run_agent_background(
     request_id: Optional[str] = None,
 ):
     """Run the agent in the background using Redis for state."""
+    run_started = time.monotonic()
     structlog.contextvars.clear_contextvars()
     structlog.contextvars.bind_contextvars(
         agent_run_id=agent_run_id,
@@ -146,7 +152,6 @@ async def run_agent_background(
     response_channel = f"agent_run:{agent_run_id}:new_response"
     instance_control_channel = f"agent_run:{agent_run_id}:control:{instance_id}"
     global_control_channel = f"agent_run:{agent_run_id}:control"
-    instance_active_key = f"active_run:{instance_id}:{agent_run_id}"
 
     async def check_for_stop_signal():
         nonlocal stop_signal_received
@@ -163,8 +168,8 @@ async def run_agent_background(
                         break
                 # Periodically refresh the active run key TTL
                 if total_responses % 50 == 0: # Refresh every 50 responses or so
-                    try: await redis.expire(instance_active_key, redis.REDIS_KEY_TTL)
-                    except Exception as ttl_err: logger.warning(f"Failed to refresh TTL for {instance_active_key}: {ttl_err}")
+                    try: await active_runs.refresh(instance_id, agent_run_id)
+                    except Exception as ttl_err: logger.warning(f"Failed to refresh active run TTL for {agent_run_id}: {ttl_err}")
                 await asyncio.sleep(0.1) # Short sleep to prevent tight loop
         except asyncio.CancelledError:
             logger.info(f"Stop signal checker cancelled for {agent_run_id} (Instance: {instance_id})")
@@ -186,8 +191,12 @@ async def run_agent_background(
         stop_checker = asyncio.create_task(check_for_stop_signal())
 
         # Ensure active run key exists and has TTL
-        await redis.set(instance_active_key, "running", ex=redis.REDIS_KEY_TTL)
+        await active_runs.register(instance_id, agent_run_id)
+
 
+        # Imported here so the API process, which only enqueues this actor, never
+        # loads the agent and tool modules; workers load them during warm-up
+        from agent.run import run_agent
 
         # Initialize agent generator
         agent_gen = run_agent(
@@ -206,7 +215,15 @@ async def run_agent_background(
 
         pending_redis_operations = []
 
+        first_response = True
         async for response in agent_gen:
+            if first_response:
+                first_response = False
+                setup_ms = round((time.monotonic() - run_started) * 1000, 1)
+                worker_lifecycle.record_run_setup(setup_ms)
+                logger.info(f"Agent run {agent_run_id} setup took {setup_ms}ms (worker warm: {worker_lifecycle.is_warm()})")
+                trace.event(name="worker_run_setup", level="DEFAULT", metadata={"setup_ms": setup_ms, "worker_warm": worker_lifecycle.is_warm()})
+
             if stop_signal_received:
                 logger.info(f"Agent run {agent_run_id} stopped by signal.")
                 final_status = "stopped"
@@ -311,7 +328,13 @@ async def run_agent_background(
         await _cleanup_redis_response_list(agent_run_id)
 
         # Remove the instance-specific active run key
-        await _cleanup_redis_instance_key(agent_run_id)
+        await _cleanup_redis_instance_key(instance_id, agent_run_id)
+
+        # Free the run's slot in the account's parallel run limit
+        try:
+            await account_runs.release(agent_run_id)
+        except Exception as e:
+            logger.warning(f"Failed to release account run slot for {agent_run_id}: {str(e)}")
 
         # Clean up the run lock
         await _cleanup_redis_run_lock(agent_run_id)
@@ -324,18 +347,17 @@ async def run_agent_background(
 
         logger.info(f"Agent run background task fully completed for: {agent_run_id} (Instance: {instance_id}) with final status: {final_status}")
 
-async def _cleanup_redis_instance_key(agent_run_id: str):
+async def _cleanup_redis_instance_key(instance_id: str, agent_run_id: str):
     """Clean up the instance-specific Redis key for an agent run."""
     if not instance_id:
         logger.warning("Instance ID not set, cannot clean up instance key.")
         return
-    key = f"active_run:{instance_id}:{agent_run_id}"
-    logger.debug(f"Cleaning up Redis instance key: {key}")
+    logger.debug(f"Cleaning up active run {agent_run_id} for instance {instance_id}")
     try:
-        await redis.delete(key)
-        logger.debug(f"Successfully cleaned up Redis key: {key}")
+        await active_runs.unregister(instance_id, agent_run_id)
+        logger.debug(f"Successfully cleaned up active run {agent_run_id} for instance {instance_id}")
     except Exception as e:
-        logger.warning(f"Failed to clean up Redis key {key}: {str(e)}")
+        logger.warning(f"Failed to clean up active run {agent_run_id} for instance {instance_id}: {str(e)}")
 
 async def _cleanup_redis_run_lock(agent_run_id: str):
     """Clean up the run lock Redis key for an agent run."""
@@ -9,7 +9,7 @@ from daytona_sdk import AsyncSandbox
 
 from sandbox.sandbox import get_or_start_sandbox, delete_sandbox
 from utils.logger import logger
-from utils.auth_utils import get_optional_user_id
+from utils.auth_utils import get_optional_user_id, is_account_member
 from services.supabase import DBConnection
 
 # Initialize shared resources
@@ -99,10 +99,8 @@ async def verify_sandbox_access(client, sandbox_id: str, user_id: Optional[str]
     account_id = project_data.get('account_id')
     
     # Verify account membership
-    if account_id:
-        account_user_result = await client.schema('basejump').from_('account_user').select('account_role').eq('user_id', user_id).eq('account_id', account_id).execute()
-        if account_user_result.data and len(account_user_result.data) > 0:
-            return project_data
+    if account_id and await is_account_member(client, account_id, user_id):
+        return project_data
     
     raise HTTPException(status_code=403, detail="Not authorized to access this sandbox")
 
@@ -362,8 +360,7 @@ async def ensure_project_sandbox_active(
         
         # Verify account membership
         if account_id:
-            account_user_result = await client.schema('basejump').from_('account_user').select('account_role').eq('user_id', user_id).eq('account_id', account_id).execute()
-            if not (account_user_result.data and len(account_user_result.data) > 0):
+            if not await is_account_member(client, account_id, user_id):
                 logger.error(f"User {user_id} not authorized to access project {project_id}")
                 raise HTTPException(status_code=403, detail="Not authorized to access this project")
     
@@ -0,0 +1,204 @@
+"""
+Per-account registry of running agent runs, used to enforce MAX_PARALLEL_AGENT_RUNS.
+
+Each account has a sorted set ``account_runs:{account_id}`` of its running run
+ids scored by start time, plus a hash mapping them to thread ids. ``reserve``
+checks the limit and takes a slot for a new run id in one Lua call, before the
+run is inserted, so concurrent starts cannot exceed the limit. The slot is
+given back with ``release``, by the worker when the run finishes or by the API
+when starting it failed.
+
+- Entries older than ``RUN_SLOT_TTL`` are dropped on read, so a run whose
+  worker died without cleaning up stops counting eventually.
+- Every ``RECONCILE_INTERVAL_SECONDS`` per account (and whenever the set is
+  missing) the set is reconciled with the ``agent_runs`` table, which also
+  picks up runs started elsewhere, e.g. by triggers. Released runs are
+  remembered, so a run whose status is not yet updated in the table is not
+  counted again, and fresh reservations not inserted yet are kept.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from redis.exceptions import WatchError
+
+from services import redis
+from utils.logger import logger
+
+RUN_SLOT_TTL = 24 * 3600  # Matches the window of the original running-runs query
+RECONCILE_INTERVAL_SECONDS = 5 * 60
+RESERVATION_GRACE_SECONDS = 60  # Reservations this recent may not be in the table yet
+RECONCILE_ATTEMPTS = 3
+
+_RUNS_PREFIX = "account_runs:"
+_RUN_ACCOUNT_PREFIX = "agent_run_account:"
+_RELEASED_PREFIX = "agent_run_released:"
+
+# Takes a slot for ARGV[4] if fewer than ARGV[2] runs started after ARGV[1] are
+# running. Returns {1} when reserved, else {0, thread ids of the running runs}.
+_RESERVE = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local running = redis.call('ZRANGE', KEYS[1], 0, -1)
+if #running >= tonumber(ARGV[2]) then
+    if #running == 0 then
+        return {0}
+    end
+    return {0, unpack(redis.call('HMGET', KEYS[2], unpack(running)))}
+end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('SET', KEYS[3], ARGV[6], 'EX', ARGV[5])
+return {1}
+"""
+
+# Removes a finished run from its account's set and remembers that it finished;
+# the run -> account key lets the worker release a run without knowing the account.
+_RELEASE = """
+redis.call('SET', KEYS[2], '1', 'EX', ARGV[3])
+local account_id = redis.call('GET', KEYS[1])
+if not account_id then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('HDEL', ARGV[1] .. account_id .. ':threads', ARGV[2])
+return redis.call('ZREM', ARGV[1] .. account_id, ARGV[2])
+"""
+
+
+def _runs_key(account_id: str) -> str:
+    return f"{_RUNS_PREFIX}{account_id}"
+
+
+def _threads_key(account_id: str) -> str:
+    return f"{_RUNS_PREFIX}{account_id}:threads"
+
+
+def _reconciled_key(account_id: str) -> str:
+    return f"{_RUNS_PREFIX}{account_id}:reconciled"
+
+
+def _run_account_key(agent_run_id: str) -> str:
+    return f"{_RUN_ACCOUNT_PREFIX}{agent_run_id}"
+
+
+def _released_key(agent_run_id: str) -> str:
+    return f"{_RELEASED_PREFIX}{agent_run_id}"
+
+
+def _add_runs(pipe, account_id: str, runs: Dict[str, Dict]) -> None:
+    """Queue commands adding {run_id: {'thread_id', 'started_at'}} to the account's set."""
+    if not runs:
+        return
+    pipe.zadd(_runs_key(account_id), {run_id: run['started_at'] for run_id, run in runs.items()})
+    pipe.hset(_threads_key(account_id), mapping={run_id: run['thread_id'] for run_id, run in runs.items()})
+    for run_id in runs:
+        pipe.set(_run_account_key(run_id), account_id, ex=RUN_SLOT_TTL)
+    pipe.expire(_runs_key(account_id), RUN_SLOT_TTL)
+    pipe.expire(_threads_key(account_id), RUN_SLOT_TTL)
+
+
+async def reserve(client, account_id: str, agent_run_id: str, limit: int) -> Optional[List[Optional[str]]]:
+    """Take a slot for a run about to be started.
+
+    Returns None when the slot was taken, otherwise the thread ids of the
+    account's running runs (None for runs whose thread is not known yet).
+    """
+    redis_client = await redis.get_client()
+    if not await redis_client.exists(_reconciled_key(account_id)):
+        await reconcile(client, account_id)
+
+    now = time.time()
+    result = await redis_client.eval(
+        _RESERVE, 3,
+        _runs_key(account_id), _threads_key(account_id), _run_account_key(agent_run_id),
+        now - RUN_SLOT_TTL, limit, now, agent_run_id, RUN_SLOT_TTL, account_id,
+    )
+    if int(result[0]) == 1:
+        return None
+    return list(result[1:])
+
+
+async def register(account_id: str, agent_run_id: str, thread_id: str) -> None:
+    """Count a just-started run against the account's limit and record its thread."""
+    redis_client = await redis.get_client()
+    pipe = redis_client.pipeline(transaction=True)
+    _add_runs(pipe, account_id, {agent_run_id: {'thread_id': thread_id, 'started_at': time.time()}})
+    await pipe.execute()
+
+
+async def release(agent_run_id: str) -> bool:
+    """Stop counting a finished (or never started) run; returns whether it was registered."""
+    redis_client = await redis.get_client()
+    removed = await redis_client.eval(
+        _RELEASE, 2, _run_account_key(agent_run_id), _released_key(agent_run_id),
+        _RUNS_PREFIX, agent_run_id, RUN_SLOT_TTL,
+    )
+    return bool(removed)
+
+
+async def running_runs(client, account_id: str) -> Dict[str, str]:
+    """Running run ids of the account mapped to their thread ids."""
+    redis_client = await redis.get_client()
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zremrangebyscore(_runs_key(account_id), "-inf", time.time() - RUN_SLOT_TTL)
+    pipe.zrange(_runs_key(account_id), 0, -1)
+    pipe.hgetall(_threads_key(account_id))
+    pipe.exists(_reconciled_key(account_id))
+    _, run_ids, threads, reconciled = await pipe.execute()
+
+    if not reconciled:
+        return await reconcile(client, account_id)
+    return {run_id: threads.get(run_id) for run_id in run_ids}
+
+
+async def reconcile(client, account_id: str) -> Dict[str, str]:
+    """Reconcile the account's set with the agent_runs table."""
+    started = time.time()
+    since = datetime.now(timezone.utc) - timedelta(seconds=RUN_SLOT_TTL)
+    result = await client.table('agent_runs') \
+        .select('id, thread_id, started_at, threads!inner(account_id)') \
+        .eq('threads.account_id', account_id) \
+        .eq('status', 'running') \
+        .gte('started_at', since.isoformat()) \
+        .execute()
+
+    runs = {
+        row['id']: {
+            'thread_id': row['thread_id'],
+            'started_at': datetime.fromisoformat(row['started_at'].replace('Z', '+00:00')).timestamp(),
+        }
+        for row in result.data or []
+    }
+
+    redis_client = await redis.get_client()
+    async with redis_client.pipeline(transaction=True) as pipe:
+        for _ in range(RECONCILE_ATTEMPTS):
+            try:
+                # A run released while this runs aborts the write instead of being re-added
+                released_keys = [_released_key(run_id) for run_id in runs]
+                await pipe.watch(_runs_key(account_id), *released_keys)
+                released = await pipe.mget(released_keys) if released_keys else []
+                live = {run_id: run for (run_id, run), done in zip(runs.items(), released) if not done}
+                members = await pipe.zrange(_runs_key(account_id), 0, -1, withscores=True)
+                threads = await pipe.hgetall(_threads_key(account_id))
+
+                # Entries the table doesn't know are dropped unless they are fresh reservations
+                stale = [run_id for run_id, score in members if run_id not in live and score < started - RESERVATION_GRACE_SECONDS]
+                kept = {run_id: threads.get(run_id) for run_id, _ in members if run_id not in live and run_id not in stale}
+
+                pipe.multi()
+                if stale:
+                    pipe.zrem(_runs_key(account_id), *stale)
+                    pipe.hdel(_threads_key(account_id), *stale)
+                _add_runs(pipe, account_id, live)
+                pipe.set(_reconciled_key(account_id), "1", ex=RECONCILE_INTERVAL_SECONDS)
+                await pipe.execute()
+                break
+            except WatchError:
+                pipe.reset()
+        else:
+            raise RuntimeError(f"Could not reconcile running agent runs for account {account_id}")
+
+    logger.debug(f"Reconciled running agent runs for account {account_id}: {len(live) + len(kept)}")
+    return {**kept, **{run_id: run['thread_id'] for run_id, run in live.items()}}
@@ -0,0 +1,91 @@
+"""
+Registry of agent runs in progress, per API/worker instance.
+
+Each run being handled by an instance has an ``active_run:{instance_id}:{agent_run_id}``
+key with a TTL that the worker keeps refreshing. Two index sets are kept next
+to those keys so lookups never scan the keyspace:
+
+- ``active_runs:instance:{instance_id}``: run ids handled by the instance
+- ``active_runs:run:{agent_run_id}``: instance ids handling the run
+
+The sets get the same TTL as the keys. Members whose ``active_run:`` key has
+expired, e.g. because a worker died without cleaning up, are dropped when the
+set is read.
+"""
+
+from typing import List
+
+from services import redis
+
+
+def _active_key(instance_id: str, agent_run_id: str) -> str:
+    return f"active_run:{instance_id}:{agent_run_id}"
+
+
+def _instance_index(instance_id: str) -> str:
+    return f"active_runs:instance:{instance_id}"
+
+
+def _run_index(agent_run_id: str) -> str:
+    return f"active_runs:run:{agent_run_id}"
+
+
+async def register(instance_id: str, agent_run_id: str) -> None:
+    """Mark the run as handled by the instance."""
+    redis_client = await redis.get_client()
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.set(_active_key(instance_id, agent_run_id), "running", ex=redis.REDIS_KEY_TTL)
+    pipe.sadd(_instance_index(instance_id), agent_run_id)
+    pipe.sadd(_run_index(agent_run_id), instance_id)
+    pipe.expire(_instance_index(instance_id), redis.REDIS_KEY_TTL)
+    pipe.expire(_run_index(agent_run_id), redis.REDIS_KEY_TTL)
+    await pipe.execute()
+
+
+async def refresh(instance_id: str, agent_run_id: str) -> None:
+    """Extend the TTLs while the run is still going."""
+    redis_client = await redis.get_client()
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.expire(_active_key(instance_id, agent_run_id), redis.REDIS_KEY_TTL)
+    pipe.expire(_instance_index(instance_id), redis.REDIS_KEY_TTL)
+    pipe.expire(_run_index(agent_run_id), redis.REDIS_KEY_TTL)
+    await pipe.execute()
+
+
+async def unregister(instance_id: str, agent_run_id: str) -> None:
+    """Remove the run from the instance once it has finished."""
+    redis_client = await redis.get_client()
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.delete(_active_key(instance_id, agent_run_id))
+    pipe.srem(_instance_index(instance_id), agent_run_id)
+    pipe.srem(_run_index(agent_run_id), instance_id)
+    await pipe.execute()
+
+
+async def runs_for_instance(instance_id: str) -> List[str]:
+    """Run ids the instance is still handling."""
+    index = _instance_index(instance_id)
+    return await _live_members(index, lambda agent_run_id: _active_key(instance_id, agent_run_id))
+
+
+async def instances_for_run(agent_run_id: str) -> List[str]:
+    """Instance ids still handling the run."""
+    index = _run_index(agent_run_id)
+    return await _live_members(index, lambda instance_id: _active_key(instance_id, agent_run_id))
+
+
+async def _live_members(index: str, active_key) -> List[str]:
+    redis_client = await redis.get_client()
+    members = sorted(await redis_client.smembers(index))
+    if not members:
+        return []
+
+    pipe = redis_client.pipeline(transaction=False)
+    for member in members:
+        pipe.exists(active_key(member))
+    exists = await pipe.execute()
+
+    stale = [member for member, found in zip(members, exists) if not found]
+    if stale:
+        await redis_client.srem(index, *stale)
+    return [member for member, found in zip(members, exists) if found]
@@ -0,0 +1,151 @@
+"""
+Buffered usage recording for API keys.
+
+Requests authenticated with an API key are counted in process memory instead of
+writing to ``api_keys`` on the request path:
+
+- per key, the latest use and the number of requests since the last flush are
+  aggregated and written for all keys with one ``record_api_key_usage`` call
+  every ``FLUSH_INTERVAL_SECONDS``. Counts are added in the database, so every
+  API process flushes its own share;
+- a per-second sliding window over the last ``RATE_WINDOW_SECONDS`` gives each
+  key's current request rate in this process, for rate limiting.
+"""
+
+import asyncio
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional
+
+from utils.logger import logger
+
+FLUSH_INTERVAL_SECONDS = 10
+RATE_WINDOW_SECONDS = 60
+
+# key_id -> [last used (epoch seconds), requests since the last flush]
+_pending: Dict[str, List] = {}
+# key_id -> [second, requests] buckets, oldest first
+_windows: Dict[str, Deque[List[int]]] = {}
+_flush_task: Optional[asyncio.Task] = None
+
+
+def record(key_id: str) -> None:
+    """Count one request made with the key."""
+    now = time.time()
+    entry = _pending.get(key_id)
+    if entry is None:
+        _pending[key_id] = [now, 1]
+    else:
+        entry[0] = now
+        entry[1] += 1
+
+    second = int(now)
+    window = _windows.get(key_id)
+    if window is None:
+        window = _windows[key_id] = deque()
+    if window and window[-1][0] == second:
+        window[-1][1] += 1
+    else:
+        window.append([second, 1])
+        _trim(window, second)
+
+
+def request_count(key_id: str, window_seconds: int = RATE_WINDOW_SECONDS) -> int:
+    """Requests made with the key in this process over the last ``window_seconds`` (at most ``RATE_WINDOW_SECONDS``)."""
+    window = _windows.get(key_id)
+    if not window:
+        return 0
+    cutoff = int(time.time()) - min(window_seconds, RATE_WINDOW_SECONDS)
+    return sum(count for second, count in window if second > cutoff)
+
+
+def request_rate(key_id: str) -> float:
+    """Requests per second made with the key in this process, averaged over ``RATE_WINDOW_SECONDS``."""
+    return request_count(key_id) / RATE_WINDOW_SECONDS
+
+
+def _trim(window: Deque[List[int]], second: int) -> None:
+    cutoff = second - RATE_WINDOW_SECONDS
+    while window and window[0][0] <= cutoff:
+        window.popleft()
+
+
+def _prune_windows() -> None:
+    second = int(time.time())
+    for key_id in list(_windows):
+        window = _windows[key_id]
+        _trim(window, second)
+        if not window:
+            del _windows[key_id]
+
+
+def _restore(pending: Dict[str, List]) -> None:
+    # Merge a failed flush back so the next one retries it
+    for key_id, (last_used, count) in pending.items():
+        entry = _pending.get(key_id)
+        if entry is None:
+            _pending[key_id] = [last_used, count]
+        else:
+            entry[0] = max(entry[0], last_used)
+            entry[1] += count
+
+
+async def flush(client) -> int:
+    """Write usage buffered since the last flush; returns the number of keys written."""
+    global _pending
+    if not _pending:
+        return 0
+
+    pending, _pending = _pending, {}
+    rows = [
+        {
+            'key_id': key_id,
+            'last_used_at': datetime.fromtimestamp(last_used, timezone.utc).isoformat(),
+            'request_count': count,
+        }
+        for key_id, (last_used, count) in pending.items()
+    ]
+    try:
+        await client.rpc('record_api_key_usage', {'p_usage': rows}).execute()
+    except Exception:
+        _restore(pending)
+        raise
+    return len(rows)
+
+
+async def _run_flush_loop() -> None:
+    from services.supabase import DBConnection
+
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+        _prune_windows()
+        try:
+            flushed = await flush(await DBConnection().client)
+            if flushed:
+                logger.debug(f"Flushed API key usage for {flushed} keys")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"API key usage flush failed: {e}")
+
+
+def start_flush_loop() -> None:
+    """Start flushing buffered usage periodically on the running event loop."""
+    global _flush_task
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_run_flush_loop(), name="api-key-usage")
+
+
+async def stop_flush_loop() -> None:
+    """Stop the loop and flush what is still buffered."""
+    global _flush_task
+    from services.supabase import DBConnection
+
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+    try:
+        await flush(await DBConnection().client)
+    except Exception as e:
+        logger.warning(f"Final API key usage flush failed: {e}")
@@ -8,20 +8,18 @@ This module provides functionality for managing API keys including:
 - CRUD operations for user API keys
 """
 
-import asyncio
 from datetime import datetime, timezone, timedelta
-from typing import Optional, List, Dict
+from typing import Optional, List
 from uuid import UUID, uuid4
 import secrets
 import string
 import hmac
 import hashlib
-import time
 from pydantic import BaseModel, Field, field_validator
 from fastapi import HTTPException
 from utils.logger import logger
 from services.supabase import DBConnection
-from services import redis
+from services import api_key_usage, redis
 from utils.config import config
 
 
@@ -64,6 +62,7 @@ class APIKeyResponse(BaseModel):
     status: str
     expires_at: Optional[datetime]
     last_used_at: Optional[datetime]
+    request_count: int = 0
     created_at: datetime
 
 
@@ -96,16 +95,12 @@ class APIKeyService:
     Performance Features:
     - HMAC-SHA256 hashing (100x faster than bcrypt)
     - Redis caching for validation results (2min TTL)
-    - Throttled last_used_at updates (max once per 15min per key, configurable)
+    - Buffered last_used_at/request_count updates, flushed in bulk (see services.api_key_usage)
     - Cached user lookups (5min TTL)
     - Asynchronous operations where possible
-    - In-memory fallback throttling when Redis unavailable
     - Streamlined database schema without unnecessary triggers
     """
 
-    # Class-level in-memory throttle cache (fallback when Redis unavailable)
-    _throttle_cache: Dict[str, float] = {}
-
     def __init__(self, db: DBConnection):
         self.db = db
 
@@ -255,7 +250,7 @@ class APIKeyService:
             result = (
                 await client.table("api_keys")
                 .select(
-                    "key_id, public_key, title, description, status, expires_at, last_used_at, created_at"
+                    "key_id, public_key, title, description, status, expires_at, last_used_at, request_count, created_at"
                 )
                 .eq("account_id", str(account_id))
                 .order("created_at", desc=True)
@@ -281,6 +276,7 @@ class APIKeyService:
                             if key_data["last_used_at"]
                             else None
                         ),
+                        request_count=key_data.get("request_count") or 0,
                         created_at=datetime.fromisoformat(key_data["created_at"]),
                     )
                 )
@@ -360,6 +356,8 @@ class APIKeyService:
 
                     cached_data = json.loads(cached_result)
                     logger.debug(f"API key validation cache hit for {public_key}")
+                    if cached_data["is_valid"] and cached_data["key_id"]:
+                        api_key_usage.record(cached_data["key_id"])
                     return APIKeyValidationResult(
                         is_valid=cached_data["is_valid"],
                         account_id=(
@@ -441,9 +439,8 @@ class APIKeyService:
             # Cache successful validation for 2 minutes
             await self._cache_validation_result(cache_key, validation_result, ttl=120)
 
-            # Update last used timestamp with throttling to prevent DB spam
-            # (max once per 15 minutes per key, configurable via config.API_KEY_LAST_USED_THROTTLE_SECONDS)
-            asyncio.create_task(self._update_last_used_throttled(key_data["key_id"]))
+            # Counted in memory; last_used_at and request_count are written in bulk
+            api_key_usage.record(key_data["key_id"])
 
             return validation_result
 
@@ -471,74 +468,9 @@ class APIKeyService:
         except Exception as e:
             logger.warning(f"Failed to cache validation result: {e}")
 
-    async def _update_last_used_throttled(self, key_id: str):
-        """Update last used timestamp with throttling to reduce DB load"""
-        throttle_interval = config.API_KEY_LAST_USED_THROTTLE_SECONDS
-        current_time = time.time()
-
-        # Try Redis first
-        try:
-            redis_client = await redis.get_client()
-            throttle_key = f"last_used_throttle:{key_id}"
-
-            # Check if we've updated this key recently
-            last_update = await redis_client.get(throttle_key)
-            if last_update:
-                # Already updated within throttle interval, skip
-                return
-
-            # Set throttle flag first to prevent race conditions
-            await redis_client.setex(throttle_key, throttle_interval, "1")
-
-        except Exception as redis_error:
-            # Fallback to in-memory throttling when Redis unavailable
-            logger.debug(
-                f"Redis unavailable for throttling, using in-memory fallback: {redis_error}"
-            )
-
-            # Clean up old entries (simple cleanup every 100 operations)
-            if len(self._throttle_cache) > 1000:
-                cutoff_time = current_time - (
-                    throttle_interval * 2
-                )  # Keep extra buffer
-                self._throttle_cache = {
-                    k: v for k, v in self._throttle_cache.items() if v > cutoff_time
-                }
-
-            # Check in-memory throttle
-            last_update_time = self._throttle_cache.get(key_id, 0)
-            if current_time - last_update_time < throttle_interval:
-                # Already updated within throttle interval, skip
-                return
-
-            # Set in-memory throttle
-            self._throttle_cache[key_id] = current_time
-
-        # Update database
-        try:
-            client = await self.db.client
-            await client.table("api_keys").update(
-                {"last_used_at": datetime.now(timezone.utc).isoformat()}
-            ).eq("key_id", key_id).execute()
-
-            logger.debug(f"Updated last_used_at for key {key_id}")
-
-        except Exception as e:
-            logger.warning(f"Failed to update last_used_at for key {key_id}: {e}")
-
     async def _update_last_used_async(self, key_id: str):
         """Legacy method - kept for backwards compatibility"""
-        await self._update_last_used_throttled(key_id)
-
-    async def _clear_throttle(self, key_id: str):
-        """Clear the throttle for a specific key (useful for testing)"""
-        try:
-            redis_client = await redis.get_client()
-            throttle_key = f"last_used_throttle:{key_id}"
-            await redis_client.delete(throttle_key)
-            logger.debug(f"Cleared throttle for key {key_id}")
-        except Exception as e:
-            logger.warning(f"Failed to clear throttle for key {key_id}: {e}")
+        api_key_usage.record(key_id)
 
     async def delete_api_key(self, account_id: UUID, key_id: UUID) -> bool:
         """
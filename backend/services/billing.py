@@ -6,14 +6,18 @@ stripe listen --forward-to localhost:8000/api/billing/webhook
 
 from fastapi import APIRouter, HTTPException, Depends, Request
 from typing import Optional, Dict, Tuple
+import base64
 import stripe
+import uuid
 from datetime import datetime, timezone, timedelta
 
 from supabase import Client as SupabaseClient
 from utils.cache import Cache
+from utils import request_cache
 from utils.logger import logger
 from utils.config import config, EnvMode
 from services.supabase import DBConnection
+from services import usage_ledger
 from utils.auth_utils import get_current_user_id_from_jwt
 from pydantic import BaseModel
 from utils.constants import MODEL_ACCESS_TIERS, MODEL_NAME_ALIASES, HARDCODED_MODEL_PRICES
@@ -242,129 +246,123 @@ async def create_stripe_customer(client, user_id: str, email: str) -> str:
 
 async def get_user_subscription(user_id: str) -> Optional[Dict]:
     """Get the current subscription for a user from Stripe."""
-    try:
-        result = await Cache.get(f"user_subscription:{user_id}")
-        if result:
-            return result
+    return await request_cache.memoize(f"user_subscription:{user_id}", lambda: _load_user_subscription(user_id))
 
-        # Get customer ID
-        db = DBConnection()
-        client = await db.client
-        customer_id = await get_stripe_customer_id(client, user_id)
-        
-        if not customer_id:
-            await Cache.set(f"user_subscription:{user_id}", None, ttl=1 * 60)
-            return None
-            
-        # Get all active subscriptions for the customer
-        subscriptions = await stripe.Subscription.list_async(
-            customer=customer_id,
-            status='active'
-        )
-        # print("Found subscriptions:", subscriptions)
-        
-        # Check if we have any subscriptions
-        if not subscriptions or not subscriptions.get('data'):
-            await Cache.set(f"user_subscription:{user_id}", None, ttl=1 * 60)
-            return None
-            
-        # Filter subscriptions to only include our product's subscriptions
-        our_subscriptions = []
-        for sub in subscriptions['data']:
-            # Check if subscription items contain any of our price IDs
-            for item in sub.get('items', {}).get('data', []):
-                price_id = item.get('price', {}).get('id')
-                if price_id in [
-                    config.STRIPE_FREE_TIER_ID,
-                    config.STRIPE_TIER_2_20_ID, config.STRIPE_TIER_6_50_ID, config.STRIPE_TIER_12_100_ID,
-                    config.STRIPE_TIER_25_200_ID, config.STRIPE_TIER_50_400_ID, config.STRIPE_TIER_125_800_ID,
-                    config.STRIPE_TIER_200_1000_ID,
-                    # Yearly tiers
-                    config.STRIPE_TIER_2_20_YEARLY_ID, config.STRIPE_TIER_6_50_YEARLY_ID,
-                    config.STRIPE_TIER_12_100_YEARLY_ID, config.STRIPE_TIER_25_200_YEARLY_ID,
-                    config.STRIPE_TIER_50_400_YEARLY_ID, config.STRIPE_TIER_125_800_YEARLY_ID,
-                    config.STRIPE_TIER_200_1000_YEARLY_ID,
-                    # Yearly commitment tiers (monthly payments with 12-month commitment)
-                    config.STRIPE_TIER_2_17_YEARLY_COMMITMENT_ID,
-                    config.STRIPE_TIER_6_42_YEARLY_COMMITMENT_ID,
-                    config.STRIPE_TIER_25_170_YEARLY_COMMITMENT_ID
-                ]:
-                    our_subscriptions.append(sub)
-        
-        if not our_subscriptions:
-            await Cache.set(f"user_subscription:{user_id}", None, ttl=1 * 60)
-            return None
-            
-        # If there are multiple active subscriptions, we need to handle this
-        if len(our_subscriptions) > 1:
-            logger.warning(f"User {user_id} has multiple active subscriptions: {[sub['id'] for sub in our_subscriptions]}")
-            
-            # Get the most recent subscription
-            most_recent = max(our_subscriptions, key=lambda x: x['created'])
-            
-            # Cancel all other subscriptions
-            for sub in our_subscriptions:
-                if sub['id'] != most_recent['id']:
-                    try:
-                        await stripe.Subscription.modify_async(
-                            sub['id'],
-                            cancel_at_period_end=True
-                        )
-                        logger.info(f"Cancelled subscription {sub['id']} for user {user_id}")
-                    except Exception as e:
-                        logger.error(f"Error cancelling subscription {sub['id']}: {str(e)}")
-            
-            return most_recent
+async def invalidate_subscription_cache(user_id: str) -> None:
+    """Drop cached subscription data after changing the user's subscription, in this request and across processes."""
+    for key in (f"user_subscription:{user_id}", f"subscription_tier:{user_id}", f"allowed_models_for_user:{user_id}"):
+        request_cache.forget(key)
+    for key in (f"user_subscription:{user_id}", f"allowed_models_for_user:{user_id}"):
+        try:
+            await Cache.invalidate(key)
+        except Exception as e:
+            logger.warning(f"Failed to invalidate {key}: {str(e)}")
 
-        result = our_subscriptions[0]
-        await Cache.set(f"user_subscription:{user_id}", result, ttl=1 * 60)
-        return result
+async def _load_user_subscription(user_id: str) -> Optional[Dict]:
+    try:
+        # Users without a subscription are cached too; concurrent misses share one Stripe lookup
+        return await Cache.get_or_load(f"user_subscription:{user_id}", lambda: _fetch_user_subscription(user_id), ttl=1 * 60)
         
     except Exception as e:
         logger.error(f"Error getting subscription from Stripe: {str(e)}")
         return None
 
-async def calculate_monthly_usage(client, user_id: str) -> float:
-    """Calculate total agent run minutes for the current month for a user."""
-    result = await Cache.get(f"monthly_usage:{user_id}")
-    if result:
-        return result
-
-    start_time = time.time()
+async def _fetch_user_subscription(user_id: str) -> Optional[Dict]:
+    # Get customer ID
+    db = DBConnection()
+    client = await db.client
+    customer_id = await get_stripe_customer_id(client, user_id)
     
-    # Use get_usage_logs to fetch all usage data (it already handles the date filtering and batching)
-    total_cost = 0.0
-    page = 0
-    items_per_page = 1000
+    if not customer_id:
+        return None
+        
+    # Get all active subscriptions for the customer
+    subscriptions = await stripe.Subscription.list_async(
+        customer=customer_id,
+        status='active'
+    )
+    # print("Found subscriptions:", subscriptions)
     
-    while True:
-        # Get usage logs for this page
-        usage_result = await get_usage_logs(client, user_id, page, items_per_page)
+    # Check if we have any subscriptions
+    if not subscriptions or not subscriptions.get('data'):
+        return None
         
-        if not usage_result['logs']:
-            break
+    # Filter subscriptions to only include our product's subscriptions
+    our_subscriptions = []
+    for sub in subscriptions['data']:
+        # Check if subscription items contain any of our price IDs
+        for item in sub.get('items', {}).get('data', []):
+            price_id = item.get('price', {}).get('id')
+            if price_id in [
+                config.STRIPE_FREE_TIER_ID,
+                config.STRIPE_TIER_2_20_ID, config.STRIPE_TIER_6_50_ID, config.STRIPE_TIER_12_100_ID,
+                config.STRIPE_TIER_25_200_ID, config.STRIPE_TIER_50_400_ID, config.STRIPE_TIER_125_800_ID,
+                config.STRIPE_TIER_200_1000_ID,
+                # Yearly tiers
+                config.STRIPE_TIER_2_20_YEARLY_ID, config.STRIPE_TIER_6_50_YEARLY_ID,
+                config.STRIPE_TIER_12_100_YEARLY_ID, config.STRIPE_TIER_25_200_YEARLY_ID,
+                config.STRIPE_TIER_50_400_YEARLY_ID, config.STRIPE_TIER_125_800_YEARLY_ID,
+                config.STRIPE_TIER_200_1000_YEARLY_ID,
+                # Yearly commitment tiers (monthly payments with 12-month commitment)
+                config.STRIPE_TIER_2_17_YEARLY_COMMITMENT_ID,
+                config.STRIPE_TIER_6_42_YEARLY_COMMITMENT_ID,
+                config.STRIPE_TIER_25_170_YEARLY_COMMITMENT_ID
+            ]:
+                our_subscriptions.append(sub)
+    
+    if not our_subscriptions:
+        return None
         
-        # Sum up the estimated costs from this page
-        for log_entry in usage_result['logs']:
-            total_cost += log_entry['estimated_cost']
+    # If there are multiple active subscriptions, we need to handle this
+    if len(our_subscriptions) > 1:
+        logger.warning(f"User {user_id} has multiple active subscriptions: {[sub['id'] for sub in our_subscriptions]}")
         
-        # If there are no more pages, break
-        if not usage_result['has_more']:
-            break
-            
-        page += 1
+        # Get the most recent subscription
+        most_recent = max(our_subscriptions, key=lambda x: x['created'])
+        
+        # Cancel all other subscriptions
+        for sub in our_subscriptions:
+            if sub['id'] != most_recent['id']:
+                try:
+                    await stripe.Subscription.modify_async(
+                        sub['id'],
+                        cancel_at_period_end=True
+                    )
+                    logger.info(f"Cancelled subscription {sub['id']} for user {user_id}")
+                except Exception as e:
+                    logger.error(f"Error cancelling subscription {sub['id']}: {str(e)}")
+        
+        return most_recent
+
+    return our_subscriptions[0]
+
+async def calculate_monthly_usage(client, user_id: str) -> float:
+    """Get the user's spend for the current month from the usage ledger."""
+    return await request_cache.memoize(f"monthly_usage:{user_id}", lambda: _load_monthly_usage(client, user_id))
+
+async def _load_monthly_usage(client, user_id: str) -> float:
+    try:
+        return await usage_ledger.get_monthly_usage(client, user_id)
+    except Exception as e:
+        logger.warning(f"Usage ledger unavailable for {user_id}, recomputing from messages: {str(e)}")
+        return await compute_monthly_usage(client, user_id)
+
+
+async def compute_monthly_usage(client, user_id: str) -> float:
+    """Recompute the user's spend for the current month from the server-side usage summary."""
+    start_time = time.time()
+    
+    summary = await get_usage_summary(client, user_id)
+    total_cost = summary['total_cost']
     
     end_time = time.time()
     execution_time = end_time - start_time
     logger.info(f"Calculate monthly usage took {execution_time:.3f} seconds, total cost: {total_cost}")
-    
-    await Cache.set(f"monthly_usage:{user_id}", total_cost, ttl=2 * 60)
     return total_cost
 
 
-async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: int = 1000) -> Dict:
-    """Get detailed usage logs for a user with pagination."""
-    # Get start of current month in UTC
+def get_usage_period_start() -> datetime:
+    """Start of the current billing month in UTC, never before the token accounting cutoff."""
     now = datetime.now(timezone.utc)
     start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
     
@@ -372,111 +370,110 @@ async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: in
     # Ignore all token counts before this date
     cutoff_date = datetime(2025, 6, 30, 9, 0, 0, tzinfo=timezone.utc)
     
-    start_of_month = max(start_of_month, cutoff_date)
-    
-    # First get all threads for this user in batches
-    batch_size = 1000
-    offset = 0
-    all_threads = []
-    
-    while True:
-        threads_batch = await client.table('threads') \
-            .select('thread_id, agent_runs(thread_id)') \
-            .eq('account_id', user_id) \
-            .gte('agent_runs.created_at', start_of_month.isoformat()) \
-            .range(offset, offset + batch_size - 1) \
-            .execute()
-        
-        if not threads_batch.data:
-            break
-            
-        all_threads.extend(threads_batch.data)
-        
-        # If we got less than batch_size, we've reached the end
-        if len(threads_batch.data) < batch_size:
-            break
-            
-        offset += batch_size
-    
-    if not all_threads:
-        return {"logs": [], "has_more": False}
+    return max(start_of_month, cutoff_date)
+
+
+def encode_usage_cursor(created_at: str, message_id: str) -> str:
+    """Opaque keyset cursor pointing after the given usage log entry."""
+    return base64.urlsafe_b64encode(f"{created_at}|{message_id}".encode()).decode()
+
+
+def decode_usage_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverse of encode_usage_cursor; raises ValueError for malformed cursors."""
+    try:
+        created_at, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        uuid.UUID(message_id)
+    except Exception as e:
+        raise ValueError(f"Invalid usage logs cursor: {cursor}") from e
+    return created_at, message_id
+
+
+async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: int = 1000, cursor: Optional[str] = None) -> Dict:
+    """Get detailed usage logs for a user, newest first.
     
-    thread_ids = [t['thread_id'] for t in all_threads]
+    Pass the previous response's ``next_cursor`` as ``cursor`` to fetch the next
+    page; ``page`` is only honoured without a cursor, for older clients.
+    """
+    before_created_at, before_message_id = decode_usage_cursor(cursor) if cursor else (None, None)
     
-    # Fetch usage messages with pagination, including thread project info
     start_time = time.time()
-    messages_result = await client.table('messages') \
-        .select(
-            'message_id, thread_id, created_at, content, threads!inner(project_id)'
-        ) \
-        .in_('thread_id', thread_ids) \
-        .eq('type', 'assistant_response_end') \
-        .gte('created_at', start_of_month.isoformat()) \
-        .order('created_at', desc=True) \
-        .range(page * items_per_page, (page + 1) * items_per_page - 1) \
-        .execute()
+    messages_result = await client.rpc('get_usage_logs_page', {
+        'p_account_id': user_id,
+        'p_since': get_usage_period_start().isoformat(),
+        'p_limit': items_per_page,
+        'p_before_created_at': before_created_at,
+        'p_before_message_id': before_message_id,
+        'p_offset': 0 if cursor else page * items_per_page,
+    }).execute()
     
     end_time = time.time()
     execution_time = end_time - start_time
     logger.info(f"Database query for usage logs took {execution_time:.3f} seconds")
 
     if not messages_result.data:
-        return {"logs": [], "has_more": False}
+        return {"logs": [], "has_more": False, "next_cursor": None}
 
-    # Process messages into usage log entries
     processed_logs = []
-    
-    for message in messages_result.data:
-        try:
-            # Safely extract usage data with defaults
-            content = message.get('content', {})
-            usage = content.get('usage', {})
-            
-            # Ensure usage has required fields with safe defaults
-            prompt_tokens = usage.get('prompt_tokens', 0)
-            completion_tokens = usage.get('completion_tokens', 0)
-            model = content.get('model', 'unknown')
-            
-            # Safely calculate total tokens
-            total_tokens = (prompt_tokens or 0) + (completion_tokens or 0)
-            
-            # Calculate estimated cost using the same logic as calculate_monthly_usage
-            estimated_cost = calculate_token_cost(
-                prompt_tokens,
-                completion_tokens,
-                model
-            )
-            
-            # Safely extract project_id from threads relationship
-            project_id = 'unknown'
-            if message.get('threads') and isinstance(message['threads'], list) and len(message['threads']) > 0:
-                project_id = message['threads'][0].get('project_id', 'unknown')
-            
-            processed_logs.append({
-                'message_id': message.get('message_id', 'unknown'),
-                'thread_id': message.get('thread_id', 'unknown'),
-                'created_at': message.get('created_at', None),
-                'content': {
-                    'usage': {
-                        'prompt_tokens': prompt_tokens,
-                        'completion_tokens': completion_tokens
-                    },
-                    'model': model
+    for row in messages_result.data:
+        prompt_tokens = row['prompt_tokens']
+        completion_tokens = row['completion_tokens']
+        model = row['model']
+        processed_logs.append({
+            'message_id': row['message_id'],
+            'thread_id': row['thread_id'],
+            'created_at': row['created_at'],
+            'content': {
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens
                 },
-                'total_tokens': total_tokens,
-                'estimated_cost': estimated_cost,
-                'project_id': project_id
-            })
-        except Exception as e:
-            logger.warning(f"Error processing usage log entry for message {message.get('message_id', 'unknown')}: {str(e)}")
-            continue
+                'model': model
+            },
+            'total_tokens': prompt_tokens + completion_tokens,
+            'estimated_cost': calculate_token_cost(prompt_tokens, completion_tokens, model),
+            'project_id': row['project_id'] or 'unknown'
+        })
     
     # Check if there are more results
     has_more = len(processed_logs) == items_per_page
+    last = messages_result.data[-1]
     
     return {
         "logs": processed_logs,
-        "has_more": has_more
+        "has_more": has_more,
+        "next_cursor": encode_usage_cursor(last['created_at'], last['message_id']) if has_more else None
+    }
+
+
+async def get_usage_summary(client, user_id: str) -> Dict:
+    """Get the user's usage for the current month aggregated per day, model and project."""
+    start_time = time.time()
+    summary_result = await client.rpc('get_usage_summary', {
+        'p_account_id': user_id,
+        'p_since': get_usage_period_start().isoformat(),
+    }).execute()
+    logger.info(f"Database query for usage summary took {time.time() - start_time:.3f} seconds")
+
+    days = []
+    for row in summary_result.data or []:
+        prompt_tokens = row['prompt_tokens']
+        completion_tokens = row['completion_tokens']
+        days.append({
+            'date': row['usage_date'],
+            'model': row['model'],
+            'project_id': row['project_id'] or 'unknown',
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'request_count': row['request_count'],
+            'estimated_cost': calculate_token_cost(prompt_tokens, completion_tokens, row['model'])
+        })
+    
+    return {
+        "days": days,
+        "total_cost": sum(day['estimated_cost'] for day in days),
+        "total_tokens": sum(day['total_tokens'] for day in days)
     }
 
 
@@ -553,11 +550,10 @@ async def get_allowed_models_for_user(client, user_id: str):
     Returns:
         List of model names allowed for the user's subscription tier.
     """
+    key = f"allowed_models_for_user:{user_id}"
+    return await request_cache.memoize(key, lambda: Cache.get_or_load(key, lambda: _load_allowed_models_for_user(user_id), ttl=1 * 60))
 
-    result = await Cache.get(f"allowed_models_for_user:{user_id}")
-    if result:
-        return result
-
+async def _load_allowed_models_for_user(user_id: str):
     subscription = await get_user_subscription(user_id)
     tier_name = 'free'
     
@@ -574,9 +570,7 @@ async def get_allowed_models_for_user(client, user_id: str):
             tier_name = tier_info['name']
     
     # Return allowed models for this tier
-    result = MODEL_ACCESS_TIERS.get(tier_name, MODEL_ACCESS_TIERS['free'])  # Default to free tier if unknown
-    await Cache.set(f"allowed_models_for_user:{user_id}", result, ttl=1 * 60)
-    return result
+    return MODEL_ACCESS_TIERS.get(tier_name, MODEL_ACCESS_TIERS['free'])  # Default to free tier if unknown
 
 
 async def can_use_model(client, user_id: str, model_name: str):
@@ -609,6 +603,9 @@ async def can_use_model(client, user_id: str, model_name: str):
     return False, f"Your current subscription plan does not include access to {model_name}. Please upgrade your subscription or choose from your available models: {', '.join(allowed_models)}", allowed_models
 
 async def get_subscription_tier(client, user_id: str) -> str:
+    return await request_cache.memoize(f"subscription_tier:{user_id}", lambda: _load_subscription_tier(user_id))
+
+async def _load_subscription_tier(user_id: str) -> str:
     try:
         subscription = await get_user_subscription(user_id)
         
@@ -878,6 +875,7 @@ async def create_checkout_session(
                                 'commitment_type': request.commitment_type or 'monthly'
                             }
                         )
+                        await invalidate_subscription_cache(current_user_id)
                         
                         # Update active status in database
                         await client.schema('basejump').from_('billing_customers').update(
@@ -966,6 +964,7 @@ async def create_checkout_session(
                         proration_behavior='always_invoice', # Prorate and charge immediately
                         billing_cycle_anchor='now' # Reset billing cycle
                     )
+                    await invalidate_subscription_cache(current_user_id)
                     
                     # Update active status in database to true (customer has active subscription)
                     await client.schema('basejump').from_('billing_customers').update(
@@ -1033,6 +1032,7 @@ async def create_checkout_session(
                         proration_behavior='none',  # No proration for downgrades
                         billing_cycle_anchor='unchanged'  # Keep current billing cycle
                     )
+                    await invalidate_subscription_cache(current_user_id)
                     
                     # Update active status in database
                     await client.schema('basejump').from_('billing_customers').update(
@@ -1591,9 +1591,14 @@ async def get_available_models(
 async def get_usage_logs_endpoint(
     page: int = 0,
     items_per_page: int = 1000,
+    cursor: Optional[str] = None,
     current_user_id: str = Depends(get_current_user_id_from_jwt)
 ):
-    """Get detailed usage logs for a user with pagination."""
+    """Get detailed usage logs for a user with pagination.
+    
+    Pass ``next_cursor`` from the previous response as ``cursor``; ``page`` is
+    kept for older clients.
+    """
     try:
         # Get Supabase client
         db = DBConnection()
@@ -1615,7 +1620,10 @@ async def get_usage_logs_endpoint(
             raise HTTPException(status_code=400, detail="Items per page must be between 1 and 1000")
         
         # Get usage logs
-        result = await get_usage_logs(client, current_user_id, page, items_per_page)
+        try:
+            result = await get_usage_logs(client, current_user_id, page, items_per_page, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         return result
         
@@ -1625,6 +1633,30 @@ async def get_usage_logs_endpoint(
         logger.error(f"Error getting usage logs: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error getting usage logs: {str(e)}")
 
+@router.get("/usage-summary")
+async def get_usage_summary_endpoint(
+    current_user_id: str = Depends(get_current_user_id_from_jwt)
+):
+    """Get the user's usage for the current month aggregated per day, model and project."""
+    try:
+        db = DBConnection()
+        client = await db.client
+        
+        if config.ENV_MODE == EnvMode.LOCAL:
+            logger.info("Running in local development mode - usage summary is not available")
+            return {
+                "days": [],
+                "total_cost": 0.0,
+                "total_tokens": 0,
+                "message": "Usage summary is not available in local development mode"
+            }
+        
+        return await get_usage_summary(client, current_user_id)
+        
+    except Exception as e:
+        logger.error(f"Error getting usage summary: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error getting usage summary: {str(e)}")
+
 @router.get("/subscription-commitment/{subscription_id}")
 async def get_subscription_commitment(
     subscription_id: str,
@@ -1719,6 +1751,7 @@ async def cancel_subscription(
                     'scheduled_cancel_at_commitment_end': 'true'
                 }
             )
+            await invalidate_subscription_cache(current_user_id)
             
             logger.info(f"Subscription {subscription_id} scheduled for cancellation at commitment end: {commitment_end_date}")
             
@@ -1745,6 +1778,7 @@ async def cancel_subscription(
                 'cancellation_date': str(int(datetime.now(timezone.utc).timestamp()))
             }
         )
+        await invalidate_subscription_cache(current_user_id)
 
         logger.info(f"Subscription {subscription_id} marked for cancellation at period end")
         
@@ -1825,6 +1859,7 @@ async def reactivate_subscription(
             subscription_id,
             **modify_params
         )
+        await invalidate_subscription_cache(current_user_id)
         
         logger.info(f"Subscription {subscription_id} reactivated by user")
         
@@ -0,0 +1,77 @@
+"""
+Shared, pooled outbound HTTP clients.
+
+Tools and services that talk to third-party HTTP APIs should take a client from
+here instead of creating an ``httpx.AsyncClient`` per call, so TLS sessions and
+keep-alive connections are reused across requests within a process.
+
+Clients are bound to the event loop they were created on; if a different loop
+asks for a client (e.g. a script calling ``asyncio.run`` twice) a fresh set of
+clients is created for it.
+"""
+
+import asyncio
+from typing import Dict, Optional
+
+import httpx
+
+from utils.logger import logger
+
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+DEFAULT_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+HTTP2_ENABLED = _http2_available()
+
+
+def _bind_to_running_loop() -> None:
+    global _loop
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    if _loop is not loop:
+        if _clients:
+            logger.debug("Event loop changed; discarding pooled HTTP clients bound to the previous loop")
+        _clients.clear()
+        _loop = loop
+
+
+def get_client(
+    name: str = "default",
+    timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+    limits: httpx.Limits = DEFAULT_LIMITS,
+) -> httpx.AsyncClient:
+    """Get (or lazily create) the named pooled client.
+
+    ``timeout`` and ``limits`` only apply when the client is first created.
+    """
+    _bind_to_running_loop()
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(timeout=timeout, limits=limits, http2=HTTP2_ENABLED)
+        _clients[name] = client
+        logger.debug(f"Created pooled HTTP client '{name}' (http2={HTTP2_ENABLED})")
+    return client
+
+
+async def close() -> None:
+    """Close all pooled clients."""
+    clients = list(_clients.items())
+    _clients.clear()
+    for name, client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing HTTP client '{name}': {e}")
@@ -5,18 +5,28 @@ This module provides a unified interface for making API calls to different LLM p
 (OpenAI, Anthropic, Groq, xAI, etc.) using LiteLLM. It includes support for:
 - Streaming responses
 - Tool calls and function calling
-- Retry logic with exponential backoff
+- Retry logic honouring provider Retry-After hints
+- Latency-aware routing: per-model TTFT and error-rate tracking, hedged
+  streaming requests and failover to OpenRouter fallbacks
 - Model-specific configurations
 - Comprehensive error handling and logging
 """
 
-from typing import Union, Dict, Any, Optional, AsyncGenerator, List
+from typing import Union, Dict, Any, Optional, AsyncGenerator, List, Deque, Tuple
 import os
 import json
+import time
 import asyncio
-from openai import OpenAIError
+import statistics
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import httpx
+from openai import APIConnectionError, InternalServerError, OpenAIError, RateLimitError
 import litellm
 from litellm.files.main import ModelResponse
+from services.http_client import HTTP2_ENABLED
 from utils.logger import logger
 from utils.config import config
 
@@ -27,9 +37,32 @@ litellm.drop_params = True
 
 # Constants
 MAX_RETRIES = 2
-RATE_LIMIT_DELAY = 30
+RATE_LIMIT_DELAY = 30  # Used only when the provider sends no Retry-After hint
+MAX_RETRY_AFTER = 60
 RETRY_DELAY = 0.1
 
+# Latency-aware routing
+ROUTING_WINDOW_SECONDS = 300
+ROUTING_WINDOW_SIZE = 200
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 2.0
+HEDGE_MAX_DELAY = 30.0
+REROUTE_ERROR_RATE = 0.5
+REROUTE_MIN_SAMPLES = 10
+
+# Pooled provider connections
+LLM_HTTP_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+LLM_HTTP_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=120.0)
+PROVIDER_HOSTS = {
+    "openai": "api.openai.com",
+    "anthropic": "api.anthropic.com",
+    "openrouter": "openrouter.ai",
+    "xai": "api.x.ai",
+    "groq": "api.groq.com",
+    "gemini": "generativelanguage.googleapis.com",
+    "morph": "api.morphllm.com",
+}
+
 class LLMError(Exception):
     """Base exception for LLM-related errors."""
     pass
@@ -67,6 +100,131 @@ def setup_api_keys() -> None:
     else:
         logger.warning(f"Missing AWS credentials for Bedrock integration - access_key: {bool(aws_access_key)}, secret_key: {bool(aws_secret_key)}, region: {aws_region}")
 
+class ConnectionStats:
+    """Request and connection counters for one provider's pool, fed by httpcore trace events."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.http2_requests = 0
+
+    async def on_trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+        elif event_name == "http11.send_request_headers.started":
+            self.requests += 1
+        elif event_name == "http2.send_request_headers.started":
+            self.requests += 1
+            self.http2_requests += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        reused = max(self.requests - self.connections_opened, 0)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+            "http2_requests": self.http2_requests,
+            "reuse_ratio": round(reused / self.requests, 3) if self.requests else None,
+        }
+
+
+_http_client: Optional[httpx.AsyncClient] = None
+_http_loop: Optional[asyncio.AbstractEventLoop] = None
+_anthropic_handler = None
+_connection_stats: Dict[str, ConnectionStats] = defaultdict(ConnectionStats)
+
+
+def _provider_hosts() -> Dict[str, str]:
+    hosts = {host: provider for provider, host in PROVIDER_HOSTS.items()}
+    if config.OPENROUTER_API_BASE:
+        openrouter_host = urlparse(config.OPENROUTER_API_BASE).hostname
+        if openrouter_host:
+            hosts[openrouter_host] = "openrouter"
+    return hosts
+
+
+async def init_http_transport() -> None:
+    """Create the pooled provider connections shared by all litellm calls in this process.
+
+    One client carries a separate keep-alive connection pool (HTTP/2 when
+    available) per provider host. OpenAI-SDK based providers pick it up through
+    ``litellm.aclient_session``; Anthropic calls, which go through litellm's own
+    httpx handler, are given a handler backed by the same client.
+    """
+    global _http_client, _http_loop, _anthropic_handler
+    if _http_client is not None and not _http_client.is_closed:
+        return
+
+    hosts = _provider_hosts()
+
+    async def trace_request(request: httpx.Request) -> None:
+        provider = hosts.get(request.url.host, "other")
+        request.extensions["trace"] = _connection_stats[provider].on_trace
+
+    mounts = {
+        f"https://{host}": httpx.AsyncHTTPTransport(http2=HTTP2_ENABLED, limits=LLM_HTTP_LIMITS)
+        for host in hosts
+    }
+    _http_client = httpx.AsyncClient(
+        timeout=LLM_HTTP_TIMEOUT,
+        limits=LLM_HTTP_LIMITS,
+        http2=HTTP2_ENABLED,
+        mounts=mounts,
+        event_hooks={"request": [trace_request]},
+    )
+    _http_loop = asyncio.get_running_loop()
+    litellm.aclient_session = _http_client
+
+    try:
+        from litellm.llms.custom_httpx.http_handler import AsyncHTTPHandler
+        handler = AsyncHTTPHandler(timeout=LLM_HTTP_TIMEOUT)
+        await handler.client.aclose()
+        handler.client = _http_client
+        _anthropic_handler = handler
+    except Exception as e:
+        logger.warning(f"Anthropic calls will use litellm's default HTTP client: {e}")
+        _anthropic_handler = None
+
+    logger.info(f"Initialized pooled LLM HTTP transport for {len(mounts)} provider hosts (http2={HTTP2_ENABLED})")
+
+
+async def close_http_transport() -> None:
+    """Close the pooled provider connections."""
+    global _http_client, _http_loop, _anthropic_handler
+    client = _http_client
+    _http_client = None
+    _http_loop = None
+    _anthropic_handler = None
+    if litellm.aclient_session is client:
+        litellm.aclient_session = None
+    if client is not None:
+        logger.info(f"LLM HTTP connection stats: {get_http_transport_stats()}")
+        await client.aclose()
+
+
+def get_http_transport_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-provider request, connection and reuse counters."""
+    return {provider: stats.snapshot() for provider, stats in _connection_stats.items()}
+
+
+def _attach_http_client(params: Dict[str, Any]) -> None:
+    """Route Anthropic calls through the pooled transport when it lives on this loop."""
+    if _anthropic_handler is None or not params["model"].startswith("anthropic/"):
+        return
+    try:
+        if asyncio.get_running_loop() is not _http_loop:
+            return
+    except RuntimeError:
+        return
+    params["client"] = _anthropic_handler
+    # litellm would hand this handler to its OpenRouter fallback as well, which
+    # expects an OpenAI client; route_request already fails over to OpenRouter
+    params.pop("fallbacks", None)
+
+
 def get_openrouter_fallback(model_name: str) -> Optional[str]:
     """Get OpenRouter fallback model for a given model name."""
     # Skip if already using OpenRouter
@@ -98,9 +256,256 @@ def get_openrouter_fallback(model_name: str) -> Optional[str]:
     
     return None
 
+class ModelStats:
+    """Sliding window of recent request outcomes for one model."""
+
+    def __init__(self):
+        # (finished_at, ttft_seconds or None, succeeded)
+        self._samples: Deque[Tuple[float, Optional[float], bool]] = deque(maxlen=ROUTING_WINDOW_SIZE)
+
+    def record(self, ttft: Optional[float], ok: bool) -> None:
+        self._samples.append((time.monotonic(), ttft, ok))
+
+    def _recent(self) -> List[Tuple[float, Optional[float], bool]]:
+        cutoff = time.monotonic() - ROUTING_WINDOW_SECONDS
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return list(self._samples)
+
+    def p95_ttft(self) -> Optional[float]:
+        ttfts = [ttft for _, ttft, ok in self._recent() if ok and ttft is not None]
+        if len(ttfts) < HEDGE_MIN_SAMPLES:
+            return None
+        return statistics.quantiles(ttfts, n=20)[-1]
+
+    def error_rate(self) -> Optional[float]:
+        samples = self._recent()
+        if len(samples) < REROUTE_MIN_SAMPLES:
+            return None
+        return sum(1 for _, _, ok in samples if not ok) / len(samples)
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = self._recent()
+        ttfts = [ttft for _, ttft, ok in samples if ok and ttft is not None]
+        p95 = self.p95_ttft()
+        return {
+            "requests": len(samples),
+            "errors": sum(1 for _, _, ok in samples if not ok),
+            "p50_ttft": round(statistics.median(ttfts), 3) if ttfts else None,
+            "p95_ttft": round(p95, 3) if p95 is not None else None,
+        }
+
+
+_model_stats: Dict[str, ModelStats] = defaultdict(ModelStats)
+_hedge_stats = {"hedged": 0, "won_by_hedge": 0, "won_by_primary": 0, "rerouted": 0, "failed_over": 0}
+
+
+def get_routing_stats() -> Dict[str, Any]:
+    """Per-model TTFT/error stats over the sliding window plus hedging counters."""
+    return {
+        "models": {model: stats.snapshot() for model, stats in _model_stats.items()},
+        "hedging": dict(_hedge_stats),
+    }
+
+
+def hedge_delay(model_name: str) -> Optional[float]:
+    """Seconds to wait for a first token before hedging; None until enough TTFT samples exist."""
+    p95 = _model_stats[model_name].p95_ttft()
+    if p95 is None:
+        return None
+    return min(max(p95, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Seconds the provider asked us to wait, from Retry-After / retry-after-ms headers."""
+    headers = getattr(error, "litellm_response_headers", None)
+    if headers is None:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        headers = {str(k).lower(): v for k, v in headers.items()}
+    except AttributeError:
+        return None
+
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_failover_error(error: Exception) -> bool:
+    """Whether the fallback provider may succeed where this one failed.
+
+    Rate limits, overload/5xx, timeouts and connection errors are provider-side;
+    bad requests, auth, context-window and content-policy errors would fail the
+    same way on the fallback.
+    """
+    # APITimeoutError is an APIConnectionError
+    if isinstance(error, (RateLimitError, APIConnectionError, InternalServerError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return isinstance(status_code, int) and (status_code == 429 or status_code >= 500)
+
+
+def _fallback_params(params: Dict[str, Any], fallback_model: str) -> Dict[str, Any]:
+    """Request parameters for the fallback model, reusing the already prepared messages."""
+    fallback = {**params, "model": fallback_model}
+    fallback.pop("fallbacks", None)
+    fallback.pop("model_id", None)
+    return fallback
+
+
+def route_request(model_name: str, params: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Pick the primary request and the optional fallback request to hedge or fail over to."""
+    fallback_model = get_openrouter_fallback(model_name) if config.OPENROUTER_API_KEY else None
+    if not fallback_model:
+        return params, None
+    # Failover happens here, not also inside litellm
+    params = {key: value for key, value in params.items() if key != "fallbacks"}
+    fallback = _fallback_params(params, fallback_model)
+
+    error_rate = _model_stats[model_name].error_rate()
+    fallback_error_rate = _model_stats[fallback_model].error_rate()
+    if error_rate is not None and error_rate >= REROUTE_ERROR_RATE and (fallback_error_rate is None or fallback_error_rate < error_rate):
+        _hedge_stats["rerouted"] += 1
+        logger.warning(f"Routing {model_name} to {fallback_model}: {error_rate:.0%} recent error rate")
+        return fallback, None
+    return params, fallback
+
+
+async def _discard_stream(iterator) -> None:
+    close = getattr(iterator, "aclose", None)
+    if close is None:
+        return
+    try:
+        await close()
+    except Exception as e:
+        logger.debug(f"Error closing discarded LLM stream: {e}")
+
+
+async def _open_stream(params: Dict[str, Any]) -> Tuple[List[Any], Any]:
+    """Start a streaming completion and wait for its first chunk, recording TTFT."""
+    model = params["model"]
+    _attach_http_client(params)
+    started = time.monotonic()
+    iterator = None
+    try:
+        response = await litellm.acompletion(**params)
+        iterator = response.__aiter__()
+        try:
+            first_chunks = [await iterator.__anext__()]
+        except StopAsyncIteration:
+            first_chunks = []
+    except asyncio.CancelledError:
+        # Lost a hedge race: the elapsed time is a lower bound on this model's TTFT
+        _model_stats[model].record(time.monotonic() - started, True)
+        if iterator is not None:
+            await _discard_stream(iterator)
+        raise
+    except Exception as e:
+        if is_failover_error(e):
+            _model_stats[model].record(None, False)
+        if iterator is not None:
+            await _discard_stream(iterator)
+        raise
+    _model_stats[model].record(time.monotonic() - started, True)
+    return first_chunks, iterator
+
+
+async def _replay_stream(first_chunks: List[Any], iterator) -> AsyncGenerator:
+    for chunk in first_chunks:
+        yield chunk
+    async for chunk in iterator:
+        yield chunk
+
+
+async def _stream_with_hedge(params: Dict[str, Any], hedge_params: Optional[Dict[str, Any]]) -> AsyncGenerator:
+    """Stream from the primary model, racing the fallback if the first token is late.
+
+    The hedge fires once the primary has gone past its recent p95 TTFT without a
+    first token. Whichever request produces a first token first wins; the other
+    is cancelled.
+    """
+    delay = hedge_delay(params["model"]) if hedge_params is not None and config.LLM_HEDGING_ENABLED else None
+    if delay is None:
+        return _replay_stream(*await _open_stream(params))
+
+    primary = asyncio.create_task(_open_stream(params))
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+    except asyncio.CancelledError:
+        primary.cancel()
+        raise
+    if done:
+        return _replay_stream(*primary.result())
+
+    _hedge_stats["hedged"] += 1
+    logger.info(f"No first token from {params['model']} after {delay:.1f}s; hedging to {hedge_params['model']}")
+    hedge = asyncio.create_task(_open_stream(hedge_params))
+
+    pending = {primary, hedge}
+    winner = None
+    errors = []
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                elif winner is None:
+                    winner = task
+                else:
+                    await _discard_stream(task.result()[1])
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if winner is None:
+        raise errors[0]
+    _hedge_stats["won_by_hedge" if winner is hedge else "won_by_primary"] += 1
+    return _replay_stream(*winner.result())
+
+
+async def _complete(params: Dict[str, Any]) -> ModelResponse:
+    model = params["model"]
+    _attach_http_client(params)
+    try:
+        response = await litellm.acompletion(**params)
+    except Exception as e:
+        if is_failover_error(e):
+            _model_stats[model].record(None, False)
+        raise
+    _model_stats[model].record(None, True)
+    return response
+
+
+def retry_delay(error: Exception) -> float:
+    """Seconds to wait before retrying after an error."""
+    if not isinstance(error, litellm.exceptions.RateLimitError):
+        return RETRY_DELAY
+    retry_after = get_retry_after(error)
+    if retry_after is None:
+        return RATE_LIMIT_DELAY
+    return min(retry_after, MAX_RETRY_AFTER)
+
+
 async def handle_error(error: Exception, attempt: int, max_attempts: int) -> None:
     """Handle API errors with appropriate delays and logging."""
-    delay = RATE_LIMIT_DELAY if isinstance(error, litellm.exceptions.RateLimitError) else RETRY_DELAY
+    delay = retry_delay(error)
     logger.warning(f"Error on attempt {attempt + 1}/{max_attempts}: {str(error)}")
     logger.debug(f"Waiting {delay} seconds before retry...")
     await asyncio.sleep(delay)
@@ -312,7 +717,8 @@ async def make_llm_api_call(
         reasoning_effort: Level of reasoning effort
 
     Returns:
-        Union[Dict[str, Any], AsyncGenerator]: API response or stream
+        Union[Dict[str, Any], AsyncGenerator]: API response or stream. Streams are
+        returned once their first chunk has arrived.
 
     Raises:
         LLMRetryError: If API call fails after retries
@@ -337,19 +743,29 @@ async def make_llm_api_call(
         enable_thinking=enable_thinking,
         reasoning_effort=reasoning_effort
     )
+    params, fallback_params = route_request(model_name, params)
     last_error = None
     for attempt in range(MAX_RETRIES):
         try:
             logger.debug(f"Attempt {attempt + 1}/{MAX_RETRIES}")
             # logger.debug(f"API request parameters: {json.dumps(params, indent=2)}")
 
-            response = await litellm.acompletion(**params)
-            logger.debug(f"Successfully received API response from {model_name}")
+            if stream:
+                response = await _stream_with_hedge(params, fallback_params)
+            else:
+                response = await _complete(params)
+            logger.debug(f"Successfully received API response from {params['model']}")
             # logger.debug(f"Response: {response}")
             return response
 
         except (litellm.exceptions.RateLimitError, OpenAIError, json.JSONDecodeError) as e:
             last_error = e
+            if fallback_params is not None and is_failover_error(e):
+                # Fail over right away instead of waiting out the primary provider
+                logger.warning(f"Error from {params['model']} on attempt {attempt + 1}/{MAX_RETRIES}, failing over to {fallback_params['model']}: {str(e)}")
+                _hedge_stats["failed_over"] += 1
+                params, fallback_params = fallback_params, None
+                continue
             await handle_error(e, attempt, MAX_RETRIES)
 
         except Exception as e:
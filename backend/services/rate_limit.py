@@ -0,0 +1,89 @@
+"""
+Redis token-bucket rate limiting.
+
+A ``RateLimit`` allows ``requests`` per ``per_seconds`` on average, with bursts
+of up to ``burst`` requests. Each scope a request counts against (API key,
+account, client IP) has its own bucket ``rate_limit:{bucket}:{scope}:{id}``.
+
+``check`` refills all buckets of a request and takes one token from each in a
+single Lua call. When any bucket is empty nothing is taken, so a rejected
+request doesn't use up the other scopes. Time comes from the Redis server, so
+API instances with skewed clocks share buckets correctly.
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from services import redis
+
+# Returns {0, "0"} when the request is allowed, otherwise the 1-based index of
+# the bucket that ran out and the seconds until it holds a token again.
+_TAKE = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local available = {}
+local blocked, retry_after = 0, 0
+for i = 1, #KEYS do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    available[i] = tokens
+    if tokens < 1 and (1 - tokens) / rate > retry_after then
+        blocked, retry_after = i, (1 - tokens) / rate
+    end
+end
+if blocked > 0 then
+    return {blocked, tostring(retry_after)}
+end
+for i = 1, #KEYS do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    redis.call('HSET', KEYS[i], 'tokens', tostring(available[i] - 1), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[i], math.ceil(capacity / rate) + 1)
+end
+return {0, '0'}
+"""
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    requests: int
+    per_seconds: float
+    burst: Optional[int] = None
+
+    @property
+    def capacity(self) -> int:
+        return self.burst or self.requests
+
+    @property
+    def rate(self) -> float:
+        """Tokens added per second."""
+        return self.requests / self.per_seconds
+
+
+def _bucket_key(bucket: str, scope: str, identity: str) -> str:
+    return f"rate_limit:{bucket}:{scope}:{identity}"
+
+
+async def check(bucket: str, scopes: List[Tuple[str, str, RateLimit]]) -> Optional[Tuple[str, float]]:
+    """Count one request against each ``(scope, identity, limit)``.
+
+    Returns None when the request is allowed, otherwise the scope that is
+    exhausted and the seconds until it allows a request again.
+    """
+    if not scopes:
+        return None
+
+    keys = [_bucket_key(bucket, scope, identity) for scope, identity, _ in scopes]
+    args = []
+    for _, _, limit in scopes:
+        args.extend([limit.capacity, limit.rate])
+
+    redis_client = await redis.get_client()
+    blocked, retry_after = await redis_client.eval(_TAKE, len(keys), *keys, *args)
+    if not blocked:
+        return None
+    return scopes[int(blocked) - 1][0], float(retry_after)
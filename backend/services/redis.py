@@ -3,7 +3,7 @@ import os
 from dotenv import load_dotenv
 import asyncio
 from utils.logger import logger
-from typing import List, Any
+from typing import AsyncIterator, List, Any
 from utils.retry import retry
 
 # Redis client and connection pool
@@ -169,9 +169,11 @@ async def lrange(key: str, start: int, end: int) -> List[str]:
 # Key management
 
 
-async def keys(pattern: str) -> List[str]:
+async def scan_keys(pattern: str, count: int = 1000) -> AsyncIterator[str]:
+    """Iterate over keys matching a pattern with SCAN, which, unlike KEYS, does not block Redis."""
     redis_client = await get_client()
-    return await redis_client.keys(pattern)
+    async for key in redis_client.scan_iter(match=pattern, count=count):
+        yield key
 
 
 async def expire(key: str, seconds: int):
@@ -0,0 +1,260 @@
+"""
+Per-account monthly usage ledger.
+
+Billing checks need an account's spend for the current month before every agent
+run. Recomputing it scans every ``assistant_response_end`` message of the month,
+so the spend is kept incrementally instead:
+
+- a Redis counter per account and month is incremented whenever an
+  ``assistant_response_end`` message is written, so a billing check is one GET;
+- counters touched since the last rollup are written to the
+  ``usage_ledger_monthly`` table periodically, which re-seeds Redis when a
+  counter is missing (eviction, flush, new deployment);
+- a reconciliation job recomputes accounts from their messages and overwrites
+  both, correcting drift from races or failed increments. The counter is only
+  overwritten if no increment landed while the messages were read; otherwise
+  the account is left for the next reconciliation.
+"""
+
+import asyncio
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from services import redis
+from utils.logger import logger
+
+LEDGER_KEY_TTL = 40 * 24 * 3600  # Outlives the month it counts
+ROLLUP_INTERVAL_SECONDS = 60
+ROLLUP_BATCH_SIZE = 500
+RECONCILE_INTERVAL_SECONDS = 15 * 60
+RECONCILE_MAX_AGE = timedelta(hours=6)
+RECONCILE_BATCH_SIZE = 50
+
+_DIRTY_SET = "usage_ledger:dirty"
+_RECONCILE_LOCK = "usage_ledger:reconcile_lock"
+_THREAD_ACCOUNT_CACHE_SIZE = 10_000
+
+# Only increments counters that exist: a missing counter must be seeded from the
+# rollup table or recomputed, not restarted from this single message.
+_INCREMENT_IF_SEEDED = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    local total = redis.call('INCRBYFLOAT', KEYS[1], ARGV[1])
+    redis.call('SADD', KEYS[2], ARGV[2])
+    return total
+end
+return false
+"""
+
+# Overwrites the counter only if it still holds ARGV[1] ('' = missing), i.e. no
+# increment landed since it was read.
+_SET_IF_UNCHANGED = """
+local current = redis.call('GET', KEYS[1])
+if (current or '') ~= ARGV[1] then
+    return current
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return ARGV[2]
+"""
+
+_thread_accounts: "OrderedDict[str, str]" = OrderedDict()
+_background_task: Optional[asyncio.Task] = None
+
+
+def current_month(now: Optional[datetime] = None) -> str:
+    now = now or datetime.now(timezone.utc)
+    return now.strftime("%Y-%m")
+
+
+def _ledger_key(account_id: str, month: str) -> str:
+    return f"usage_ledger:{account_id}:{month}"
+
+
+async def _account_for_thread(client, thread_id: str) -> Optional[str]:
+    account_id = _thread_accounts.get(thread_id)
+    if account_id is not None:
+        _thread_accounts.move_to_end(thread_id)
+        return account_id
+
+    result = await client.table('threads').select('account_id').eq('thread_id', thread_id).limit(1).execute()
+    if not result.data or not result.data[0].get('account_id'):
+        return None
+    account_id = result.data[0]['account_id']
+    _thread_accounts[thread_id] = account_id
+    if len(_thread_accounts) > _THREAD_ACCOUNT_CACHE_SIZE:
+        _thread_accounts.popitem(last=False)
+    return account_id
+
+
+async def record_response_end(client, thread_id: str, content: Dict[str, Any]) -> None:
+    """Add the cost of a just-written assistant_response_end message to its account's counter."""
+    from services.billing import calculate_token_cost
+
+    usage = content.get('usage') or {}
+    cost = calculate_token_cost(usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0), content.get('model', 'unknown'))
+    if cost <= 0:
+        return
+
+    account_id = await _account_for_thread(client, thread_id)
+    if not account_id:
+        return
+
+    month = current_month()
+    redis_client = await redis.get_client()
+    total = await redis_client.eval(_INCREMENT_IF_SEEDED, 2, _ledger_key(account_id, month), _DIRTY_SET, cost, f"{account_id}:{month}")
+    if total is not None:
+        logger.debug(f"Usage ledger for {account_id} ({month}) is now {float(total):.4f}")
+
+
+async def _load_rollup(client, account_id: str, month: str) -> Optional[float]:
+    result = await client.table('usage_ledger_monthly') \
+        .select('total_cost') \
+        .eq('account_id', account_id) \
+        .eq('month', f"{month}-01") \
+        .limit(1) \
+        .execute()
+    if not result.data:
+        return None
+    return float(result.data[0]['total_cost'])
+
+
+async def get_monthly_usage(client, account_id: str) -> float:
+    """Current month's spend for the account, seeding the Redis counter if needed."""
+    month = current_month()
+    key = _ledger_key(account_id, month)
+    value = await redis.get(key)
+    if value is not None:
+        return float(value)
+
+    total = await _load_rollup(client, account_id, month)
+    if total is None:
+        return await reconcile_account(client, account_id)
+
+    # NX: an increment or reconciliation that landed meanwhile wins
+    if not await redis.set(key, repr(total), ex=LEDGER_KEY_TTL, nx=True):
+        value = await redis.get(key)
+        if value is not None:
+            return float(value)
+    return total
+
+
+async def reconcile_account(client, account_id: str) -> float:
+    """Recompute the account's current month from its messages and overwrite the ledger."""
+    from services.billing import compute_monthly_usage
+
+    month = current_month()
+    key = _ledger_key(account_id, month)
+    before = await redis.get(key)
+    total = await compute_monthly_usage(client, account_id)
+
+    redis_client = await redis.get_client()
+    stored = await redis_client.eval(_SET_IF_UNCHANGED, 1, key, before or '', repr(total), LEDGER_KEY_TTL)
+    if stored != repr(total):
+        # Increments landed meanwhile and may or may not be in total; keep the live
+        # counter and leave the account stale so the next reconciliation retries
+        logger.debug(f"Usage ledger for {account_id} ({month}) changed during reconciliation, skipped")
+        return float(stored) if stored is not None else total
+
+    now = datetime.now(timezone.utc).isoformat()
+    await client.table('usage_ledger_monthly').upsert({
+        'account_id': account_id,
+        'month': f"{month}-01",
+        'total_cost': total,
+        'updated_at': now,
+        'reconciled_at': now,
+    }, on_conflict='account_id,month').execute()
+    return total
+
+
+async def flush_rollups(client) -> int:
+    """Write counters touched since the last rollup to usage_ledger_monthly; returns rows written."""
+    redis_client = await redis.get_client()
+    members = await redis_client.spop(_DIRTY_SET, ROLLUP_BATCH_SIZE)
+    if not members:
+        return 0
+
+    entries = [member.split(":", 1) for member in members]
+    values = await redis_client.mget([_ledger_key(account_id, month) for account_id, month in entries])
+    now = datetime.now(timezone.utc).isoformat()
+    rows = [
+        {'account_id': account_id, 'month': f"{month}-01", 'total_cost': float(value), 'updated_at': now}
+        for (account_id, month), value in zip(entries, values)
+        if value is not None
+    ]
+    if rows:
+        try:
+            await client.table('usage_ledger_monthly').upsert(rows, on_conflict='account_id,month').execute()
+        except Exception:
+            # Keep them dirty so the next rollup retries
+            await redis_client.sadd(_DIRTY_SET, *members)
+            raise
+    return len(rows)
+
+
+async def reconcile_stale(client) -> int:
+    """Reconcile the current month's least recently reconciled accounts; returns accounts reconciled."""
+    cutoff = (datetime.now(timezone.utc) - RECONCILE_MAX_AGE).isoformat()
+    result = await client.table('usage_ledger_monthly') \
+        .select('account_id') \
+        .eq('month', f"{current_month()}-01") \
+        .or_(f"reconciled_at.is.null,reconciled_at.lt.{cutoff}") \
+        .order('reconciled_at', desc=False, nullsfirst=True) \
+        .limit(RECONCILE_BATCH_SIZE) \
+        .execute()
+
+    reconciled = 0
+    for row in result.data or []:
+        try:
+            await reconcile_account(client, row['account_id'])
+            reconciled += 1
+        except Exception as e:
+            logger.warning(f"Failed to reconcile usage ledger for {row['account_id']}: {e}")
+    return reconciled
+
+
+async def _run_background_jobs() -> None:
+    from services.supabase import DBConnection
+
+    instance = str(uuid.uuid4())[:8]
+    last_reconcile = 0.0
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(ROLLUP_INTERVAL_SECONDS)
+        try:
+            client = await DBConnection().client
+            flushed = await flush_rollups(client)
+            if flushed:
+                logger.debug(f"Rolled up {flushed} usage ledger counters")
+
+            if loop.time() - last_reconcile >= RECONCILE_INTERVAL_SECONDS:
+                last_reconcile = loop.time()
+                # One process per interval across all workers
+                if await redis.set(_RECONCILE_LOCK, instance, ex=RECONCILE_INTERVAL_SECONDS, nx=True):
+                    reconciled = await reconcile_stale(client)
+                    logger.info(f"Reconciled {reconciled} usage ledgers")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Usage ledger background job failed: {e}")
+
+
+def start_background_jobs() -> None:
+    """Start the periodic rollup and reconciliation loop on the running event loop."""
+    global _background_task
+    if _background_task is None or _background_task.done():
+        _background_task = asyncio.create_task(_run_background_jobs(), name="usage-ledger")
+
+
+async def stop_background_jobs() -> None:
+    """Stop the loop and flush pending counters."""
+    global _background_task
+    from services.supabase import DBConnection
+
+    if _background_task is not None:
+        _background_task.cancel()
+        _background_task = None
+    try:
+        await flush_rollups(await DBConnection().client)
+    except Exception as e:
+        logger.warning(f"Final usage ledger rollup failed: {e}")
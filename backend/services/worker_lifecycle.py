@@ -0,0 +1,199 @@
+"""
+Worker process lifecycle for the Dramatiq agent workers.
+
+Shared resources (Redis pool, Supabase client, provider SDK clients, static
+prompts) are initialized once when a worker boots, on the worker's asyncio event
+loop, instead of on every actor invocation. Actors then only pay for per-run
+objects.
+
+``WorkerLifecycle`` replaces ``dramatiq.middleware.AsyncIO`` on the broker: it
+starts the event loop thread exactly like AsyncIO does, then warms resources on
+it, and tears them down before the loop is stopped on shutdown.
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+import dramatiq
+from dramatiq.asyncio import get_event_loop_thread
+
+from utils.logger import logger
+
+# Rolling window of per-run setup times (ms) reported at shutdown
+_RUN_SETUP_WINDOW = 500
+
+# Target for worker boot, from importing the worker modules to the end of
+# warm-up. Slower boots are logged; utils/scripts/benchmark_startup.py checks the
+# import part of it.
+WORKER_BOOT_BUDGET_SECONDS = float(os.getenv("WORKER_BOOT_BUDGET_SECONDS", "8"))
+
+_loaded_at = time.monotonic()
+_warm = False
+_run_setup_ms: Deque[float] = deque(maxlen=_RUN_SETUP_WINDOW)
+
+
+def is_warm() -> bool:
+    """Whether shared resources were initialized at worker boot."""
+    return _warm
+
+
+async def warm_up() -> Dict[str, float]:
+    """Initialize shared worker resources; returns per-step timings in ms."""
+    global _warm
+    from services import redis
+    from services.supabase import DBConnection
+    from utils.retry import retry
+
+    timings: Dict[str, float] = {}
+
+    async def step(name, fn):
+        start = time.monotonic()
+        try:
+            result = fn()
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception as e:
+            logger.warning(f"Worker warm-up step '{name}' failed: {e}")
+        timings[name] = round((time.monotonic() - start) * 1000, 1)
+
+    await step("redis", lambda: retry(lambda: redis.initialize_async()))
+    await step("supabase", lambda: DBConnection().initialize())
+    await step("llm", _warm_llm)
+    await step("provider_clients", _warm_provider_clients)
+    await step("prompts", _warm_prompts)
+    await step("tool_schemas", _warm_tool_schemas)
+    await step("usage_ledger", _start_usage_ledger)
+    await step("feature_flags", _start_feature_flags)
+
+    _warm = True
+    logger.info(f"Worker resources warmed up (ms): {timings}")
+    return timings
+
+
+async def _warm_llm():
+    # Importing sets up provider API keys and litellm's model tables
+    from services import llm
+
+    await llm.init_http_transport()
+
+
+def _warm_provider_clients():
+    from utils.config import config
+
+    if config.TAVILY_API_KEY:
+        from agent.tools.web_search_tool import get_tavily_client
+        get_tavily_client(config.TAVILY_API_KEY)
+
+
+def _warm_prompts():
+    from agent.agent_builder_prompt import get_agent_builder_prompt
+    from agent.gemini_prompt import get_gemini_system_prompt
+    from agent.prompt import get_system_prompt
+    from agent.run import load_sample_response
+
+    get_system_prompt()
+    get_gemini_system_prompt()
+    get_agent_builder_prompt()
+    load_sample_response()
+
+
+def _warm_tool_schemas():
+    # Importing agent.run loads every built-in tool class
+    import agent.run  # noqa: F401
+    from agentpress.tool import Tool
+
+    pending = list(Tool.__subclasses__())
+    while pending:
+        tool_class = pending.pop()
+        pending.extend(tool_class.__subclasses__())
+        if tool_class.cache_schemas:
+            tool_class.get_class_schemas()
+
+
+async def _start_feature_flags():
+    from flags.flags import get_flag_manager
+
+    await get_flag_manager().start()
+
+
+def _start_usage_ledger():
+    from services import usage_ledger
+
+    usage_ledger.start_background_jobs()
+
+
+async def shut_down() -> None:
+    """Close shared worker resources."""
+    global _warm
+    from agent.tools.utils.mcp_session_pool import mcp_session_pool
+    from services import http_client, redis, usage_ledger
+    from services.supabase import DBConnection
+    from flags.flags import get_flag_manager
+    from utils.cache import Cache
+
+    logger.info(f"Worker run setup times: {run_setup_summary()}")
+    logger.info(f"Worker cache stats: {Cache.stats()}")
+    logger.info(f"Worker feature flag evaluations: {get_flag_manager().get_evaluation_counts()}")
+    closers = [
+        ("feature_flags", get_flag_manager().stop),
+        ("usage_ledger", usage_ledger.stop_background_jobs),
+        ("mcp_sessions", mcp_session_pool.close_all),
+        ("http_clients", http_client.close),
+        ("cache", Cache.close),
+        ("redis", redis.close),
+        ("supabase", DBConnection.disconnect),
+    ]
+    if "services.llm" in sys.modules:
+        llm = sys.modules["services.llm"]
+        logger.info(f"Worker LLM routing stats: {llm.get_routing_stats()}")
+        closers.insert(0, ("llm_http_transport", llm.close_http_transport))
+
+    for name, close in closers:
+        try:
+            await close()
+        except Exception as e:
+            logger.warning(f"Error closing {name} during worker shutdown: {e}")
+    _warm = False
+
+
+def record_run_setup(duration_ms: float) -> None:
+    _run_setup_ms.append(duration_ms)
+
+
+def run_setup_summary() -> Dict[str, Optional[float]]:
+    """Count, p50 and p95 of recent per-run setup times (ms)."""
+    samples = sorted(_run_setup_ms)
+    if not samples:
+        return {"count": 0, "p50": None, "p95": None}
+    p95 = statistics.quantiles(samples, n=20)[-1] if len(samples) > 1 else samples[0]
+    return {"count": len(samples), "p50": round(statistics.median(samples), 1), "p95": round(p95, 1)}
+
+
+class WorkerLifecycle(dramatiq.middleware.AsyncIO):
+    """AsyncIO middleware that also warms up and tears down shared worker resources."""
+
+    def after_worker_boot(self, broker, worker):
+        super().after_worker_boot(broker, worker)
+        try:
+            get_event_loop_thread().run_coroutine(warm_up())
+        except Exception as e:
+            # Actors fall back to lazy initialization
+            logger.error(f"Worker warm-up failed: {e}")
+
+        boot_seconds = time.monotonic() - _loaded_at
+        if boot_seconds > WORKER_BOOT_BUDGET_SECONDS:
+            logger.warning(f"Worker boot took {boot_seconds:.2f}s, over the {WORKER_BOOT_BUDGET_SECONDS:.1f}s budget")
+        else:
+            logger.info(f"Worker booted in {boot_seconds:.2f}s")
+
+    def before_worker_shutdown(self, broker, worker):
+        try:
+            get_event_loop_thread().run_coroutine(shut_down())
+        except Exception as e:
+            logger.warning(f"Worker shutdown cleanup failed: {e}")
+        super().before_worker_shutdown(broker, worker)
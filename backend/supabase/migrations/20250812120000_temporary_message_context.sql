@@ -0,0 +1,44 @@
+BEGIN;
+
+-- Latest browser_state / image_context lookups per thread
+CREATE INDEX IF NOT EXISTS idx_messages_thread_temporary_context
+    ON messages(thread_id, type, created_at DESC)
+    WHERE type IN ('browser_state', 'image_context');
+
+-- Returns the latest browser_state and image_context messages of a thread in one
+-- round trip. The inline screenshot is dropped from browser_state whenever an
+-- uploaded image_url is available, so it is never sent over the wire needlessly.
+CREATE OR REPLACE FUNCTION get_temporary_message_context(p_thread_id UUID)
+RETURNS TABLE (
+    message_id UUID,
+    type TEXT,
+    content JSONB,
+    created_at TIMESTAMPTZ
+) AS $$
+    (
+        SELECT m.message_id,
+               m.type,
+               CASE
+                   WHEN jsonb_typeof(m.content) = 'object' AND m.content ? 'image_url'
+                       THEN m.content - 'screenshot_base64'
+                   ELSE m.content
+               END,
+               m.created_at
+        FROM messages m
+        WHERE m.thread_id = p_thread_id AND m.type = 'browser_state'
+        ORDER BY m.created_at DESC
+        LIMIT 1
+    )
+    UNION ALL
+    (
+        SELECT m.message_id, m.type, m.content, m.created_at
+        FROM messages m
+        WHERE m.thread_id = p_thread_id AND m.type = 'image_context'
+        ORDER BY m.created_at DESC
+        LIMIT 1
+    );
+$$ LANGUAGE sql STABLE;
+
+GRANT EXECUTE ON FUNCTION get_temporary_message_context(UUID) TO authenticated, service_role;
+
+COMMIT;
@@ -0,0 +1,33 @@
+BEGIN;
+
+-- Monthly spend per account, rolled up from the Redis usage ledger and
+-- periodically reconciled against assistant_response_end messages
+CREATE TABLE IF NOT EXISTS usage_ledger_monthly (
+    account_id UUID NOT NULL REFERENCES basejump.accounts(id) ON DELETE CASCADE,
+    month DATE NOT NULL,
+    total_cost NUMERIC(14, 6) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    reconciled_at TIMESTAMPTZ,
+    PRIMARY KEY (account_id, month),
+    CONSTRAINT usage_ledger_monthly_first_of_month CHECK (EXTRACT(DAY FROM month) = 1)
+);
+
+-- Reconciliation picks the least recently reconciled accounts of a month
+CREATE INDEX IF NOT EXISTS idx_usage_ledger_monthly_reconcile
+    ON usage_ledger_monthly(month, reconciled_at NULLS FIRST);
+
+ALTER TABLE usage_ledger_monthly ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their own usage ledger" ON usage_ledger_monthly
+    FOR SELECT USING (
+        account_id IN (
+            SELECT wu.account_id
+            FROM basejump.account_user wu
+            WHERE wu.user_id = auth.uid()
+        )
+    );
+
+GRANT SELECT ON usage_ledger_monthly TO authenticated;
+GRANT SELECT, INSERT, UPDATE, DELETE ON usage_ledger_monthly TO service_role;
+
+COMMIT;
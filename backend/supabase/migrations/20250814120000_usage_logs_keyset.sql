@@ -0,0 +1,83 @@
+BEGIN;
+
+-- Usage messages per thread in keyset order
+CREATE INDEX IF NOT EXISTS idx_messages_usage_keyset
+    ON messages(thread_id, created_at DESC, message_id DESC)
+    WHERE type = 'assistant_response_end';
+
+-- One page of an account's usage messages, newest first. Pages continue after the
+-- (created_at, message_id) of the previous page's last row, so deep pages cost the
+-- same as the first one. p_offset only serves clients that still page by number.
+CREATE OR REPLACE FUNCTION get_usage_logs_page(
+    p_account_id UUID,
+    p_since TIMESTAMPTZ,
+    p_limit INTEGER,
+    p_before_created_at TIMESTAMPTZ DEFAULT NULL,
+    p_before_message_id UUID DEFAULT NULL,
+    p_offset INTEGER DEFAULT 0
+)
+RETURNS TABLE (
+    message_id UUID,
+    thread_id UUID,
+    project_id UUID,
+    created_at TIMESTAMPTZ,
+    model TEXT,
+    prompt_tokens BIGINT,
+    completion_tokens BIGINT
+) AS $$
+    SELECT m.message_id,
+           m.thread_id,
+           t.project_id,
+           m.created_at,
+           COALESCE(m.content->>'model', 'unknown'),
+           COALESCE((m.content->'usage'->>'prompt_tokens')::NUMERIC, 0)::BIGINT,
+           COALESCE((m.content->'usage'->>'completion_tokens')::NUMERIC, 0)::BIGINT
+    FROM messages m
+    JOIN threads t ON t.thread_id = m.thread_id
+    WHERE t.account_id = p_account_id
+      AND m.type = 'assistant_response_end'
+      AND m.created_at >= p_since
+      AND (
+          p_before_created_at IS NULL
+          OR (m.created_at, m.message_id) < (p_before_created_at, p_before_message_id)
+      )
+    ORDER BY m.created_at DESC, m.message_id DESC
+    LIMIT p_limit
+    OFFSET p_offset;
+$$ LANGUAGE sql STABLE;
+
+-- An account's token usage grouped per UTC day, model and project. Costs are
+-- linear in tokens per model, so the caller prices each group once.
+CREATE OR REPLACE FUNCTION get_usage_summary(
+    p_account_id UUID,
+    p_since TIMESTAMPTZ,
+    p_until TIMESTAMPTZ DEFAULT NULL
+)
+RETURNS TABLE (
+    usage_date DATE,
+    model TEXT,
+    project_id UUID,
+    prompt_tokens BIGINT,
+    completion_tokens BIGINT,
+    request_count BIGINT
+) AS $$
+    SELECT (m.created_at AT TIME ZONE 'UTC')::DATE,
+           COALESCE(m.content->>'model', 'unknown'),
+           t.project_id,
+           SUM(COALESCE((m.content->'usage'->>'prompt_tokens')::NUMERIC, 0))::BIGINT,
+           SUM(COALESCE((m.content->'usage'->>'completion_tokens')::NUMERIC, 0))::BIGINT,
+           COUNT(*)
+    FROM messages m
+    JOIN threads t ON t.thread_id = m.thread_id
+    WHERE t.account_id = p_account_id
+      AND m.type = 'assistant_response_end'
+      AND m.created_at >= p_since
+      AND (p_until IS NULL OR m.created_at < p_until)
+    GROUP BY 1, 2, 3
+    ORDER BY 1 DESC, 2, 3;
+$$ LANGUAGE sql STABLE;
+
+GRANT EXECUTE ON FUNCTION get_usage_logs_page(UUID, TIMESTAMPTZ, INTEGER, TIMESTAMPTZ, UUID, INTEGER) TO authenticated, service_role;
+GRANT EXECUTE ON FUNCTION get_usage_summary(UUID, TIMESTAMPTZ, TIMESTAMPTZ) TO authenticated, service_role;
+
+COMMIT;
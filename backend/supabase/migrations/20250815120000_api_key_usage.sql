@@ -0,0 +1,24 @@
+BEGIN;
+
+-- Requests authenticated with each key, accumulated by the backend's usage recorder
+ALTER TABLE api_keys ADD COLUMN IF NOT EXISTS request_count BIGINT NOT NULL DEFAULT 0;
+
+-- Applies one flush of buffered key usage: p_usage is a JSON array of
+-- {"key_id", "last_used_at", "request_count"}. Counts are added, so several
+-- processes can flush the same key; last_used_at only moves forward.
+CREATE OR REPLACE FUNCTION record_api_key_usage(p_usage JSONB)
+RETURNS INTEGER AS $$
+    WITH updated AS (
+        UPDATE api_keys k
+        SET last_used_at = GREATEST(k.last_used_at, u.last_used_at),
+            request_count = k.request_count + u.request_count
+        FROM jsonb_to_recordset(p_usage) AS u(key_id UUID, last_used_at TIMESTAMPTZ, request_count BIGINT)
+        WHERE k.key_id = u.key_id
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM updated;
+$$ LANGUAGE sql;
+
+GRANT EXECUTE ON FUNCTION record_api_key_usage(JSONB) TO service_role;
+
+COMMIT;
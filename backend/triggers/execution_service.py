@@ -4,7 +4,7 @@ from datetime import datetime, timezone
 from typing import Dict, Any, Tuple
 
 from services.supabase import DBConnection
-from services import redis
+from services import active_runs
 from utils.logger import logger, structlog
 from utils.config import config
 from run_agent_background import run_agent_background
@@ -342,8 +342,7 @@ class AgentExecutor:
     
     async def _register_agent_run(self, agent_run_id: str) -> None:
         try:
-            instance_key = f"active_run:trigger_executor:{agent_run_id}"
-            await redis.set(instance_key, "running", ex=redis.REDIS_KEY_TTL)
+            await active_runs.register("trigger_executor", agent_run_id)
         except Exception as e:
             logger.warning(f"Failed to register agent run in Redis: {e}")
 
@@ -612,8 +611,7 @@ class WorkflowExecutor:
     async def _register_workflow_run(self, agent_run_id: str) -> None:
         try:
             instance_id = getattr(config, 'INSTANCE_ID', 'default')
-            instance_key = f"active_run:{instance_id}:{agent_run_id}"
-            await redis.set(instance_key, "running", ex=redis.REDIS_KEY_TTL)
+            await active_runs.register(instance_id, agent_run_id)
         except Exception as e:
             logger.warning(f"Failed to register workflow run in Redis: {e}")
 
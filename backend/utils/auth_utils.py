@@ -1,13 +1,19 @@
 import sentry
 from fastapi import HTTPException, Request, Header
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
 import jwt
 from jwt.exceptions import PyJWTError
+from utils.cache import Cache
 from utils.logger import structlog
 from utils.config import config
 import os
 from services.supabase import DBConnection
 from services import redis
+from utils import request_cache
 
 # Import no-auth bypass functions
 from utils.no_auth import (
@@ -63,6 +69,176 @@ async def _get_user_id_from_account_cached(account_id: str) -> Optional[str]:
         structlog.get_logger().error(f"Database lookup failed for account {account_id}: {e}")
         return None
 
+# Decoded claims per token, reused until the token expires
+_CLAIMS_CACHE_SIZE = 10_000
+_claims_cache: "OrderedDict[bytes, Tuple[Dict[str, Any], bool]]" = OrderedDict()
+_jwks_client: Optional[jwt.PyJWKClient] = None
+_warned_unverified = False
+
+# Access lookups cached per thread, project and membership. Visibility and
+# membership are changed outside the backend (directly in Supabase), so these
+# TTLs (plus up to cache.LOCAL_TTL_SECONDS in-process) bound how long a change
+# takes to apply; a thread's account and project never change.
+THREAD_ACCOUNT_TTL = 60 * 60
+PROJECT_VISIBILITY_TTL = 60
+ACCOUNT_MEMBERSHIP_TTL = 60
+
+
+def _get_jwks_client() -> jwt.PyJWKClient:
+    global _jwks_client
+    if _jwks_client is None:
+        # Signing keys are fetched once and kept for 10 minutes
+        _jwks_client = jwt.PyJWKClient(
+            f"{config.SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json",
+            cache_jwk_set=True,
+            lifespan=600,
+        )
+    return _jwks_client
+
+
+async def _verify_jwt(token: str) -> Tuple[Dict[str, Any], bool]:
+    """Claims of the token, and whether its signature was actually checked."""
+    global _warned_unverified
+    algorithm = jwt.get_unverified_header(token).get('alg', '')
+    options = {"verify_aud": False}
+
+    if algorithm.startswith('HS'):
+        if not config.SUPABASE_JWT_SECRET:
+            if not _warned_unverified:
+                structlog.get_logger().warning("SUPABASE_JWT_SECRET is not set; HS256 tokens are decoded without signature verification")
+                _warned_unverified = True
+            return jwt.decode(token, options={"verify_signature": False}), False
+        return jwt.decode(token, config.SUPABASE_JWT_SECRET, algorithms=[algorithm], options=options), True
+
+    # PyJWKClient fetches over blocking urllib when its key set is missing or expired
+    signing_key = await asyncio.to_thread(_get_jwks_client().get_signing_key_from_jwt, token)
+    return jwt.decode(token, signing_key.key, algorithms=[algorithm], options=options), True
+
+
+async def decode_jwt(token: str) -> Dict[str, Any]:
+    """
+    Verify a Supabase JWT and return its claims.
+
+    Claims are memoized per token until the token's expiry, so a client sending
+    the same token on every request pays for verification once.
+
+    Raises:
+        PyJWTError: If the token is malformed, expired or has a bad signature
+    """
+    claims, _ = await _decode_jwt(token)
+    return claims
+
+
+async def _decode_jwt(token: str) -> Tuple[Dict[str, Any], bool]:
+    """Memoized ``_verify_jwt``: claims and whether the signature was checked."""
+    cache_key = hashlib.sha256(token.encode()).digest()
+    entry = _claims_cache.get(cache_key)
+    if entry is not None:
+        if entry[0].get('exp', 0) > time.time():
+            _claims_cache.move_to_end(cache_key)
+            return entry
+        del _claims_cache[cache_key]
+
+    entry = await _verify_jwt(token)
+    # Tokens without an expiry are verified every time
+    if entry[0].get('exp'):
+        _claims_cache[cache_key] = entry
+        if len(_claims_cache) > _CLAIMS_CACHE_SIZE:
+            _claims_cache.popitem(last=False)
+    return entry
+
+
+class _ThreadNotFound(Exception):
+    pass
+
+
+async def _get_thread_access_info(client, thread_id: str) -> Optional[Dict[str, Any]]:
+    """account_id and project_id of a thread, or None if it does not exist."""
+    async def load():
+        result = await client.table('threads').select('account_id, project_id').eq('thread_id', thread_id).limit(1).execute()
+        if not result.data:
+            # Not cached: the thread may be about to be created
+            raise _ThreadNotFound()
+        return result.data[0]
+
+    try:
+        return await Cache.get_or_load(f"thread_access:{thread_id}", load, ttl=THREAD_ACCOUNT_TTL)
+    except _ThreadNotFound:
+        return None
+
+
+async def is_project_public(client, project_id: str) -> bool:
+    async def load():
+        result = await client.table('projects').select('is_public').eq('project_id', project_id).limit(1).execute()
+        return bool(result.data and result.data[0].get('is_public'))
+
+    return await Cache.get_or_load(f"project_public:{project_id}", load, ttl=PROJECT_VISIBILITY_TTL)
+
+
+async def is_account_member(client, account_id: str, user_id: str) -> bool:
+    async def load():
+        result = await client.schema('basejump').from_('account_user').select('account_role').eq('user_id', user_id).eq('account_id', account_id).limit(1).execute()
+        return bool(result.data)
+
+    return await Cache.get_or_load(f"account_member:{account_id}:{user_id}", load, ttl=ACCOUNT_MEMBERSHIP_TTL)
+
+
+async def _validate_api_key(public_key: str, secret_key: str):
+    """Validate an API key pair once per request, shared by rate limiting and authentication."""
+    from services.api_keys import APIKeyService
+
+    async def load():
+        db = DBConnection()
+        await db.initialize()
+        return await APIKeyService(db).validate_api_key(public_key, secret_key)
+
+    secret_digest = hashlib.sha256(secret_key.encode()).hexdigest()[:16]
+    return await request_cache.memoize(f"api_key_validation:{public_key}:{secret_digest}", load)
+
+
+async def get_rate_limit_identity(request: Request) -> Dict[str, str]:
+    """
+    API key and account a request counts against for rate limiting.
+
+    Only verified credentials are returned: API keys that validate and JWTs
+    whose signature was checked. Invalid ones are left for the endpoint to
+    reject; JWTs decoded without SUPABASE_JWT_SECRET fall back to the IP scope. Accepts the same credentials as get_user_id_from_stream_auth.
+
+    Returns:
+        dict: 'api_key' (key id) and/or 'account' (account id), when known
+    """
+    if getattr(config, 'NO_AUTH_MODE', False):
+        return {}
+
+    x_api_key = request.headers.get('x-api-key')
+    if x_api_key:
+        if ':' not in x_api_key:
+            return {}
+        try:
+            result = await _validate_api_key(*x_api_key.split(':', 1))
+        except Exception:
+            return {}
+        if not result.is_valid:
+            return {}
+        return {'api_key': str(result.key_id), 'account': str(result.account_id)}
+
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        token = auth_header.split(' ')[1]
+    else:
+        token = request.query_params.get('token')
+    if not token:
+        return {}
+    try:
+        claims, verified = await _decode_jwt(token)
+    except Exception:
+        return {}
+    # Without a checked signature anyone could claim a victim's sub and drain
+    # their bucket; such requests are only limited per IP
+    user_id = claims.get('sub') if verified else None
+    # A user's personal account has the user's id
+    return {'account': user_id} if user_id else {}
+
 # This function extracts the user ID from Supabase JWT
 async def get_current_user_id_from_jwt(request: Request) -> str:
     """
@@ -103,12 +279,7 @@ async def get_current_user_id_from_jwt(request: Request) -> str:
             
             public_key, secret_key = x_api_key.split(':', 1)
             
-            from services.api_keys import APIKeyService
-            db = DBConnection()
-            await db.initialize()
-            api_key_service = APIKeyService(db)
-            
-            validation_result = await api_key_service.validate_api_key(public_key, secret_key)
+            validation_result = await _validate_api_key(public_key, secret_key)
             
             if validation_result.is_valid:
                 # Get user_id from account_id with caching
@@ -158,7 +329,7 @@ async def get_current_user_id_from_jwt(request: Request) -> str:
     token = auth_header.split(' ')[1]
     
     try:
-        payload = jwt.decode(token, options={"verify_signature": False})
+        payload = await decode_jwt(token)
         user_id = payload.get('sub')
         
         if not user_id:
@@ -211,15 +382,15 @@ async def get_account_id_from_thread(client, thread_id: str) -> str:
         HTTPException: If the thread is not found or if there's an error
     """
     try:
-        response = await client.table('threads').select('account_id').eq('thread_id', thread_id).execute()
+        thread_data = await _get_thread_access_info(client, thread_id)
         
-        if not response.data or len(response.data) == 0:
+        if not thread_data:
             raise HTTPException(
                 status_code=404,
                 detail="Thread not found"
             )
         
-        account_id = response.data[0].get('account_id')
+        account_id = thread_data.get('account_id')
         
         if not account_id:
             raise HTTPException(
@@ -281,8 +452,7 @@ async def get_user_id_from_stream_auth(
         # Try to get user_id from token in query param (for EventSource which can't set headers)
         if token:
             try:
-                # For Supabase JWT, we just need to decode and extract the user ID
-                payload = jwt.decode(token, options={"verify_signature": False})
+                payload = await decode_jwt(token)
                 user_id = payload.get('sub')
                 if user_id:
                     sentry.sentry.set_user({ "id": user_id })
@@ -336,13 +506,10 @@ async def verify_thread_access(client, thread_id: str, user_id: str):
         return await no_auth_verify_thread_access(client, thread_id, user_id)
 
     try:
-        # Query the thread to get account information
-        thread_result = await client.table('threads').select('*').eq('thread_id', thread_id).execute()
+        thread_data = await _get_thread_access_info(client, thread_id)
 
-        if not thread_result.data or len(thread_result.data) == 0:
+        if not thread_data:
             raise HTTPException(status_code=404, detail="Thread not found")
-        
-        thread_data = thread_result.data[0]
 
         if thread_data['account_id'] == user_id:
             return True
@@ -357,11 +524,8 @@ async def verify_thread_access(client, thread_id: str, user_id: str):
 
         # Check if project is public
         project_id = thread_data.get('project_id')
-        if project_id:
-            project_result = await client.table('projects').select('is_public').eq('project_id', project_id).execute()
-            if project_result.data and len(project_result.data) > 0:
-                if project_result.data[0].get('is_public'):
-                    return True
+        if project_id and await is_project_public(client, project_id):
+            return True
             
         account_id = thread_data.get('account_id')
 
@@ -370,10 +534,8 @@ async def verify_thread_access(client, thread_id: str, user_id: str):
             raise HTTPException(status_code=403, detail="Anonymous users cannot access private threads")
 
         # When using service role, we need to manually check account membership instead of using current_user_account_role
-        if account_id and user_id != "anonymous":
-            account_user_result = await client.schema('basejump').from_('account_user').select('account_role').eq('user_id', user_id).eq('account_id', account_id).execute()
-            if account_user_result.data and len(account_user_result.data) > 0:
-                return True
+        if account_id and user_id != "anonymous" and await is_account_member(client, account_id, user_id):
+            return True
         raise HTTPException(status_code=403, detail="Not authorized to access this thread")
     except HTTPException:
         # Re-raise HTTP exceptions as they are
@@ -413,8 +575,7 @@ async def get_optional_user_id(request: Request) -> Optional[str]:
     token = auth_header.split(' ')[1]
     
     try:
-        # For Supabase JWT, we just need to decode and extract the user ID
-        payload = jwt.decode(token, options={"verify_signature": False})
+        payload = await decode_jwt(token)
         
         # Supabase stores the user ID in the 'sub' claim
         user_id = payload.get('sub')
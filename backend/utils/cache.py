@@ -1,26 +1,208 @@
+"""
+Two-tier JSON cache: a bounded in-process TTL LRU in front of Redis.
+
+- Values live in Redis under ``cache:<key>`` as JSON. Hot keys are also kept
+  in-process for at most ``LOCAL_TTL_SECONDS``, so repeated reads in a worker
+  skip the Redis round trip.
+- ``set`` and ``invalidate`` publish the key on ``INVALIDATION_CHANNEL``; every
+  process drops its local copy when it sees the message.
+- A cached ``None``, ``0`` or ``[]`` is a hit. ``get(key)`` still returns
+  ``None`` on a miss for existing callers; pass ``MISS`` as the default to tell
+  the two apart.
+- ``get_or_load`` runs the loader once per process for concurrent misses and,
+  with ``stale_ttl``, serves an expired value while refreshing it in the
+  background.
+"""
+
+import asyncio
 import json
-from typing import Any
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from services import redis
 from services.redis import get_client
+from utils import request_cache
+from utils.logger import logger
+
+LOCAL_MAX_ENTRIES = 5_000
+LOCAL_TTL_SECONDS = 5  # Bounds staleness when an invalidation message is missed
+LOCAL_MAX_VALUE_BYTES = 64 * 1024  # Larger values (e.g. scraped pages) stay in Redis only
+INVALIDATION_CHANNEL = "cache:invalidate"
+LISTENER_RETRY_SECONDS = 5
+
+# Default for get() that distinguishes a miss from a cached None
+MISS = object()
 
 
 class _cache:
-    async def get(self, key: str):
-        redis = await get_client()
-        key = f"cache:{key}"
-        result = await redis.get(key)
-        if result:
-            return json.loads(result)
-        return None
-
-    async def set(self, key: str, value: Any, ttl: int = 15 * 60):
-        redis = await get_client()
-        key = f"cache:{key}"
-        await redis.set(key, json.dumps(value), ex=ttl)
+    def __init__(self):
+        self._local: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._instance_id = uuid.uuid4().hex[:12]
+        self._listener: Optional[asyncio.Task] = None
+        self._listener_retry_at = 0.0
+        self._refreshes: set = set()
+        self._stats: Dict[str, int] = defaultdict(int)
+
+    async def get(self, key: str, default: Any = None):
+        value, _ = await self._lookup(key)
+        return default if value is MISS else value
+
+    async def set(self, key: str, value: Any, ttl: int = 15 * 60, stale_ttl: int = 0):
+        """Cache ``value`` for ``ttl`` seconds; ``get_or_load`` may serve it ``stale_ttl`` seconds longer."""
+        raw = json.dumps(value)
+        redis_client = await get_client()
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.set(f"cache:{key}", raw, ex=ttl + stale_ttl)
+        pipe.publish(INVALIDATION_CHANNEL, f"{self._instance_id}:{key}")
+        await pipe.execute()
+        self._store_local(key, raw, ttl)
 
     async def invalidate(self, key: str):
-        redis = await get_client()
-        key = f"cache:{key}"
-        await redis.delete(key)
+        self._local.pop(key, None)
+        redis_client = await get_client()
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.delete(f"cache:{key}")
+        pipe.publish(INVALIDATION_CHANNEL, f"{self._instance_id}:{key}")
+        await pipe.execute()
+        self._stats["invalidations"] += 1
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int = 15 * 60, stale_ttl: int = 0):
+        """Return the cached value for ``key``, loading and caching it on a miss.
+
+        Concurrent misses in this process share one ``loader`` call. Within
+        ``stale_ttl`` seconds after expiry the old value is returned and a single
+        background refresh is started.
+        """
+        try:
+            value, fresh = await self._lookup(key, stale_ttl)
+        except Exception as e:
+            logger.warning(f"Cache read failed for {key}: {e}")
+            value, fresh = MISS, False
+
+        if value is MISS:
+            return await request_cache.single_flight(f"cache:{key}", lambda: self._load(key, loader, ttl, stale_ttl))
+        if not fresh:
+            self._refresh(key, loader, ttl, stale_ttl)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters since process start."""
+        stats = dict(self._stats)
+        hits = stats.get("local_hits", 0) + stats.get("redis_hits", 0) + stats.get("stale_hits", 0)
+        lookups = hits + stats.get("misses", 0)
+        stats["hit_ratio"] = round(hits / lookups, 3) if lookups else None
+        stats["local_entries"] = len(self._local)
+        return stats
+
+    async def close(self):
+        """Stop the invalidation listener and drop local entries."""
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        for task in list(self._refreshes):
+            task.cancel()
+        self._local.clear()
+
+    async def _lookup(self, key: str, stale_ttl: int = 0) -> Tuple[Any, bool]:
+        """(value, fresh); value is MISS when nothing is cached."""
+        self._ensure_listener()
+        now = time.monotonic()
+        entry = self._local.get(key)
+        if entry is not None:
+            raw, expires_at = entry
+            if now < expires_at:
+                self._local.move_to_end(key)
+                self._stats["local_hits"] += 1
+                return json.loads(raw), True
+            del self._local[key]
+
+        redis_client = await get_client()
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.get(f"cache:{key}")
+        pipe.pttl(f"cache:{key}")
+        raw, pttl = await pipe.execute()
+        if raw is None:
+            self._stats["misses"] += 1
+            return MISS, False
+
+        # pttl is -1 for keys without expiry
+        fresh_seconds = None if pttl < 0 else pttl / 1000 - stale_ttl
+        if fresh_seconds is not None and fresh_seconds <= 0:
+            self._stats["stale_hits"] += 1
+            return json.loads(raw), False
+
+        self._stats["redis_hits"] += 1
+        self._store_local(key, raw, fresh_seconds)
+        return json.loads(raw), True
+
+    def _store_local(self, key: str, raw: str, fresh_seconds: Optional[float]):
+        if len(raw) > LOCAL_MAX_VALUE_BYTES:
+            return
+        local_ttl = LOCAL_TTL_SECONDS if fresh_seconds is None else min(LOCAL_TTL_SECONDS, fresh_seconds)
+        self._local[key] = (raw, time.monotonic() + local_ttl)
+        self._local.move_to_end(key)
+        if len(self._local) > LOCAL_MAX_ENTRIES:
+            self._local.popitem(last=False)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int, stale_ttl: int):
+        self._stats["loads"] += 1
+        try:
+            value = await loader()
+        except Exception:
+            self._stats["load_errors"] += 1
+            raise
+        try:
+            await self.set(key, value, ttl=ttl, stale_ttl=stale_ttl)
+        except Exception as e:
+            logger.warning(f"Cache write failed for {key}: {e}")
+        return value
+
+    def _refresh(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int, stale_ttl: int):
+        async def refresh():
+            try:
+                await request_cache.single_flight(f"cache:{key}", lambda: self._load(key, loader, ttl, stale_ttl))
+            except Exception as e:
+                logger.warning(f"Background cache refresh failed for {key}: {e}")
+
+        task = asyncio.create_task(refresh())
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+
+    def _ensure_listener(self):
+        loop = asyncio.get_running_loop()
+        if self._listener is not None and not self._listener.done() and self._listener.get_loop() is loop:
+            return
+        now = time.monotonic()
+        if now < self._listener_retry_at:
+            return
+        self._listener_retry_at = now + LISTENER_RETRY_SECONDS
+        self._listener = loop.create_task(self._listen(), name="cache-invalidation")
+
+    async def _listen(self):
+        pubsub = None
+        try:
+            pubsub = await redis.create_pubsub()
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                origin, _, key = message["data"].partition(":")
+                if origin != self._instance_id and self._local.pop(key, None) is not None:
+                    self._stats["remote_invalidations"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Cache invalidation listener stopped: {e}")
+        finally:
+            # Invalidations may be missed until the listener is back
+            self._local.clear()
+            if pubsub is not None:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
 
 
 Cache = _cache()
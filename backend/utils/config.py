@@ -213,6 +213,8 @@ class Configuration:
     OPENROUTER_API_BASE: Optional[str] = "https://openrouter.ai/api/v1"
     OR_SITE_URL: Optional[str] = "https://kortix.ai"
     OR_APP_NAME: Optional[str] = "EMMA AI"
+    # Fire a hedged request to the OpenRouter fallback when the first token is late
+    LLM_HEDGING_ENABLED: bool = True
     
     # AWS Bedrock credentials
     AWS_ACCESS_KEY_ID: Optional[str] = None
@@ -226,6 +228,8 @@ class Configuration:
     SUPABASE_URL: str
     SUPABASE_ANON_KEY: str
     SUPABASE_SERVICE_ROLE_KEY: str
+    # Legacy HS256 secret; tokens signed with asymmetric keys are verified against the project's JWKS
+    SUPABASE_JWT_SECRET: Optional[str] = None
     
     # Redis configuration
     REDIS_HOST: str
@@ -270,7 +274,6 @@ class Configuration:
 
     # API Keys system configuration
     API_KEY_SECRET: str = "default-secret-key-change-in-production"
-    API_KEY_LAST_USED_THROTTLE_SECONDS: int = 900
     
     # Agent execution limits (can be overridden via environment variable)
     _MAX_PARALLEL_AGENT_RUNS_ENV: Optional[str] = None
@@ -0,0 +1,72 @@
+"""
+Request-scoped memoization and single-flight loading.
+
+``request_scope()`` opens a per-request memo held in a context variable; inside
+it, ``memoize(key, loader)`` resolves each key at most once, and concurrent
+callers (e.g. checks started with ``asyncio.gather``) share the same in-flight
+load. Outside a scope ``memoize`` simply calls the loader.
+
+``single_flight(key, loader)`` is process-wide: while a load for ``key`` is in
+progress, other callers await that load instead of starting their own, so a
+burst of cache misses turns into one upstream call.
+"""
+
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+_memo: ContextVar[Optional[Dict[str, asyncio.Future]]] = ContextVar("request_cache_memo", default=None)
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+def _drop(futures: Dict[str, asyncio.Future], key: str, future: asyncio.Future) -> None:
+    if futures.get(key) is future:
+        del futures[key]
+
+
+def _drop_failed(futures: Dict[str, asyncio.Future], key: str, future: asyncio.Future) -> None:
+    # Failed loads are retried by the next caller, not memoized
+    if future.cancelled() or future.exception() is not None:
+        _drop(futures, key, future)
+
+
+@contextmanager
+def request_scope():
+    """Memoize ``memoize`` calls made within the block (and tasks it starts)."""
+    token = _memo.set({})
+    try:
+        yield
+    finally:
+        _memo.reset(token)
+
+
+async def memoize(key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+    """Return the value for ``key`` resolved once per request scope."""
+    memo = _memo.get()
+    if memo is None:
+        return await loader()
+
+    future = memo.get(key)
+    if future is None:
+        future = asyncio.ensure_future(loader())
+        memo[key] = future
+        future.add_done_callback(lambda f: _drop_failed(memo, key, f))
+    return await asyncio.shield(future)
+
+
+def forget(key: str) -> None:
+    """Drop ``key`` from the current request scope, e.g. after changing the underlying data."""
+    memo = _memo.get()
+    if memo is not None:
+        memo.pop(key, None)
+
+
+async def single_flight(key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+    """Run ``loader`` unless a load for ``key`` is already in progress, and share its result."""
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(loader())
+        _inflight[key] = future
+        future.add_done_callback(lambda f: _drop(_inflight, key, f))
+    return await asyncio.shield(future)
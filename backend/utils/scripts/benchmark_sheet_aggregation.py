@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the analyze_sheet aggregation engine.
+
+Compares the columnar engine in agent/tools/utils/sheet_aggregation.py against
+the previous row-oriented implementation (one re-scan per statistic, row copies
+per group) on a synthetic CSV-like sheet of string cells. Before timing, both
+are checked to agree, including on NaN/inf cells, which are skipped.
+
+Usage:
+    python utils/scripts/benchmark_sheet_aggregation.py               # 1M rows
+    python utils/scripts/benchmark_sheet_aggregation.py --rows 200000
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+from pathlib import Path
+from statistics import mean
+
+# Add the backend directory to the path so we can import modules
+backend_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from agent.tools.utils.sheet_aggregation import DEFAULT_AGGREGATIONS, aggregate_column, aggregate_grouped
+
+
+def _to_float(v):
+    if v is None:
+        return None
+    try:
+        v = float(v) if isinstance(v, (int, float)) else float(str(v).strip())
+    except Exception:
+        return None
+    # Skipped like pandas skips NaN
+    return None if math.isnan(v) or math.isinf(v) else v
+
+
+def legacy_summary(rows, columns):
+    out = {}
+    for col, c_idx in columns.items():
+        stats = {}
+        for agg, fn in (("count", len), ("sum", sum), ("avg", mean), ("min", min), ("max", max)):
+            vals = [_to_float(r[c_idx]) for r in rows if len(r) > c_idx]
+            vals = [v for v in vals if v is not None]
+            stats[agg] = fn(vals) if vals or agg == "count" else None
+        out[col] = stats
+    return out
+
+
+def legacy_grouped(rows, g_idx, columns):
+    groups = {}
+    for row in rows:
+        key = row[g_idx] if len(row) > g_idx else None
+        groups.setdefault(key, []).append(row)
+    out = {}
+    for key, group_rows in groups.items():
+        out[key] = {}
+        for col, c_idx in columns.items():
+            vals = [_to_float(r[c_idx]) for r in group_rows if len(r) > c_idx]
+            vals = [v for v in vals if v is not None]
+            out[key][col] = (len(vals), sum(vals), mean(vals), min(vals), max(vals)) if vals else (0, None, None, None, None)
+    return out
+
+
+def make_rows(n):
+    rng = random.Random(42)
+    regions = ["NA", "EU", "APAC", "LATAM", "MEA"]
+    return [
+        [rng.choice(regions), f"{rng.uniform(0, 1000):.2f}", str(rng.randint(1, 50)), "" if i % 97 == 0 else f"{rng.random():.4f}"]
+        for i in range(n)
+    ]
+
+
+def check_equivalence():
+    rows = [
+        ["NA", "1.5", 2, "0.25"],
+        ["EU", "nan", float("nan"), "inf"],
+        ["NA", " 3 ", "-inf", float("inf")],
+        ["EU", "x", 4.0, ""],
+        ["NA", "2", float("nan")],
+    ]
+    columns = {"revenue": 1, "units": 2, "margin": 3}
+    aggs = ["count", "sum", "avg", "min", "max"]
+
+    expected = legacy_summary(rows, columns)
+    for col, c_idx in columns.items():
+        got = aggregate_column(rows, c_idx, aggs)
+        assert got == expected[col], f"{col}: {got} != {expected[col]}"
+
+    expected = legacy_grouped(rows, 0, columns)
+    grouped = aggregate_grouped(rows, 0, columns, aggs)
+    for g, key in enumerate(grouped.keys):
+        for col in columns:
+            got = tuple(grouped.columns[col][g][agg] for agg in aggs)
+            assert got == expected[key][col], f"{key}/{col}: {got} != {expected[key][col]}"
+
+    median = aggregate_column([["1"], ["nan"], ["3"], [float("nan")], ["2"]], 0, ["median", "p50"])
+    assert median == {"median": 2.0, "p50": 2.0}, median
+    print("Columnar engine matches the legacy implementation (NaN/inf skipped)")
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<40} {elapsed:8.3f}s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark analyze_sheet aggregations")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    check_equivalence()
+
+    print(f"Generating {args.rows:,} rows...")
+    rows = make_rows(args.rows)
+    columns = {"revenue": 1, "units": 2, "margin": 3}
+
+    print("Summary (no group_by):")
+    old = timed("legacy (5 re-scans per column)", lambda: legacy_summary(rows, columns))
+    new = timed("columnar engine", lambda: [aggregate_column(rows, c, DEFAULT_AGGREGATIONS) for c in columns.values()])
+    print(f"  speedup: {old / new:.1f}x")
+
+    print("Grouped by region:")
+    old = timed("legacy (row copies per group)", lambda: legacy_grouped(rows, 0, columns))
+    new = timed("columnar engine", lambda: aggregate_grouped(rows, 0, columns, DEFAULT_AGGREGATIONS))
+    print(f"  speedup: {old / new:.1f}x")
+
+    extended = DEFAULT_AGGREGATIONS + ["median", "std", "distinct_count", "p95"]
+    print("Extended aggregations (median, std, distinct_count, p95):")
+    timed("columnar engine", lambda: [aggregate_column(rows, c, extended) for c in columns.values()])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for the API and worker processes.
+
+Imports each process's entry module in a fresh interpreter with
+``python -X importtime`` and reports:
+  - wall time of the import (best of --runs)
+  - the top-level packages with the largest cumulative import time
+
+The worker target also imports agent.run, which the worker loads during
+warm-up. Its import time is checked against WORKER_BOOT_BUDGET_SECONDS from
+services.worker_lifecycle; the script exits non-zero when it is over budget, so
+it can gate CI or a rollout.
+
+Usage:
+    python utils/scripts/benchmark_startup.py
+    python utils/scripts/benchmark_startup.py --target worker --runs 5 --top 25
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# Add the backend directory to the path so we can import modules
+backend_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(backend_dir))
+
+TARGETS = {
+    "api": "import api",
+    "worker": "import run_agent_background; import agent.run",
+}
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|\s+(\S+)$")
+
+
+def profile_import(statement: str) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """Run the import in a fresh interpreter; returns wall seconds and (package, self_us, cumulative_us) rows."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=backend_dir,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        tail = result.stderr.strip().splitlines()[-5:]
+        raise RuntimeError(f"'{statement}' failed:\n" + "\n".join(tail))
+
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us)))
+    return elapsed, rows
+
+
+def top_packages(rows, limit: int) -> List[Tuple[str, float]]:
+    """Largest top-level packages by cumulative import time (ms)."""
+    # Each module is reported once, when its import finishes, including its submodules
+    totals: Dict[str, float] = {name: cumulative_us / 1000 for name, _, cumulative_us in rows if "." not in name}
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def timed(label: str, statement: str, runs: int, top: int) -> float:
+    best, best_rows = None, []
+    for _ in range(runs):
+        elapsed, rows = profile_import(statement)
+        if best is None or elapsed < best:
+            best, best_rows = elapsed, rows
+    print(f"  {label:<40} {best:8.3f}s  ({len(best_rows)} modules)")
+    for package, ms in top_packages(best_rows, top):
+        print(f"      {package:<36} {ms:9.1f} ms")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API and worker import time")
+    parser.add_argument("--target", choices=["all", *TARGETS], default="all", help="Process to profile (default: all)")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per target; the best run is reported (default: 3)")
+    parser.add_argument("--top", type=int, default=15, help="Number of packages to list per target (default: 15)")
+    args = parser.parse_args()
+
+    from services.worker_lifecycle import WORKER_BOOT_BUDGET_SECONDS
+
+    results = {}
+    for name, statement in TARGETS.items():
+        if args.target in ("all", name):
+            results[name] = timed(f"{name} ({statement})", statement, args.runs, args.top)
+
+    worker_seconds = results.get("worker")
+    if worker_seconds is not None:
+        status = "OK" if worker_seconds <= WORKER_BOOT_BUDGET_SECONDS else "OVER BUDGET"
+        print(f"\nWorker import {worker_seconds:.3f}s / budget {WORKER_BOOT_BUDGET_SECONDS:.1f}s: {status}")
+        if worker_seconds > WORKER_BOOT_BUDGET_SECONDS:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
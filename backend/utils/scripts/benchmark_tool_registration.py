@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for ToolManager.register_all_tools, the tool setup every agent
+run performs.
+
+Registers the built-in tools on a fresh ThreadManager repeatedly:
+  - uncached: schemas collected per instance by introspecting every tool
+    object (the behaviour before the class-level schema cache)
+  - cold: class-level cache cleared, so the first registration fills it
+  - cached: class-level schemas shared by all instances
+
+Tool constructors only store their arguments, so no sandbox or database is
+touched. Import time is reported separately since it is paid once per process.
+
+Usage:
+    python utils/scripts/benchmark_tool_registration.py
+    python utils/scripts/benchmark_tool_registration.py --iterations 500
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add the backend directory to the path so we can import modules
+backend_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import_start = time.perf_counter()
+from agent.run import ToolManager
+from agentpress.thread_manager import ThreadManager
+from agentpress.tool import Tool
+import_elapsed = time.perf_counter() - import_start
+
+PROJECT_ID = "00000000-0000-0000-0000-000000000000"
+THREAD_ID = "00000000-0000-0000-0000-000000000001"
+
+
+def tool_classes():
+    pending, found = list(Tool.__subclasses__()), []
+    while pending:
+        tool_class = pending.pop()
+        pending.extend(tool_class.__subclasses__())
+        found.append(tool_class)
+    return found
+
+
+def clear_class_schemas():
+    for tool_class in tool_classes():
+        tool_class._class_schemas = None
+
+
+def register(iterations: int) -> int:
+    registered = 0
+    for _ in range(iterations):
+        thread_manager = ThreadManager()
+        ToolManager(thread_manager, PROJECT_ID, THREAD_ID).register_all_tools()
+        registered = len(thread_manager.tool_registry.tools)
+    return registered
+
+
+def timed(label: str, fn, iterations: int):
+    start = time.perf_counter()
+    registered = fn(iterations)
+    elapsed = time.perf_counter() - start
+    per_run_ms = elapsed / iterations * 1000
+    print(f"  {label:<40} {elapsed:8.3f}s  ({per_run_ms:.3f} ms/run, {registered} functions)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark built-in tool registration")
+    parser.add_argument("--iterations", type=int, default=200, help="Registrations per mode (default: 200)")
+    args = parser.parse_args()
+
+    print(f"  {'import agent.run':<40} {import_elapsed:8.3f}s")
+
+    Tool.cache_schemas = False
+    try:
+        timed("uncached (per-instance introspection)", register, args.iterations)
+    finally:
+        Tool.cache_schemas = True
+
+    clear_class_schemas()
+    timed("cold (first registration fills cache)", register, 1)
+    timed("cached (class-level schemas)", register, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark for Firecrawl scraping as done by SandboxWebSearchTool.
+
+Scrapes the same set of URLs twice:
+  - legacy: a new httpx.AsyncClient per URL, all URLs fired at once
+  - pooled: the shared keep-alive client from services.http_client with the
+    tool's bounded concurrency
+
+Requires FIRECRAWL_API_KEY (and optionally FIRECRAWL_URL) in the environment.
+The Redis scrape cache is not involved, so both runs hit Firecrawl.
+
+Usage:
+    python utils/scripts/benchmark_web_scrape.py
+    python utils/scripts/benchmark_web_scrape.py --urls-file urls.txt
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Add the backend directory to the path so we can import modules
+backend_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services import http_client
+from utils.config import config
+from agent.tools.web_search_tool import FIRECRAWL_TIMEOUT, MAX_CONCURRENT_SCRAPES
+
+DEFAULT_URLS = [
+    "https://www.python.org/",
+    "https://docs.python.org/3/whatsnew/3.11.html",
+    "https://peps.python.org/pep-0008/",
+    "https://www.rust-lang.org/",
+    "https://go.dev/doc/",
+    "https://nodejs.org/en/about",
+    "https://fastapi.tiangolo.com/",
+    "https://www.postgresql.org/about/",
+    "https://redis.io/docs/latest/",
+    "https://kubernetes.io/docs/concepts/overview/",
+    "https://en.wikipedia.org/wiki/HTTP/2",
+    "https://en.wikipedia.org/wiki/Transport_Layer_Security",
+    "https://en.wikipedia.org/wiki/Connection_pool",
+    "https://en.wikipedia.org/wiki/Web_scraping",
+    "https://en.wikipedia.org/wiki/Markdown",
+    "https://github.com/encode/httpx",
+    "https://github.com/kortix-ai/suna",
+    "https://www.kortix.ai/",
+    "https://developer.mozilla.org/en-US/docs/Web/HTTP/Connection_management_in_HTTP_1.x",
+    "https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Keep-Alive",
+]
+
+
+def _request_args(url: str):
+    return {
+        "url": f"{config.FIRECRAWL_URL}/v1/scrape",
+        "json": {"url": url, "formats": ["markdown"]},
+        "headers": {"Authorization": f"Bearer {config.FIRECRAWL_API_KEY}", "Content-Type": "application/json"},
+    }
+
+
+async def legacy(urls):
+    async def one(url):
+        async with httpx.AsyncClient() as client:
+            response = await client.post(timeout=30, **_request_args(url))
+            return response.status_code
+
+    return await asyncio.gather(*(one(u) for u in urls), return_exceptions=True)
+
+
+async def pooled(urls):
+    client = http_client.get_client("firecrawl", timeout=FIRECRAWL_TIMEOUT)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SCRAPES)
+
+    async def one(url):
+        async with semaphore:
+            response = await client.post(**_request_args(url))
+            return response.status_code
+
+    return await asyncio.gather(*(one(u) for u in urls), return_exceptions=True)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark Firecrawl scraping strategies")
+    parser.add_argument("--urls-file", help="File with one URL per line (defaults to 20 built-in URLs)")
+    args = parser.parse_args()
+
+    if not config.FIRECRAWL_API_KEY:
+        print("FIRECRAWL_API_KEY is not set")
+        sys.exit(1)
+
+    urls = DEFAULT_URLS
+    if args.urls_file:
+        urls = [line.strip() for line in Path(args.urls_file).read_text().splitlines() if line.strip()]
+
+    print(f"Scraping {len(urls)} URLs via {config.FIRECRAWL_URL}")
+    for label, fn in (("legacy (client per URL)", legacy), ("pooled + semaphore", pooled)):
+        start = time.perf_counter()
+        statuses = await fn(urls)
+        elapsed = time.perf_counter() - start
+        ok = sum(1 for s in statuses if s == 200)
+        print(f"  {label:<28} {elapsed:7.2f}s  ({ok}/{len(urls)} OK)")
+
+    await http_client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())